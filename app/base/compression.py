@@ -0,0 +1,135 @@
+import gzip
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import Flask, Response, request
+
+from app.base import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli
+
+    HAS_BROTLI = True
+except ImportError:  # pragma: no cover
+    HAS_BROTLI = False
+
+try:
+    import zstandard
+
+    HAS_ZSTANDARD = True
+except ImportError:  # pragma: no cover
+    HAS_ZSTANDARD = False
+
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html", "text/plain"}
+
+
+def _gzip(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=config.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return bytes(brotli.compress(data, quality=config.COMPRESSION_BROTLI_LEVEL))
+
+
+def _zstd(data: bytes) -> bytes:
+    compressor = zstandard.ZstdCompressor(level=config.COMPRESSION_ZSTD_LEVEL)
+    return bytes(compressor.compress(data))
+
+
+def get_compressors() -> Dict[str, Callable[[bytes], bytes]]:
+    """Available encodings in the order of preference of the server."""
+    compressors: Dict[str, Callable[[bytes], bytes]] = {}
+    if HAS_ZSTANDARD:
+        compressors["zstd"] = _zstd
+    if HAS_BROTLI:
+        compressors["br"] = _brotli
+    compressors["gzip"] = _gzip
+    return compressors
+
+
+COMPRESSORS = get_compressors()
+
+
+class CompressedCache:
+    """
+    LRU of compressed bodies keyed by (ETag, encoding).
+    Same ETag means same body, so the compressed bytes can be reused.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._data: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Tuple[str, str], value: bytes) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+
+compressed_cache = CompressedCache(max_size=config.COMPRESSION_CACHE_SIZE)
+
+
+def get_encoding() -> Optional[str]:
+    return request.accept_encodings.best_match(list(COMPRESSORS))
+
+
+def compress(data: bytes, encoding: str, cache_key: Optional[str] = None) -> bytes:
+    if cache_key:
+        cached = compressed_cache.get((cache_key, encoding))
+        if cached is not None:
+            return cached
+    compressed = COMPRESSORS[encoding](data)
+    if cache_key:
+        compressed_cache.set((cache_key, encoding), compressed)
+    return compressed
+
+
+def compress_response(response: Response) -> Response:
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 304)
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if (response.content_length or 0) < config.COMPRESSION_MIN_SIZE:
+        return response
+    encoding = get_encoding()
+    if encoding is None:
+        return response
+
+    etag, is_weak = response.get_etag()
+    cache_key = f"{request.full_path}:{etag}" if etag else None
+    data = compress(response.get_data(), encoding, cache_key=cache_key)
+    response.set_data(data)
+    response.headers["Content-Encoding"] = encoding
+    if etag and not is_weak:
+        # The compressed bytes are not the same representation anymore.
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    if config.COMPRESSION_ENABLED:
+        app.after_request(compress_response)
@@ -1,5 +1,6 @@
 import logging
 import os
+import tempfile
 from pathlib import Path
 
 from .config_utils import comma_separated_str_to_list
@@ -14,6 +15,16 @@ REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", 7))
 
 MONGO_URL = str(os.environ.get("MONGO_URL"))
 
+# Seconds between two background pings of the database.
+HEALTH_CHECK_INTERVAL = float(os.environ.get("HEALTH_CHECK_INTERVAL", 5))
+# The instance is not ready if the last successful ping is older than this.
+HEALTH_MAX_PING_AGE = float(os.environ.get("HEALTH_MAX_PING_AGE", 30))
+# Seconds, bound the server selection and the round trip of a background ping.
+HEALTH_PING_TIMEOUT = float(os.environ.get("HEALTH_PING_TIMEOUT", 2))
+HEALTH_POOL_SATURATION_LIMIT = float(
+    os.environ.get("HEALTH_POOL_SATURATION_LIMIT", 1.0)
+)
+
 ALLOWED_HOSTS = comma_separated_str_to_list(os.environ.get("ALLOWED_HOSTS", "*"))
 SITE_URL = os.environ.get("SITE_URL")
 
@@ -23,7 +34,168 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 
 ALLOWED_IMAGES = {"png", "jpg", "jpeg", "gif"}
 
+# Read preference of the public read endpoints (posts, topics, comments...).
+# secondaryPreferred spreads them over the replica set members.
+PUBLIC_READ_PREFERENCE = os.environ.get("PUBLIC_READ_PREFERENCE", "secondaryPreferred")
+PUBLIC_READ_CONCERN = os.environ.get("PUBLIC_READ_CONCERN", "local")
+# Skip the secondaries that lag more than this (0 disables it, minimum 90).
+READ_MAX_STALENESS_SECONDS = int(os.environ.get("READ_MAX_STALENESS_SECONDS", 0))
+
+# Write concerns of the "durable" and "relaxed" write policies.
+WRITE_CONCERN_POLICIES_ENABLED = (
+    os.environ.get("WRITE_CONCERN_POLICIES_ENABLED", "True") == "True"
+)
+DURABLE_WRITE_CONCERN_W = os.environ.get("DURABLE_WRITE_CONCERN_W", "majority")
+RELAXED_WRITE_CONCERN_W = os.environ.get("RELAXED_WRITE_CONCERN_W", "1")
+# Non-critical updates (last login) are buffered and flushed in unordered batches.
+# 0 disables the buffer, the updates are written directly.
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.environ.get("WRITE_BUFFER_FLUSH_INTERVAL", 1))
+WRITE_BUFFER_MAX_SIZE = int(os.environ.get("WRITE_BUFFER_MAX_SIZE", 1000))
+
+# Seconds between two loads of the upcoming publications from the database.
+PUBLISH_SCHEDULER_RELOAD_INTERVAL = float(
+    os.environ.get("PUBLISH_SCHEDULER_RELOAD_INTERVAL", 60)
+)
+PUBLISH_SCHEDULER_HEAP_SIZE = int(os.environ.get("PUBLISH_SCHEDULER_HEAP_SIZE", 1000))
+# Upper bound of the Cache-Control max-age of the published post lists.
+POST_LIST_CACHE_MAX_AGE = int(os.environ.get("POST_LIST_CACHE_MAX_AGE", 5))
+
+# Trending posts, the engagement loses half of its weight every half-life.
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 12))
+TRENDING_COMMENT_WEIGHT = float(os.environ.get("TRENDING_COMMENT_WEIGHT", 2))
+TRENDING_REACTION_WEIGHT = float(os.environ.get("TRENDING_REACTION_WEIGHT", 1))
+# Seconds between two flushes of the in-memory scores and the ranking rebuild.
+TRENDING_FLUSH_INTERVAL = float(os.environ.get("TRENDING_FLUSH_INTERVAL", 10))
+TRENDING_TOP_K = int(os.environ.get("TRENDING_TOP_K", 100))
+# Scores that decayed below this value are removed.
+TRENDING_MIN_SCORE = float(os.environ.get("TRENDING_MIN_SCORE", 0.01))
+
+# Background jobs stored in MongoDB and executed by every application worker.
+JOB_WORKER_ENABLED = os.environ.get("JOB_WORKER_ENABLED", "True") == "True"
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 2))
+# A running job is claimed again if the worker did not finish it in time.
+JOB_LOCK_SECONDS = int(os.environ.get("JOB_LOCK_SECONDS", 300))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 5))
+# Finished jobs are removed after this delay, the failed ones are kept.
+JOB_DONE_TTL_HOURS = int(os.environ.get("JOB_DONE_TTL_HOURS", 24))
+
+# Replies returned with every comment, the rest is paginated by its own endpoint.
+COMMENT_REPLY_PREVIEW_SIZE = int(os.environ.get("COMMENT_REPLY_PREVIEW_SIZE", 3))
+
+# Deletion of the comments, reactions... of a deleted post.
+CASCADE_DELETE_BATCH_SIZE = int(os.environ.get("CASCADE_DELETE_BATCH_SIZE", 500))
+# Seconds to wait between two batches.
+CASCADE_DELETE_BATCH_DELAY = float(os.environ.get("CASCADE_DELETE_BATCH_DELAY", 0.1))
+# Batches of a single job run, the rest is re-enqueued.
+CASCADE_DELETE_MAX_BATCHES = int(os.environ.get("CASCADE_DELETE_MAX_BATCHES", 100))
+
+# Authors and topics with more followers are merged into the timeline on read.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.environ.get("FEED_FANOUT_MAX_FOLLOWERS", 10000))
+FEED_FANOUT_BATCH_SIZE = int(os.environ.get("FEED_FANOUT_BATCH_SIZE", 1000))
+FEED_TIMELINE_TTL_DAYS = int(os.environ.get("FEED_TIMELINE_TTL_DAYS", 30))
+# Followed targets merged on read, kept per worker and user for this many seconds.
+FEED_PULLED_TARGETS_CACHE_TTL = float(
+    os.environ.get("FEED_PULLED_TARGETS_CACHE_TTL", 60)
+)
+FEED_PULLED_TARGETS_CACHE_SIZE = int(
+    os.environ.get("FEED_PULLED_TARGETS_CACHE_SIZE", 10000)
+)
+
+# Seconds between two incremental loads of the in-memory topic registry.
+TOPIC_REGISTRY_REFRESH_INTERVAL = float(
+    os.environ.get("TOPIC_REGISTRY_REFRESH_INTERVAL", 60)
+)
+# Minimum seconds between two background loads triggered by an unknown topic.
+TOPIC_REGISTRY_MISS_REFRESH_INTERVAL = float(
+    os.environ.get("TOPIC_REGISTRY_MISS_REFRESH_INTERVAL", 1)
+)
+# Seconds between two loads of the post counts (autocomplete weights) of the topics.
+TOPIC_WEIGHTS_RELOAD_INTERVAL = float(
+    os.environ.get("TOPIC_WEIGHTS_RELOAD_INTERVAL", 300)
+)
+TOPIC_SUGGEST_CACHE_MAX_AGE = int(os.environ.get("TOPIC_SUGGEST_CACHE_MAX_AGE", 60))
+
+# Compress responses with zstd, br or gzip depending on the Accept-Encoding.
+COMPRESSION_ENABLED = os.environ.get("COMPRESSION_ENABLED", "True") == "True"
+# Smaller bodies are sent as is, the headers would cost more than the saving.
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_LEVEL = int(os.environ.get("COMPRESSION_BROTLI_LEVEL", 4))
+COMPRESSION_ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", 3))
+# Number of compressed bodies kept per worker, keyed by the response ETag.
+COMPRESSION_CACHE_SIZE = int(os.environ.get("COMPRESSION_CACHE_SIZE", 1024))
+
+# Public profiles kept per worker, refreshed after PROFILE_CACHE_TTL seconds.
+PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = float(os.environ.get("PROFILE_CACHE_TTL", 60))
+# Unknown usernames are cached for a shorter time, the user may register.
+PROFILE_CACHE_NEGATIVE_TTL = float(os.environ.get("PROFILE_CACHE_NEGATIVE_TTL", 5))
+
+# Approximate totals of the list endpoints, counted in the background.
+COUNT_CACHE_TTL = float(os.environ.get("COUNT_CACHE_TTL", 60))
+COUNT_CACHE_SIZE = int(os.environ.get("COUNT_CACHE_SIZE", 1000))
+COUNT_MAX_TIME_MS = int(os.environ.get("COUNT_MAX_TIME_MS", 5000))
+
+# Concurrent reads of the same post share one load, kept for this many seconds.
+POST_DETAILS_CACHE_TTL = float(os.environ.get("POST_DETAILS_CACHE_TTL", 1))
+POST_DETAILS_CACHE_SIZE = int(os.environ.get("POST_DETAILS_CACHE_SIZE", 1000))
+
+# Token buckets by endpoint or blueprint prefix: "<endpoint>=<requests>/<period>".
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "True") == "True"
+RATE_LIMITS = os.environ.get(
+    "RATE_LIMITS",
+    "user_api.login=10/minute,user_api.create=10/hour,"
+    "user_api.update_access_token=30/minute,"
+    "post.comments.create_comments=30/minute,post.comments.create_replies=30/minute",
+)
+# Shared by the workers of the host, in memory when /dev/shm exists.
+RATE_LIMIT_FILE = os.environ.get(
+    "RATE_LIMIT_FILE",
+    os.path.join(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+        "blog-api-rate-limit",
+    ),
+)
+RATE_LIMIT_SLOTS = int(os.environ.get("RATE_LIMIT_SLOTS", 65536))
+# Reverse proxies (nginx, load balancer) in front of the app, the client address
+# is read from their X-Forwarded-For. Keep 0 if the app is reached directly.
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", 0))
+
+# Full text search of the posts. The index file is memory-mapped by the workers
+# and rewritten when the posts indexed in memory are merged into it.
+SEARCH_INDEX_FILE = os.environ.get(
+    "SEARCH_INDEX_FILE",
+    os.path.join(tempfile.gettempdir(), "blog-api-search-index"),
+)
+# Seconds between two loads of the posts written by the other workers.
+SEARCH_REFRESH_INTERVAL = float(os.environ.get("SEARCH_REFRESH_INTERVAL", 30))
+# Posts indexed (or deleted) in memory before a merge into the index file.
+SEARCH_MERGE_THRESHOLD = int(os.environ.get("SEARCH_MERGE_THRESHOLD", 1000))
+
+# Related posts of a post, precomputed by a job from the shared topics.
+RELATED_POSTS_COUNT = int(os.environ.get("RELATED_POSTS_COUNT", 5))
+# "cosine" or "jaccard", the topics shared by fewer posts weigh more.
+RELATED_POSTS_SIMILARITY = os.environ.get("RELATED_POSTS_SIMILARITY", "cosine")
+# Seconds between a publication and the job, the posts published meanwhile share it.
+RELATED_POSTS_DELAY = float(os.environ.get("RELATED_POSTS_DELAY", 60))
+# Posts scored at once, bounds the memory of the sparse similarity matrix.
+RELATED_POSTS_BATCH_SIZE = int(os.environ.get("RELATED_POSTS_BATCH_SIZE", 1000))
+
 LOG_LEVEL = "INFO" if DEBUG is True else "INFO"
+# "text" or "json" (one object per line with the request id, route, latency...).
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# The records are written by a background thread, the request threads only
+# enqueue them. A full queue drops the records.
+LOG_QUEUE_ENABLED = os.environ.get("LOG_QUEUE_ENABLED", "True") == "True"
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# One record per request with its status and latency.
+LOG_REQUESTS = os.environ.get("LOG_REQUESTS", "False") == "True"
+# Past LOG_SAMPLE_BURST warnings of a line per LOG_SAMPLE_WINDOW seconds, only
+# one of every LOG_SAMPLE_RATE is kept.
+LOG_SAMPLING_ENABLED = os.environ.get("LOG_SAMPLING_ENABLED", "True") == "True"
+LOG_SAMPLE_BURST = int(os.environ.get("LOG_SAMPLE_BURST", 20))
+LOG_SAMPLE_WINDOW = float(os.environ.get("LOG_SAMPLE_WINDOW", 1))
+LOG_SAMPLE_RATE = int(os.environ.get("LOG_SAMPLE_RATE", 100))
 
 log_config = {
     "version": 1,
@@ -33,12 +205,13 @@ log_config = {
             "format": "[%(asctime)s] - [%(name)s] - [%(levelname)s] - %(message)s",
             "datefmt": "%Y-%m-%dT%H:%M:%S%z",
         },
+        "json": {"()": "app.base.log.JsonFormatter"},
     },
     "handlers": {
         "console": {
             "class": "logging.StreamHandler",
             "level": LOG_LEVEL,
-            "formatter": "default",
+            "formatter": "json" if LOG_FORMAT == "json" else "default",
             "stream": "ext://sys.stdout",
         },
     },
@@ -0,0 +1,144 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, TypeVar, cast
+
+from pymongo import read_preferences
+from pymongo.collection import Collection
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+from app.base import config
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+READ_PREFERENCES: Dict[str, Callable[..., Any]] = {
+    "primary": lambda **kwargs: read_preferences.Primary(),
+    "primaryPreferred": read_preferences.PrimaryPreferred,
+    "secondary": read_preferences.Secondary,
+    "secondaryPreferred": read_preferences.SecondaryPreferred,
+    "nearest": read_preferences.Nearest,
+}
+
+
+class ReadPolicy(NamedTuple):
+    read_preference: Any
+    read_concern: Optional[ReadConcern]
+
+
+def get_read_policy(
+    read_preference: str, read_concern: Optional[str] = None
+) -> ReadPolicy:
+    if read_preference not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference '{read_preference}'")
+    kwargs = {}
+    if config.READ_MAX_STALENESS_SECONDS > 0:
+        kwargs["max_staleness"] = config.READ_MAX_STALENESS_SECONDS
+    return ReadPolicy(
+        read_preference=READ_PREFERENCES[read_preference](**kwargs),
+        read_concern=ReadConcern(read_concern) if read_concern else None,
+    )
+
+
+PRIMARY = get_read_policy("primary")
+
+# None: the defaults of the connection string.
+_read_policy: ContextVar[Optional[ReadPolicy]] = ContextVar("read_policy", default=None)
+
+
+def read_policy(
+    read_preference: str, read_concern: Optional[str] = None
+) -> Callable[[F], F]:
+    """
+    Route the reads of the view with this read preference.
+    Only the models using `ReadPolicyMixin` are affected, writes always go to
+    the primary.
+    """
+    policy = get_read_policy(read_preference, read_concern)
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            token = _read_policy.set(policy)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _read_policy.reset(token)
+
+        return cast(F, wrapper)
+
+    return decorator
+
+
+def read_own_writes() -> None:
+    """Send the rest of the view reads to the primary, e.g. for the author's feed."""
+    _read_policy.set(PRIMARY)
+
+
+class ReadPolicyMixin:
+    """
+    Apply the read policy of the current view to the collection of the model.
+    Use it before `Document`: `class Post(ReadPolicyMixin, Document)`.
+    """
+
+    @classmethod
+    def _get_collection(cls) -> Collection[Any]:
+        collection: Collection[Any] = super()._get_collection()  # type: ignore
+        policy = _read_policy.get()
+        if policy is None:
+            return collection
+        return collection.with_options(
+            read_preference=policy.read_preference,
+            read_concern=policy.read_concern,
+        )
+
+
+def _get_w(value: str) -> Any:
+    return int(value) if value.isdigit() else value
+
+
+# Writes that must survive a failover: registrations, posts.
+DURABLE = "durable"
+# Writes that can be lost on a failover: counters, last login, comments.
+RELAXED = "relaxed"
+
+WRITE_CONCERNS: Dict[str, WriteConcern] = {
+    DURABLE: WriteConcern(w=_get_w(config.DURABLE_WRITE_CONCERN_W), j=True),
+    RELAXED: WriteConcern(w=_get_w(config.RELAXED_WRITE_CONCERN_W), j=False),
+}
+
+# None: the default of the connection string.
+_write_concern: ContextVar[Optional[WriteConcern]] = ContextVar(
+    "write_concern", default=None
+)
+
+
+@contextmanager
+def write_concern(policy: str) -> Iterator[None]:
+    """
+    Apply the write concern policy to the writes of the block.
+    Only the models using `WriteConcernMixin` are affected.
+    """
+    if not config.WRITE_CONCERN_POLICIES_ENABLED:
+        yield
+        return
+    token = _write_concern.set(WRITE_CONCERNS[policy])
+    try:
+        yield
+    finally:
+        _write_concern.reset(token)
+
+
+class WriteConcernMixin:
+    """
+    Apply the write concern of the current `write_concern` block to the
+    collection of the model. Use it before `Document`.
+    """
+
+    @classmethod
+    def _get_collection(cls) -> Collection[Any]:
+        collection: Collection[Any] = super()._get_collection()  # type: ignore
+        concern = _write_concern.get()
+        if concern is None:
+            return collection
+        return collection.with_options(write_concern=concern)
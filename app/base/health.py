@@ -0,0 +1,187 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import pymongo
+from mongodb_odm.connection import get_client
+from pymongo import monitoring
+
+from app.base import config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_POOL_SIZE = 100
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """
+    Track the checked out connections of every pool.
+    Register it before creating the MongoClient.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.max_pool_size: Dict[Any, int] = {}
+        self.checked_out: Dict[Any, int] = {}
+
+    def _change(self, address: Any, val: int) -> None:
+        with self._lock:
+            self.checked_out[address] = max(self.checked_out.get(address, 0) + val, 0)
+
+    def saturation(self) -> float:
+        with self._lock:
+            return max(
+                (
+                    self.checked_out.get(address, 0) / max_size
+                    for address, max_size in self.max_pool_size.items()
+                    if max_size
+                ),
+                default=0.0,
+            )
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        with self._lock:
+            self.max_pool_size[event.address] = event.options.get(
+                "maxPoolSize", DEFAULT_MAX_POOL_SIZE
+            )
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        with self._lock:
+            self.checked_out[event.address] = 0
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        with self._lock:
+            self.max_pool_size.pop(event.address, None)
+            self.checked_out.pop(event.address, None)
+
+    def connection_checked_out(
+        self, event: monitoring.ConnectionCheckedOutEvent
+    ) -> None:
+        self._change(event.address, 1)
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        self._change(event.address, -1)
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        pass
+
+    def connection_check_out_started(
+        self, event: monitoring.ConnectionCheckOutStartedEvent
+    ) -> None:
+        pass
+
+    def connection_check_out_failed(
+        self, event: monitoring.ConnectionCheckOutFailedEvent
+    ) -> None:
+        pass
+
+
+class HealthMonitor:
+    """
+    Ping MongoDB from a background thread and cache the result,
+    so that health check requests never wait on the database.
+    """
+
+    def __init__(
+        self, interval: float, max_ping_age: float, ping_timeout: float
+    ) -> None:
+        self.interval = interval
+        self.max_ping_age = max_ping_age
+        self.ping_timeout = ping_timeout
+        self.pool_listener = PoolListener()
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+        # None until the first ping completes.
+        self.is_db_reachable: Optional[bool] = None
+        self.last_ping_at: Optional[float] = None
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def register_listener(self) -> None:
+        monitoring.register(self.pool_listener)
+
+    def start(self) -> None:
+        # The thread does not survive a fork, start a new one in the worker.
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="health-monitor", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.ping()
+            time.sleep(self.interval)
+
+    def ping(self) -> bool:
+        """Called by the background thread only, it waits on the database."""
+        try:
+            # Fail fast instead of the 30s default server selection timeout.
+            with pymongo.timeout(self.ping_timeout):
+                get_client().admin.command("ping")
+            error = None
+        except Exception as e:
+            error = str(e)
+            logger.critical(f"Mongo Server not available. Error{e}")
+
+        now = time.monotonic()
+        with self._lock:
+            self.last_ping_at = now
+            self.is_db_reachable = error is None
+            self.last_error = error
+            if error is None:
+                self.last_success_at = now
+        return error is None
+
+    def status(self) -> Dict[str, Any]:
+        """Never ping here, a request must not wait on the database."""
+        now = time.monotonic()
+        with self._lock:
+            # The monitor did not run yet or it is stuck on a ping.
+            stale = (
+                self.last_ping_at is None or now - self.last_ping_at > self.max_ping_age
+            )
+            last_success_age = (
+                round(now - self.last_success_at, 3)
+                if self.last_success_at is not None
+                else None
+            )
+            return {
+                "db_reachable": self.is_db_reachable,
+                "stale": stale,
+                "last_success_ping_age": last_success_age,
+                "pool_saturation": round(self.pool_listener.saturation(), 3),
+                "error": self.last_error,
+            }
+
+    def is_ready(self, status: Dict[str, Any]) -> bool:
+        return (
+            status["db_reachable"] is True
+            and status["stale"] is False
+            and status["last_success_ping_age"] is not None
+            and status["last_success_ping_age"] <= self.max_ping_age
+            and status["pool_saturation"] < config.HEALTH_POOL_SATURATION_LIMIT
+        )
+
+
+health_monitor = HealthMonitor(
+    interval=config.HEALTH_CHECK_INTERVAL,
+    max_ping_age=config.HEALTH_MAX_PING_AGE,
+    ping_timeout=config.HEALTH_PING_TIMEOUT,
+)
@@ -0,0 +1,187 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+from mongodb_odm import ASCENDING, Document, Field, IndexModel
+
+from app.base import config
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], None]
+
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+class JobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+
+
+class Job(Document):
+    """
+    Background work stored in MongoDB, so it survives a crash of the worker.
+    A RUNNING job whose lock expired is claimed again.
+    A DONE job expires with the TTL index on `finished_at`.
+    """
+
+    name: str = Field(...)
+    payload: Dict[str, Any] = {}
+    status: JobStatus = JobStatus.PENDING
+    run_at: datetime = Field(default_factory=datetime.now)
+    locked_until: Optional[datetime] = None
+    attempts: int = Field(default=0)
+    last_error: Optional[str] = None
+    finished_at: Optional[datetime] = None
+
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "job"
+        indexes = [
+            IndexModel([("status", ASCENDING), ("run_at", ASCENDING)]),
+            IndexModel([("name", ASCENDING), ("status", ASCENDING)]),
+            IndexModel(
+                [("finished_at", ASCENDING)],
+                expireAfterSeconds=config.JOB_DONE_TTL_HOURS * 60 * 60,
+            ),
+        ]
+
+
+def job_handler(name: str) -> Callable[[JobHandler], JobHandler]:
+    def decorator(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[name] = func
+        return func
+
+    return decorator
+
+
+def enqueue(
+    name: str, payload: Dict[str, Any], run_at: Optional[datetime] = None
+) -> Job:
+    if name not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job '{name}'")
+    return Job(name=name, payload=payload, run_at=run_at or datetime.now()).create()
+
+
+def _claim(job_id: Any, now: datetime) -> bool:
+    result = Job.update_one(
+        {
+            "_id": job_id,
+            "$or": [
+                {"status": JobStatus.PENDING},
+                {"status": JobStatus.RUNNING, "locked_until": {"$lt": now}},
+            ],
+        },
+        {
+            "$set": {
+                "status": JobStatus.RUNNING,
+                "locked_until": now + timedelta(seconds=config.JOB_LOCK_SECONDS),
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+    )
+    return result.modified_count == 1
+
+
+def run_job(job: Job) -> bool:
+    handler = JOB_HANDLERS.get(job.name)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job '{job.name}'")
+        handler(job.payload)
+    except Exception as e:
+        logger.error(f"Job:{job.name} id:{job.id} failed error:{e}")
+        failed = job.attempts + 1 >= config.JOB_MAX_ATTEMPTS
+        Job.update_one(
+            {"_id": job.id},
+            {
+                "$set": {
+                    "status": JobStatus.FAILED if failed else JobStatus.PENDING,
+                    "last_error": str(e),
+                    # Exponential backoff before the next attempt.
+                    "run_at": datetime.now() + timedelta(seconds=2**job.attempts),
+                    "locked_until": None,
+                    "updated_at": datetime.now(),
+                }
+            },
+        )
+        return False
+
+    Job.update_one(
+        {"_id": job.id},
+        {
+            "$set": {
+                "status": JobStatus.DONE,
+                "locked_until": None,
+                "finished_at": datetime.now(),
+                "updated_at": datetime.now(),
+            }
+        },
+    )
+    return True
+
+
+def run_pending(limit: int = 100, names: Optional[List[str]] = None) -> int:
+    """Claim and run the due jobs, return the number of executed jobs."""
+    now = datetime.now()
+    filter: Dict[str, Any] = {
+        "$or": [
+            {"status": JobStatus.PENDING, "run_at": {"$lte": now}},
+            {"status": JobStatus.RUNNING, "locked_until": {"$lt": now}},
+        ]
+    }
+    if names:
+        filter["name"] = {"$in": names}
+
+    total = 0
+    for job in Job.find(filter, sort=[("run_at", ASCENDING)], limit=limit):
+        if not _claim(job.id, now):
+            # Another worker got it first.
+            continue
+        run_job(job)
+        total += 1
+    return total
+
+
+class JobWorker:
+    """Poll the due jobs from a daemon thread of every application worker."""
+
+    def __init__(self, poll_interval: float) -> None:
+        self.poll_interval = poll_interval
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._wake_up = threading.Event()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="job-worker", daemon=True
+        )
+        self._thread.start()
+
+    def notify(self) -> None:
+        """Run the pending jobs now instead of waiting for the next poll."""
+        self._wake_up.set()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                while run_pending():
+                    pass
+            except Exception as e:
+                logger.error(f"Job worker error:{e}")
+            self._wake_up.wait(self.poll_interval)
+            self._wake_up.clear()
+
+
+job_worker = JobWorker(poll_interval=config.JOB_POLL_INTERVAL)
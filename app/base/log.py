@@ -0,0 +1,206 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from flask import Flask, Response, g, has_request_context, request
+
+from app.base import config
+
+logger = logging.getLogger(__name__)
+
+# Attributes of every LogRecord, the others are extra fields.
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class RequestContextFilter(logging.Filter):
+    """Add the request id and route, in the thread that logs."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            if not hasattr(record, "request_id"):
+                record.request_id = g.get("request_id")
+            if not hasattr(record, "route"):
+                record.route = request.url_rule.rule if request.url_rule else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep the first `burst` warnings of a call site (logger and line) per
+    `window` seconds, then one of every `rate`. Other levels are not sampled.
+    """
+
+    def __init__(self, burst: int, window: float, rate: int) -> None:
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.rate = rate
+
+        self._lock = threading.Lock()
+        # call site -> (window start, records in the window, dropped)
+        self._sites: Dict[Tuple[str, int], Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno != logging.WARNING:
+            return True
+        key = (record.name, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            start, count, dropped = self._sites.get(key, (now, 0, 0))
+            if now - start > self.window:
+                start, count = now, 0
+            count += 1
+            keep = count <= self.burst or count % self.rate == 0
+            if keep:
+                if dropped:
+                    record.sampled_out = dropped
+                dropped = 0
+            else:
+                dropped += 1
+            self._sites[key] = (start, count, dropped)
+        return keep
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the extra fields of the record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted by the queue handler.
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never block the request thread: drop the record when the queue is full."""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Merge the arguments into the message now, they may change before the
+        listener runs. The traceback is kept apart (`exc_text`) instead of being
+        merged into the message, the JSON formatter writes it to `exc_info`.
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+
+
+def setup_logging() -> None:
+    """
+    Apply `config.log_config`. In queue mode the handlers of the root logger run
+    in a background thread, the logging threads only enqueue the records.
+    """
+    global _listener, _queue_handler
+    dictConfig(config.log_config)
+    root = logging.getLogger()
+    filters: List[logging.Filter] = [RequestContextFilter()]
+    if config.LOG_SAMPLING_ENABLED:
+        filters.append(
+            SamplingFilter(
+                burst=config.LOG_SAMPLE_BURST,
+                window=config.LOG_SAMPLE_WINDOW,
+                rate=config.LOG_SAMPLE_RATE,
+            )
+        )
+
+    if not config.LOG_QUEUE_ENABLED:
+        for handler in root.handlers:
+            for log_filter in filters:
+                handler.addFilter(log_filter)
+        return
+
+    stop_logging()
+    handlers = root.handlers[:]
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(config.LOG_QUEUE_SIZE)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    for log_filter in filters:
+        _queue_handler.addFilter(log_filter)
+    root.handlers = [_queue_handler]
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """Write the queued records and stop the listener."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_log_metrics() -> Dict[str, Any]:
+    """Counters of the current worker, the records dropped by a full queue."""
+    return {
+        "queue_enabled": _queue_handler is not None,
+        "dropped": _queue_handler.dropped if _queue_handler else 0,
+    }
+
+
+def start_request() -> None:
+    g.request_id = request.headers.get("X-Request-ID") or uuid4().hex
+    g.request_started_at = time.perf_counter()
+
+
+def log_request(response: Response) -> Response:
+    response.headers["X-Request-ID"] = g.get("request_id", "")
+    started_at = g.get("request_started_at")
+    if config.LOG_REQUESTS and started_at is not None:
+        logger.info(
+            "%s %s %s",
+            request.method,
+            request.path,
+            response.status_code,
+            extra={
+                "method": request.method,
+                "status": response.status_code,
+                "latency_ms": round((time.perf_counter() - started_at) * 1000, 2),
+            },
+        )
+    return response
+
+
+def init_request_logging(app: Flask) -> None:
+    app.before_request(start_request)
+    app.after_request(log_request)
@@ -1,15 +1,29 @@
 import logging
 from typing import Any
 
+from flask import Flask
+from werkzeug.middleware.proxy_fix import ProxyFix
+
 from app.base.utils.response import ExType, http_exception
 
 logger = logging.getLogger(__name__)
 
 
 def catch_exceptions_middleware(e: Any) -> Any:
-    logger.critical(f"""Unhandled Error:{e}""")
+    logger.critical("Unhandled Error:%s", e, exc_info=e)
     return http_exception(
         status=500,
         code=ExType.INTERNAL_SERVER_ERROR,
         detail="Internal server error. Try later.",
     )
+
+
+def init_proxy_fix(app: Flask, proxy_count: int) -> None:
+    """
+    Take the client address (`request.remote_addr`) from the X-Forwarded-For
+    set by the trusted proxies, the rate limit counts anonymous clients by it.
+    """
+    if proxy_count > 0:
+        app.wsgi_app = ProxyFix(  # type: ignore[method-assign]
+            app.wsgi_app, x_for=proxy_count
+        )
@@ -0,0 +1,212 @@
+import fcntl
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from flask import Flask, Response, g, request
+
+from app.base import config
+from app.base.utils.response import ExType, custom_response
+from app.user.auth import Auth
+
+logger = logging.getLogger(__name__)
+
+# key hash (0: free slot), tokens, last update (time.time)
+SLOT = struct.Struct("=Qdd")
+# A key lives in one group of slots, the least recently updated one is evicted.
+GROUP_SIZE = 8
+LOCK_STRIPES = 64
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+class Limit(NamedTuple):
+    # Burst size, refilled over `period` seconds.
+    requests: int
+    period: int
+
+    @property
+    def rate(self) -> float:
+        return self.requests / self.period
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: Limit
+    remaining: int
+    # Seconds until the bucket is full again.
+    reset: int
+    # Seconds until the next request is allowed, 0 if allowed.
+    retry_after: int
+
+
+def parse_limits(value: str) -> Dict[str, Limit]:
+    """`user_api.login=10/minute,post.comments=60/minute` by endpoint prefix."""
+    limits = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, limit = item.partition("=")
+        requests, _, period = limit.partition("/")
+        limits[name.strip()] = Limit(int(requests), PERIODS[period.strip()])
+    return limits
+
+
+class TokenBucketTable:
+    """
+    Token buckets in a memory-mapped file, shared by the workers of the host.
+
+    The file is a fixed table of `slots` buckets split in groups, a group is
+    locked with `fcntl` (between processes) and a stripe lock (between threads).
+    """
+
+    def __init__(self, path: str, slots: int) -> None:
+        self.path = path
+        self.groups = max(slots // GROUP_SIZE, 1)
+        self.size = self.groups * GROUP_SIZE * SLOT.size
+
+        self._thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._opened: Optional[Tuple[int, mmap.mmap]] = None
+        self._pid: Optional[int] = None
+
+    def _open(self) -> Tuple[int, mmap.mmap]:
+        if self._opened is not None and self._pid == os.getpid():
+            return self._opened
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self.size:
+            os.ftruncate(fd, self.size)
+        self._opened, self._pid = (fd, mmap.mmap(fd, self.size)), os.getpid()
+        return self._opened
+
+    def consume(self, key: str, limit: Limit, now: Optional[float] = None) -> Decision:
+        now = time.time() if now is None else now
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        key_hash = int.from_bytes(digest, "little") or 1
+        group = key_hash % self.groups
+        start = group * GROUP_SIZE * SLOT.size
+        length = GROUP_SIZE * SLOT.size
+
+        fd, table = self._open()
+        with self._thread_locks[group % LOCK_STRIPES]:
+            fcntl.lockf(fd, fcntl.LOCK_EX, length, start)
+            try:
+                offset, tokens = self._find(table, start, key_hash, limit, now)
+                allowed = tokens >= 1
+                if allowed:
+                    tokens -= 1
+                SLOT.pack_into(table, offset, key_hash, tokens, now)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, length, start)
+
+        return Decision(
+            allowed=allowed,
+            limit=limit,
+            remaining=int(tokens),
+            reset=math.ceil((limit.requests - tokens) / limit.rate),
+            retry_after=0 if allowed else math.ceil((1 - tokens) / limit.rate),
+        )
+
+    def _find(
+        self, table: mmap.mmap, start: int, key_hash: int, limit: Limit, now: float
+    ) -> Tuple[int, float]:
+        """The offset of the bucket of the key and its refilled tokens."""
+        oldest_offset, oldest_updated_at = start, math.inf
+        for i in range(GROUP_SIZE):
+            offset = start + i * SLOT.size
+            slot_hash, tokens, updated_at = SLOT.unpack_from(table, offset)
+            if slot_hash == key_hash:
+                refilled = tokens + max(now - updated_at, 0) * limit.rate
+                return offset, min(refilled, float(limit.requests))
+            if slot_hash == 0:
+                updated_at = -math.inf
+            if updated_at < oldest_updated_at:
+                oldest_offset, oldest_updated_at = offset, updated_at
+        # New (or evicted) key: a full bucket.
+        return oldest_offset, float(limit.requests)
+
+
+class RateLimiter:
+    """Limit the requests of every user (or IP) by endpoint or blueprint."""
+
+    def __init__(self, table: TokenBucketTable, limits: Dict[str, Limit]) -> None:
+        self.table = table
+        self.limits = limits
+
+    def get_limit(self, endpoint: str) -> Optional[Tuple[str, Limit]]:
+        """
+        The most specific of `post.comments.create_comments`, `post.comments`...
+        with its name: the routes of a blueprint limit share one bucket.
+        """
+        parts = endpoint.split(".")
+        for i in range(len(parts), 0, -1):
+            name = ".".join(parts[:i])
+            limit = self.limits.get(name)
+            if limit is not None:
+                return name, limit
+        return None
+
+    @staticmethod
+    def get_client_key() -> str:
+        """The user id of a valid access token, the IP address otherwise."""
+        try:
+            token_data = Auth.decode_token(Auth.extract_token(request.headers))
+            return f"user:{token_data.id}"
+        except Exception:
+            return f"ip:{request.remote_addr}"
+
+    def check(self) -> Optional[Response]:
+        if not config.RATE_LIMIT_ENABLED or request.endpoint is None:
+            return None
+        matched = self.get_limit(request.endpoint)
+        if matched is None:
+            return None
+        name, limit = matched
+        key = f"{name}:{self.get_client_key()}"
+        try:
+            decision = self.table.consume(key, limit)
+        except OSError as e:
+            # Never fail the request because of the limiter.
+            logger.error(f"Rate limiter error:{e}")
+            return None
+        g.rate_limit = decision
+        if decision.allowed:
+            return None
+        response = custom_response(
+            {
+                "code": ExType.RATE_LIMIT_ERROR,
+                "detail": "Too many requests. Try later.",
+                "field": None,
+            },
+            429,
+        )
+        response.headers["Retry-After"] = str(decision.retry_after)
+        return response
+
+    @staticmethod
+    def add_headers(response: Response) -> Response:
+        decision: Optional[Decision] = g.get("rate_limit")
+        if decision is not None:
+            response.headers["RateLimit-Limit"] = str(decision.limit.requests)
+            response.headers["RateLimit-Remaining"] = str(decision.remaining)
+            response.headers["RateLimit-Reset"] = str(decision.reset)
+            response.headers[
+                "RateLimit-Policy"
+            ] = f"{decision.limit.requests};w={decision.limit.period}"
+        return response
+
+
+rate_limiter = RateLimiter(
+    table=TokenBucketTable(config.RATE_LIMIT_FILE, config.RATE_LIMIT_SLOTS),
+    limits=parse_limits(config.RATE_LIMITS),
+)
+
+
+def init_rate_limit(app: Flask) -> None:
+    app.before_request(rate_limiter.check)
+    app.after_request(rate_limiter.add_headers)
@@ -2,9 +2,11 @@ import logging
 import os
 
 from flask import Blueprint, Response, request, send_file
-from mongodb_odm.connection import get_client
 
 from app.base.config import MEDIA_ROOT
+from app.base.health import health_monitor
+from app.base.log import get_log_metrics
+from app.base.singleflight import single_flights
 from app.base.utils.file import save_file
 from app.base.utils.response import ExType, custom_response, http_exception
 from app.user.auth import Auth
@@ -15,16 +17,41 @@ logger = logging.getLogger(__name__)
 
 @base_api.get("/")
 def index() -> Response:
-    try:
-        get_client().admin.command("ping")
-    except Exception as e:
-        logger.critical(f"Mongo Server not available. Error{e}")
+    if health_monitor.status()["db_reachable"] is False:
         raise http_exception(
             status=400, code=ExType.INTERNAL_SERVER_ERROR, detail="Database Error"
-        ) from e
+        )
     return custom_response({"message": "Welcome to the blog post api!"}, 200)
 
 
+@base_api.get("/health/live")
+def health_live() -> Response:
+    # The process is able to serve requests, the database state is informative.
+    return custom_response({"status": "ok", **health_monitor.status()}, 200)
+
+
+@base_api.get("/health/ready")
+def health_ready() -> Response:
+    status = health_monitor.status()
+    if health_monitor.is_ready(status):
+        return custom_response({"status": "ok", **status}, 200)
+    return custom_response({"status": "unavailable", **status}, 503)
+
+
+@base_api.get("/metrics")
+def metrics() -> Response:
+    # Counters of the current worker only.
+    return custom_response(
+        {
+            "single_flight": {
+                name: flight.get_metrics() for name, flight in single_flights.items()
+            },
+            "log": get_log_metrics(),
+        },
+        200,
+    )
+
+
 @base_api.post("/api/v1/upload-image")
 @Auth.auth_required
 def create_upload_image() -> Response:
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Per worker coalescing of identical concurrent reads.
+
+    The first caller of a key runs the load, the concurrent callers of the same
+    key wait for it and share its result (or its exception). The result is then
+    kept for `ttl` seconds (micro-cache), 0 only coalesces.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._cache: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._metrics = {"loads": 0, "coalesced": 0, "cache_hits": 0}
+        single_flights[name] = self
+
+    def do(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._metrics["cache_hits"] += 1
+                return cached[1]
+            call = self._calls.get(key)
+            is_leader = call is None
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._metrics["loads"] += 1
+            else:
+                self._metrics["coalesced"] += 1
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = load()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.ttl > 0:
+                    self._cache[key] = (time.monotonic() + self.ttl, call.result)
+                    self._cache.move_to_end(key)
+                    while len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+            call.done.set()
+        return call.result
+
+    def invalidate(self, match: Callable[[Any], bool]) -> None:
+        """Drop the cached results of the keys matching, in this worker only."""
+        with self._lock:
+            for key in [key for key in self._cache if match(key)]:
+                del self._cache[key]
+
+    def get_metrics(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._metrics, "in_flight": len(self._calls)}
+
+
+single_flights: Dict[str, SingleFlight] = {}
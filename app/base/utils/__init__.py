@@ -1,14 +1,31 @@
 from datetime import date, datetime
-from typing import Any, no_type_check
+from typing import Any, Dict, no_type_check
 
 from flask import request
 from pydantic import BaseModel, ValidationError
-from pydantic.v1.utils import deep_update
 from werkzeug.exceptions import HTTPException
 
 from app.base.utils.response import custom_response
 
 
+def deep_update(
+    mapping: Dict[str, Any], *updating_mappings: Dict[str, Any]
+) -> Dict[str, Any]:
+    # Same as pydantic.v1.utils.deep_update, without importing pydantic.v1.
+    updated_mapping = mapping.copy()
+    for updating_mapping in updating_mappings:
+        for k, v in updating_mapping.items():
+            if (
+                k in updated_mapping
+                and isinstance(updated_mapping[k], dict)
+                and isinstance(v, dict)
+            ):
+                updated_mapping[k] = deep_update(updated_mapping[k], v)
+            else:
+                updated_mapping[k] = v
+    return updated_mapping
+
+
 @no_type_check
 def update_partially(target, source: BaseModel, exclude=None) -> Any:
     cls = target.__class__
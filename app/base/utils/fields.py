@@ -0,0 +1,59 @@
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Type
+
+from flask import request
+from pydantic import BaseModel, create_model
+
+from app.base.utils.response import ExType, http_exception
+
+# Output field -> document fields it is built from, when the names differ.
+FieldSources = Dict[str, List[str]]
+
+
+def get_requested_fields(Schema: Type[BaseModel]) -> Optional[FrozenSet[str]]:
+    """
+    Parse the `fields` query parameter (`?fields=title,slug`).
+    Return None when every field is requested.
+    """
+    value = request.args.get("fields")
+    if value is None:
+        return None
+    fields = frozenset(field.strip() for field in value.split(",") if field.strip())
+    unknown = fields.difference(Schema.model_fields)
+    if not fields or unknown:
+        raise http_exception(
+            status=400,
+            code=ExType.VALIDATION_ERROR,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}.",
+            field="fields",
+        )
+    return fields
+
+
+def get_projection(fields: FrozenSet[str], sources: FieldSources) -> Dict[str, int]:
+    projection = {}
+    for field in fields:
+        for source in sources.get(field, [field]):
+            projection[source] = 1
+    return projection
+
+
+@lru_cache(maxsize=None)
+def get_partial_schema(
+    Schema: Type[BaseModel], fields: FrozenSet[str]
+) -> Type[BaseModel]:
+    """The output schema restricted to `fields`, with the same validation."""
+    definitions: Dict[str, Any] = {
+        name: (field.annotation, field)
+        for name, field in Schema.model_fields.items()
+        if name in fields
+    }
+    return create_model(f"Partial{Schema.__name__}", **definitions)
+
+
+def dump_fields(
+    Schema: Type[BaseModel], data: Dict[str, Any], fields: Optional[FrozenSet[str]]
+) -> Dict[str, Any]:
+    if fields is not None:
+        Schema = get_partial_schema(Schema, fields)
+    return Schema(**data).model_dump()
@@ -0,0 +1,207 @@
+import base64
+import binascii
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple, Type
+
+from bson import ObjectId, json_util
+from flask import request
+from mongodb_odm import ASCENDING, Document
+
+from app.base import config
+from app.base.utils.response import ExType, http_exception
+
+logger = logging.getLogger(__name__)
+
+# [(field, direction)], the last field must be unique (`_id`).
+Sort = List[Tuple[str, int]]
+
+
+class Page(NamedTuple):
+    items: List[Dict[str, Any]]
+    # Opaque cursors of the previous and the next pages, None at the edges.
+    before: Optional[str]
+    after: Optional[str]
+
+
+def encode_cursor(item: Dict[str, Any], sort: Sort) -> str:
+    values = {field: item.get(field) for field, _ in sort}
+    token = base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+    return token.rstrip("=")
+
+
+def decode_cursor(token: str, sort: Sort, param: str) -> Dict[str, Any]:
+    if len(sort) == 1 and sort[0][0] == "_id" and ObjectId.is_valid(token):
+        # Plain ids returned before the opaque cursors.
+        return {"_id": ObjectId(token)}
+    try:
+        padding = "=" * (-len(token) % 4)
+        values = json_util.loads(base64.urlsafe_b64decode(token + padding))
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, dict) or set(values) != {field for field, _ in sort}:
+        raise http_exception(
+            status=400,
+            code=ExType.VALIDATION_ERROR,
+            detail="Invalid cursor.",
+            field=param,
+        )
+    return values
+
+
+def _compare(field: str, op: str, value: Any) -> Optional[Dict[str, Any]]:
+    # null sorts before any value and is not matched by $lt/$gt.
+    if value is None:
+        return {field: {"$ne": None}} if op == "$gt" else None
+    if op == "$lt" and field != "_id":
+        return {"$or": [{field: {"$lt": value}}, {field: None}]}
+    return {field: {op: value}}
+
+
+def get_keyset_filter(
+    sort: Sort, values: Dict[str, Any], backward: bool
+) -> Dict[str, Any]:
+    """The documents after `values` in the `sort` order (before if `backward`)."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        op = "$gt" if (direction == ASCENDING) != backward else "$lt"
+        condition = _compare(field, op, values[field])
+        if condition is None:
+            continue
+        equalities = {prev: values[prev] for prev, _ in sort[:i]}
+        if equalities and "$or" in condition:
+            clauses.append({"$and": [equalities, condition]})
+        else:
+            clauses.append({**equalities, **condition})
+    if not clauses:
+        # Nothing after the cursor, _id is never null.
+        return {"_id": None}
+    return {"$or": clauses}
+
+
+def paginate(
+    Model: Type[Document],
+    filter: Dict[str, Any],
+    sort: Sort,
+    limit: int,
+    projection: Optional[Dict[str, Any]] = None,
+) -> Page:
+    """
+    Keyset pagination with the `after` and `before` query parameters.
+    One query of `limit + 1` documents, whatever the page number.
+    """
+    after = request.args.get("after")
+    before = request.args.get("before")
+    backward = before is not None and after is None
+    query = filter
+    if after or before:
+        param = "before" if backward else "after"
+        values = decode_cursor(after or before or "", sort, param)
+        keyset = get_keyset_filter(sort, values, backward)
+        query = {"$and": [filter, keyset]} if "$or" in filter else {**filter, **keyset}
+    if projection and all(projection.values()):
+        # The cursors are built from the sort fields.
+        projection = {**projection, **{field: 1 for field, _ in sort}}
+    query_sort = [
+        (field, -direction if backward else direction) for field, direction in sort
+    ]
+
+    items = list(
+        Model.find_raw(query, projection=projection, sort=query_sort, limit=limit + 1)
+    )
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backward:
+        items.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = bool(after), has_more
+
+    return Page(
+        items=items,
+        before=encode_cursor(items[0], sort) if items and has_previous else None,
+        after=encode_cursor(items[-1], sort) if items and has_next else None,
+    )
+
+
+class CountCache:
+    """
+    Per worker approximate totals of the list endpoints.
+
+    A filter without any condition uses `estimated_document_count` (metadata).
+    Other filters are counted in the background with `count_documents` and
+    cached for `ttl` seconds, a request never waits for a count: it gets the
+    cached (possibly stale) total, or None until the first count is done.
+    """
+
+    def __init__(self, ttl: float, max_size: int, max_time_ms: int) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.max_time_ms = max_time_ms
+
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[Tuple[str, str], Tuple[float, int]]" = OrderedDict()
+        self._pending: Set[Tuple[str, str]] = set()
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="count")
+
+    def get(self, Model: Type[Document], filter: Dict[str, Any]) -> Optional[int]:
+        if not filter:
+            return int(Model._get_collection().estimated_document_count())
+
+        key = (Model.__name__, json_util.dumps(filter, sort_keys=True))
+        with self._lock:
+            value = self._counts.get(key)
+            if value is not None:
+                self._counts.move_to_end(key)
+            if (value is None or value[0] < time.monotonic()) and (
+                key not in self._pending
+            ):
+                self._pending.add(key)
+                # Keep the read policy of the view.
+                context = contextvars.copy_context()
+                self._executor.submit(context.run, self._count, key, Model, filter)
+        return value[1] if value else None
+
+    def _count(
+        self, key: Tuple[str, str], Model: Type[Document], filter: Dict[str, Any]
+    ) -> None:
+        try:
+            count = Model.count_documents(filter, maxTimeMS=self.max_time_ms)
+            with self._lock:
+                self._counts[key] = (time.monotonic() + self.ttl, count)
+                self._counts.move_to_end(key)
+                while len(self._counts) > self.max_size:
+                    self._counts.popitem(last=False)
+        except Exception as e:
+            logger.warning(f"Count of {key} failed:{e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+
+count_cache = CountCache(
+    ttl=config.COUNT_CACHE_TTL,
+    max_size=config.COUNT_CACHE_SIZE,
+    max_time_ms=config.COUNT_MAX_TIME_MS,
+)
+
+
+def get_page_data(
+    page: Page,
+    results: List[Any],
+    Model: Type[Document],
+    filter: Dict[str, Any],
+) -> Dict[str, Any]:
+    """The response body, with the approximate total if `?total=true`."""
+    data: Dict[str, Any] = {
+        "before": page.before,
+        "after": page.after,
+        "results": results,
+    }
+    if request.args.get("total") == "true":
+        data["total"] = count_cache.get(Model, filter)
+    return data
@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Dict, no_type_check
+from typing import Any, Dict, Optional, no_type_check
 
 from mongodb_odm.exceptions import ObjectDoesNotExist
 
@@ -18,9 +18,28 @@ def get_object_or_404(
     try:
         return Model.get(filter, **kwargs)
     except ObjectDoesNotExist as e:
-        logger.warning(f"404 on:{Model.__name__} filter:{kwargs}")
+        # Lazy formatting: frequent, and sampled out most of the time.
+        logger.warning("404 on:%s filter:%s", Model.__name__, kwargs)
         raise http_exception(
             status=404,
             code=ExType.OBJECT_NOT_FOUND,
             detail=detail,
         ) from e
+
+
+@no_type_check
+def get_raw_or_404(
+    Model,
+    filter: Dict[str, Any],
+    projection: Optional[Dict[str, Any]] = None,
+    detail: str = "Object Not Found",
+) -> Dict[str, Any]:
+    """Load the raw (optionally projected) document without validating the model."""
+    for obj in Model.find_raw(filter, projection=projection).limit(1):
+        return obj
+    logger.warning("404 on:%s filter:%s", Model.__name__, filter)
+    raise http_exception(
+        status=404,
+        code=ExType.OBJECT_NOT_FOUND,
+        detail=detail,
+    )
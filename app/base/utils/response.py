@@ -1,7 +1,8 @@
+import hashlib
 from enum import Enum
 from typing import Any, Dict, Optional
 
-from flask import Response, json
+from flask import Response, json, request
 from werkzeug.exceptions import HTTPException
 
 
@@ -16,11 +17,39 @@ class ExType(str, Enum):
     AUTHENTICATION_ERROR = "AUTHENTICATION_ERROR"
     PERMISSION_ERROR = "PERMISSION_ERROR"
 
+    RATE_LIMIT_ERROR = "RATE_LIMIT_ERROR"
+    SERVICE_UNAVAILABLE = "SERVICE_UNAVAILABLE"
 
-def custom_response(res: Dict[Any, Any], status: int = 200) -> Response:
-    return Response(
-        mimetype="application/json", response=json.dumps(res), status=status
-    )
+
+def custom_response(
+    res: Dict[Any, Any], status: int = 200, etag: Optional[str] = None
+) -> Response:
+    return raw_response(json.dumps(res), status, etag)
+
+
+def raw_response(body: str, status: int = 200, etag: Optional[str] = None) -> Response:
+    """Response of an already serialized JSON body."""
+    response = Response(mimetype="application/json", response=body, status=status)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from the values that change whenever the representation does."""
+    return hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+
+
+def not_modified_response(etag: str) -> Optional[Response]:
+    """
+    Return a 304 response if the client already has this version.
+    Otherwise return None and let the caller build the full body.
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
 
 
 def http_exception(
@@ -0,0 +1,85 @@
+import atexit
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from mongodb_odm import Document, UpdateOne
+
+from app.base import config
+from app.base.db import RELAXED, write_concern
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBuffer:
+    """
+    Buffer the non-critical `$set` updates of this worker (e.g. last login)
+    and flush them periodically with one unordered bulk write per model.
+
+    Updates of the same document are merged, the last value wins.
+    Buffered updates are lost if the worker is killed.
+    """
+
+    def __init__(self, flush_interval: float, max_size: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._updates: Dict[Tuple[Type[Document], Any], Dict[str, Any]] = {}
+        self._wake_up = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def set(self, Model: Type[Document], _id: Any, values: Dict[str, Any]) -> None:
+        if self.flush_interval <= 0:
+            with write_concern(RELAXED):
+                Model.update_one({"_id": _id}, {"$set": values})
+            return
+        with self._lock:
+            self._updates.setdefault((Model, _id), {}).update(values)
+            is_full = len(self._updates) >= self.max_size
+        if is_full:
+            self._wake_up.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        if not updates:
+            return 0
+
+        requests: Dict[Type[Document], List[UpdateOne]] = defaultdict(list)
+        for (Model, _id), values in updates.items():
+            requests[Model].append(UpdateOne({"_id": _id}, {"$set": values}))
+        with write_concern(RELAXED):
+            for Model, model_requests in requests.items():
+                Model.bulk_write(requests=model_requests, ordered=False)
+        return len(updates)
+
+    def start(self) -> None:
+        if self.flush_interval <= 0:
+            return
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="write-buffer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            self._wake_up.wait(self.flush_interval)
+            self._wake_up.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write buffer error:{e}")
+
+
+write_buffer = WriteBuffer(
+    flush_interval=config.WRITE_BUFFER_FLUSH_INTERVAL,
+    max_size=config.WRITE_BUFFER_MAX_SIZE,
+)
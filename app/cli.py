@@ -10,6 +10,93 @@ def create_indexes() -> None:
     apply_indexes()
 
 
+@app.command()
+def process_posts(
+    batch_size: int = typer.Option(500),
+    reprocess: bool = typer.Option(False),
+) -> None:
+    """Compute the derived fields (rendered body, excerpt...) of existing posts."""
+    from app.post.processing import backfill_derived_fields
+
+    total = backfill_derived_fields(batch_size=batch_size, reprocess=reprocess)
+    typer.echo(f"{total} post processed")
+
+
+@app.command()
+def backfill_snapshots(batch_size: int = typer.Option(500)) -> None:
+    """Embed the author snapshot into posts and comments written without it."""
+    from app.post.snapshots import backfill_snapshots
+
+    backfill_snapshots(batch_size=batch_size)
+
+
+@app.command()
+def migrate_replies(batch_size: int = typer.Option(500)) -> None:
+    """Move the replies embedded in the comments to their own collection."""
+    from app.post.replies import migrate_embedded_replies
+
+    total = migrate_embedded_replies(batch_size=batch_size)
+    typer.echo(f"{total} reply migrated")
+
+
+@app.command()
+def count_topic_posts() -> None:
+    """Recount the posts of every topic (the weights of the autocomplete)."""
+    from app.post.topics import count_topic_posts
+
+    total = count_topic_posts()
+    typer.echo(f"{total} topic updated")
+
+
+@app.command()
+def build_search_index() -> None:
+    """Index all the posts into the search index file loaded by the workers."""
+    from app.post.search import search_index
+
+    total = search_index.rebuild()
+    typer.echo(f"{total} post indexed into {search_index.path}")
+
+
+@app.command()
+def compute_related_posts(full: bool = typer.Option(False)) -> None:
+    """Compute the related posts of the new posts, of every post with --full."""
+    from app.post.related import update_related_posts
+
+    total = update_related_posts(full=full)
+    typer.echo(f"{total} post updated")
+
+
+@app.command()
+def pending_deletions() -> None:
+    """List the deleted posts whose comments, reactions... are not deleted yet."""
+    from app.post.deletion import get_pending_deletions
+
+    for obj in get_pending_deletions():
+        job = obj["job"]
+        typer.echo(
+            f"post:{obj['post_id']} status:{job.status.value} "
+            f"attempts:{job.attempts} remaining:{obj['remaining']}"
+            + (f" error:{job.last_error}" if job.last_error else "")
+        )
+
+
+@app.command()
+def drain_deletions(retry_failed: bool = typer.Option(False)) -> None:
+    """Run the pending post deletions now instead of waiting for the job worker."""
+    from app.base.jobs import Job, JobStatus, run_pending
+    from app.post.deletion import DELETE_POST_JOB
+
+    if retry_failed:
+        Job.update_many(
+            {"name": DELETE_POST_JOB, "status": JobStatus.FAILED},
+            {"$set": {"status": JobStatus.PENDING, "attempts": 0}},
+        )
+    total = 0
+    while count := run_pending(names=[DELETE_POST_JOB]):
+        total += count
+    typer.echo(f"{total} deletion job executed")
+
+
 @app.command()
 def populate_data(
     total_user: int = typer.Option(10),
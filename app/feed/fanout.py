@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+from mongodb_odm import ODMObjectId, UpdateOne
+
+from app.base import config
+from app.base.jobs import enqueue, job_handler, job_worker
+from app.post.models import Post
+
+from .models import Follow, FollowCount, FollowType, TimelineEntry
+
+logger = logging.getLogger(__name__)
+
+FANOUT_JOB = "fanout_post"
+
+Target = Tuple[FollowType, Any]
+
+
+def get_heavy_targets(targets: List[Target]) -> Set[Target]:
+    """
+    Targets with too many followers are not fanned out on write,
+    their posts are merged into the timeline on read.
+    """
+    if not targets:
+        return set()
+    return {
+        (FollowType(obj["target_type"]), obj["target_id"])
+        for obj in FollowCount.find_raw(
+            {
+                "target_id": {"$in": [target_id for _, target_id in targets]},
+                "total_follower": {"$gt": config.FEED_FANOUT_MAX_FOLLOWERS},
+            },
+            projection={"target_type": 1, "target_id": 1},
+        )
+    }
+
+
+class PulledTargetCache:
+    """
+    Per worker LRU of the followed targets of a user that are merged into the
+    timeline on read, so a timeline request does not query the follows.
+    `invalidate` only reaches the current worker, the other workers see a
+    follow after `ttl` seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._targets: "OrderedDict[Any, Tuple[float, List[Target]]]" = OrderedDict()
+
+    def get(self, user_id: Any) -> List[Target]:
+        with self._lock:
+            value = self._targets.get(user_id)
+            if value is not None and value[0] >= time.monotonic():
+                self._targets.move_to_end(user_id)
+                return value[1]
+
+        follows = [
+            (FollowType(obj["target_type"]), obj["target_id"])
+            for obj in Follow.find_raw(
+                {"user_id": user_id}, projection={"target_type": 1, "target_id": 1}
+            )
+        ]
+        targets = list(get_heavy_targets(follows))
+        with self._lock:
+            self._targets[user_id] = (time.monotonic() + self.ttl, targets)
+            self._targets.move_to_end(user_id)
+            while len(self._targets) > self.max_size:
+                self._targets.popitem(last=False)
+        return targets
+
+    def invalidate(self, user_id: Any) -> None:
+        with self._lock:
+            self._targets.pop(user_id, None)
+
+
+pulled_target_cache = PulledTargetCache(
+    max_size=config.FEED_PULLED_TARGETS_CACHE_SIZE,
+    ttl=config.FEED_PULLED_TARGETS_CACHE_TTL,
+)
+
+
+def targets_to_filter(targets: List[Target]) -> List[Dict[str, Any]]:
+    return [
+        {"target_type": target_type, "target_id": target_id}
+        for target_type, target_id in targets
+    ]
+
+
+@job_handler(FANOUT_JOB)
+def fanout_post(payload: Dict[str, Any]) -> None:
+    post_id = ODMObjectId(payload["post_id"])
+    post = next(
+        Post.find_raw(
+            {"_id": post_id},
+            projection={
+                "author_id": 1,
+                "topic_ids": 1,
+                "publish_at": 1,
+                "is_published": 1,
+            },
+        ).limit(1),
+        None,
+    )
+    if post is None or post.get("publish_at") is None:
+        return
+
+    publish_data = {
+        "publish_at": post["publish_at"],
+        "is_published": post.get("is_published", False),
+    }
+    # Entries that were already delivered follow the new publish time.
+    TimelineEntry.update_many({"post_id": post_id}, {"$set": publish_data})
+
+    targets: List[Target] = [(FollowType.AUTHOR, post["author_id"])] + [
+        (FollowType.TOPIC, topic_id) for topic_id in post.get("topic_ids", [])
+    ]
+    heavy_targets = get_heavy_targets(targets)
+    targets = [target for target in targets if target not in heavy_targets]
+    if not targets:
+        return
+
+    now = datetime.now()
+    seen: Set[Any] = {post["author_id"]}
+    write_entries: List[UpdateOne] = []
+    total = 0
+    for follow in Follow.find_raw(
+        {"$or": targets_to_filter(targets)}, projection={"user_id": 1}
+    ):
+        user_id = follow["user_id"]
+        if user_id in seen:
+            # Following the author and a topic of the post gives a single entry.
+            continue
+        seen.add(user_id)
+        write_entries.append(
+            UpdateOne(
+                {"user_id": user_id, "post_id": post_id},
+                {
+                    "$set": {"author_id": post["author_id"], **publish_data},
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+        )
+        if len(write_entries) >= config.FEED_FANOUT_BATCH_SIZE:
+            TimelineEntry.bulk_write(requests=write_entries, ordered=False)
+            total += len(write_entries)
+            write_entries = []
+    if write_entries:
+        TimelineEntry.bulk_write(requests=write_entries, ordered=False)
+        total += len(write_entries)
+    logger.info(f"Post:{post_id} delivered to {total} timeline")
+
+
+def enqueue_fanout(post_id: Any) -> None:
+    enqueue(FANOUT_JOB, {"post_id": str(post_id)})
+    job_worker.notify()
@@ -0,0 +1,89 @@
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from mongodb_odm import ASCENDING, DESCENDING, Document, Field, IndexModel, ODMObjectId
+
+from app.base import config
+
+
+class FollowType(str, Enum):
+    TOPIC = "TOPIC"
+    AUTHOR = "AUTHOR"
+
+
+class Follow(Document):
+    user_id: ODMObjectId = Field(...)
+    target_type: FollowType = Field(...)
+    target_id: ODMObjectId = Field(...)
+
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "follow"
+        indexes = [
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("target_type", ASCENDING),
+                    ("target_id", ASCENDING),
+                ],
+                unique=True,
+            ),
+            # Used by the fan-out to find the followers of a target.
+            IndexModel(
+                [
+                    ("target_type", ASCENDING),
+                    ("target_id", ASCENDING),
+                    ("user_id", ASCENDING),
+                ]
+            ),
+        ]
+
+
+class FollowCount(Document):
+    target_type: FollowType = Field(...)
+    target_id: ODMObjectId = Field(...)
+    total_follower: int = Field(default=0)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "follow_count"
+        indexes = [
+            IndexModel(
+                [("target_id", ASCENDING), ("target_type", ASCENDING)], unique=True
+            ),
+        ]
+
+
+class TimelineEntry(Document):
+    """
+    Materialized home timeline, one document per (user, post).
+    Written by the fan-out job when a post is published.
+    """
+
+    user_id: ODMObjectId = Field(...)
+    post_id: ODMObjectId = Field(...)
+    author_id: ODMObjectId = Field(...)
+    # Scheduled posts are delivered early and hidden until they are published.
+    publish_at: Optional[datetime] = None
+    is_published: bool = False
+
+    created_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "timeline"
+        indexes = [
+            IndexModel([("user_id", ASCENDING), ("post_id", DESCENDING)], unique=True),
+            IndexModel(
+                [
+                    ("user_id", ASCENDING),
+                    ("is_published", ASCENDING),
+                    ("post_id", DESCENDING),
+                ]
+            ),
+            IndexModel([("post_id", ASCENDING)]),
+            IndexModel(
+                [("created_at", ASCENDING)],
+                expireAfterSeconds=config.FEED_TIMELINE_TTL_DAYS * 24 * 60 * 60,
+            ),
+        ]
@@ -0,0 +1,197 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from flask import Blueprint, Response, g, request
+from mongodb_odm import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from app.base.utils.fields import get_requested_fields
+from app.base.utils.pagination import Sort, decode_cursor, encode_cursor
+from app.base.utils.query import get_raw_or_404
+from app.base.utils.response import ExType, custom_response, http_exception
+from app.post.models import Post
+from app.post.routers.posts import get_post_list_projection, get_post_list_results
+from app.post.schemas.posts import PostListOut
+from app.post.topics import topic_registry
+from app.user.auth import Auth
+from app.user.models import User
+
+from .fanout import pulled_target_cache, targets_to_filter
+from .models import Follow, FollowCount, FollowType, TimelineEntry
+
+logger = logging.getLogger(__name__)
+feed_api = Blueprint("feed", __name__, url_prefix="/api/v1")
+
+
+def follow_target(user: User, target_type: FollowType, target_id: Any) -> Response:
+    try:
+        Follow(user_id=user.id, target_type=target_type, target_id=target_id).create()
+    except DuplicateKeyError:
+        return custom_response({"message": "You already follow it"}, 201)
+    pulled_target_cache.invalidate(user.id)
+    FollowCount.update_one(
+        {"target_type": target_type, "target_id": target_id},
+        {"$inc": {"total_follower": 1}},
+        upsert=True,
+    )
+    return custom_response({"message": "Followed"}, 201)
+
+
+def unfollow_target(user: User, target_type: FollowType, target_id: Any) -> Response:
+    delete_result = Follow.delete_many(
+        {"user_id": user.id, "target_type": target_type, "target_id": target_id}
+    )
+    if delete_result.deleted_count:
+        pulled_target_cache.invalidate(user.id)
+        FollowCount.update_one(
+            {"target_type": target_type, "target_id": target_id},
+            {"$inc": {"total_follower": -delete_result.deleted_count}},
+        )
+    # Posts that were already delivered stay in the timeline.
+    return custom_response({"message": "Unfollowed"}, 200)
+
+
+def get_topic_id(slug: str) -> Any:
+    topics = topic_registry.get_by_slugs([slug])
+    if not topics:
+        raise http_exception(
+            status=404, code=ExType.OBJECT_NOT_FOUND, detail="Topic not found"
+        )
+    return topics[0].id
+
+
+def get_author_id(username: str) -> Any:
+    return get_raw_or_404(User, {"username": username}, projection={"_id": 1})["_id"]
+
+
+@feed_api.post("/topics/<string:slug>/follow")
+@Auth.auth_required
+def follow_topic(slug: str) -> Response:
+    return follow_target(g.user, FollowType.TOPIC, get_topic_id(slug))
+
+
+@feed_api.delete("/topics/<string:slug>/follow")
+@Auth.auth_required
+def unfollow_topic(slug: str) -> Response:
+    return unfollow_target(g.user, FollowType.TOPIC, get_topic_id(slug))
+
+
+@feed_api.post("/users/<string:username>/follow")
+@Auth.auth_required
+def follow_author(username: str) -> Response:
+    author_id = get_author_id(username)
+    if author_id == g.user.id:
+        raise http_exception(
+            status=400,
+            code=ExType.VALIDATION_ERROR,
+            detail="You can't follow yourself.",
+        )
+    return follow_target(g.user, FollowType.AUTHOR, author_id)
+
+
+@feed_api.delete("/users/<string:username>/follow")
+@Auth.auth_required
+def unfollow_author(username: str) -> Response:
+    return unfollow_target(g.user, FollowType.AUTHOR, get_author_id(username))
+
+
+# Timeline entries and pulled posts are merged by post id.
+TIMELINE_SORT: Sort = [("_id", DESCENDING)]
+
+
+def get_id_range(cursor_id: Any, backward: bool) -> Dict[str, Any]:
+    return {"$gt" if backward else "$lt": cursor_id}
+
+
+def get_pulled_post_ids(
+    user: User, cursor_id: Any, backward: bool, limit: int
+) -> List[Any]:
+    """Fan-out-on-read for the followed targets that are too big to be pushed."""
+    heavy_targets = pulled_target_cache.get(user.id)
+    if not heavy_targets:
+        return []
+
+    target_filter = []
+    for target in targets_to_filter(heavy_targets):
+        field = (
+            "author_id" if target["target_type"] == FollowType.AUTHOR else "topic_ids"
+        )
+        target_filter.append({field: target["target_id"]})
+    post_filter: Dict[str, Any] = {"is_published": True, "$or": target_filter}
+    if cursor_id:
+        post_filter["_id"] = get_id_range(cursor_id, backward)
+    return [
+        obj["_id"]
+        for obj in Post.find_raw(
+            post_filter,
+            projection={"_id": 1},
+            sort=[("_id", ASCENDING if backward else DESCENDING)],
+            limit=limit,
+        )
+    ]
+
+
+@feed_api.get("/timeline")
+@Auth.auth_required
+def get_timeline() -> Response:
+    """Keyset pagination with the opaque `after` and `before` cursors."""
+    user: User = g.user
+
+    after: Optional[str] = request.args.get("after", None)
+    before: Optional[str] = request.args.get("before", None)
+    backward = before is not None and after is None
+    limit = int(request.args.get("limit", 20))
+
+    cursor_id = None
+    if after or before:
+        param = "before" if backward else "after"
+        cursor_id = decode_cursor(after or before or "", TIMELINE_SORT, param)["_id"]
+
+    filter: Dict[str, Any] = {"user_id": user.id, "is_published": True}
+    if cursor_id:
+        filter["post_id"] = get_id_range(cursor_id, backward)
+
+    post_ids = [
+        obj["post_id"]
+        for obj in TimelineEntry.find_raw(
+            filter,
+            projection={"post_id": 1},
+            sort=[("post_id", ASCENDING if backward else DESCENDING)],
+            limit=limit + 1,
+        )
+    ]
+    post_ids = sorted(
+        {*post_ids, *get_pulled_post_ids(user, cursor_id, backward, limit + 1)},
+        reverse=not backward,
+    )
+    has_more = len(post_ids) > limit
+    post_ids = post_ids[:limit]
+    if backward:
+        post_ids.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = bool(after), has_more
+
+    fields = get_requested_fields(PostListOut)
+    posts_dict = {
+        post["_id"]: post
+        for post in Post.find_raw(
+            {"_id": {"$in": post_ids}},
+            projection=get_post_list_projection(fields),
+        )
+    }
+    posts = [posts_dict[post_id] for post_id in post_ids if post_id in posts_dict]
+    results = get_post_list_results(posts, fields)
+
+    return custom_response(
+        {
+            "before": encode_cursor({"_id": post_ids[0]}, TIMELINE_SORT)
+            if post_ids and has_previous
+            else None,
+            "after": encode_cursor({"_id": post_ids[-1]}, TIMELINE_SORT)
+            if post_ids and has_next
+            else None,
+            "results": results,
+        },
+        200,
+    )
@@ -1,14 +1,154 @@
+"""
+This file is loaded by gunicorn with `-c app/gunicorn_config.py` before the
+application is imported. Keep it free from `app.*` imports.
+"""
+
+import math
 import os
+import sys
+from typing import Any, Optional
+
+GUNICORN_WORKER_CLASS = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# Use "auto" to derive the value from the available CPU.
+GUNICORN_WORKERS = os.environ.get("GUNICORN_WORKERS", "1")
+GUNICORN_THREADS = os.environ.get("GUNICORN_THREADS", "auto")
+GUNICORN_WORKER_CONNECTIONS = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "1000"))
+GUNICORN_MAX_REQUESTS = int(os.environ.get("GUNICORN_MAX_REQUESTS", "1000"))
+GUNICORN_MAX_REQUESTS_JITTER = int(
+    os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", str(GUNICORN_MAX_REQUESTS // 10))
+)
+
+COOPERATIVE_WORKERS = {"gevent", "eventlet"}
+
+
+def read_cgroup_cpu_quota() -> Optional[float]:
+    """
+    Return the CPU quota of the container as a number of cores.
+    Return None if there is no quota (or no cgroup at all).
+    """
+    # cgroup v2: "<quota> <period>" or "max <period>"
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota == "max":
+            return None
+        return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    # cgroup v1
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            cfs_quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            cfs_period = int(f.read())
+        if cfs_quota <= 0 or cfs_period <= 0:
+            return None
+        return cfs_quota / cfs_period
+    except (OSError, ValueError):
+        return None
+
+
+def get_available_cpu() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        cpu = len(os.sched_getaffinity(0))
+    else:
+        cpu = os.cpu_count() or 1
+
+    quota = read_cgroup_cpu_quota()
+    if quota is not None:
+        cpu = min(cpu, math.ceil(quota))
+    return max(cpu, 1)
+
+
+def get_worker_count(worker_class: str, cpu: int) -> int:
+    if worker_class in COOPERATIVE_WORKERS:
+        # One event loop per core, the concurrency comes from greenlets.
+        return cpu
+    if worker_class == "gthread":
+        return cpu + 1
+    return 2 * cpu + 1
+
+
+def get_thread_count(worker_class: str, cpu: int) -> int:
+    if worker_class == "gthread":
+        # Most of the request time is spent waiting on MongoDB.
+        return max(4, 2 * cpu)
+    return 1
 
-GUNICORN_WORKERS = int(os.environ.get("GUNICORN_WORKERS", "1"))
-GUNICORN_THREADS = int(os.environ.get("GUNICORN_THREADS", "5"))
 
+def resolve_threads(value: str, worker_class: str, cpu: int) -> int:
+    if worker_class != "gthread":
+        # gunicorn silently turns a sync worker with threads into gthread.
+        return 1
+    return resolve(value, get_thread_count(worker_class, cpu))
+
+
+def resolve(value: str, default: int) -> int:
+    if value == "auto":
+        return default
+    return int(value)
+
+
+CPU = get_available_cpu()
 
 bind = ":8000"
-workers = GUNICORN_WORKERS
-threads = GUNICORN_THREADS
+worker_class = GUNICORN_WORKER_CLASS
+workers = resolve(GUNICORN_WORKERS, get_worker_count(worker_class, CPU))
+threads = resolve_threads(GUNICORN_THREADS, worker_class, CPU)
+worker_connections = GUNICORN_WORKER_CONNECTIONS
+# Restart the worker after some requests to bound the memory growth.
+# The jitter prevents all workers from restarting at the same time.
+max_requests = GUNICORN_MAX_REQUESTS
+max_requests_jitter = GUNICORN_MAX_REQUESTS_JITTER
+
+
+def on_starting(server: Any) -> None:
+    if worker_class not in COOPERATIVE_WORKERS:
+        return
+    if server.cfg.preload_app:
+        """
+        With preload the app (and pymongo) is imported in the master before the
+        worker patches the standard library, so the MongoClient will block.
+        """
+        raise RuntimeError(f"'preload_app' is not supported with {worker_class}")
+    if "pymongo" in sys.modules:
+        raise RuntimeError("pymongo should not be imported before the monkey patch")
+    try:
+        __import__(worker_class)
+    except ImportError as e:
+        raise RuntimeError(f"Install '{worker_class}' to use it as worker") from e
+
+
+def post_worker_init(worker: Any) -> None:
+    if worker_class == "gevent":
+        from gevent import monkey
+
+        not_patched = [
+            module
+            for module in ("socket", "select", "threading", "ssl")
+            if not monkey.is_module_patched(module)
+        ]
+    elif worker_class == "eventlet":
+        import eventlet.patcher
+
+        not_patched = [
+            module
+            for module in ("socket", "select", "thread")
+            if not eventlet.patcher.is_monkey_patched(module)
+        ]
+    else:
+        return
+
+    if not_patched:
+        worker.log.critical(f"Modules are not monkey patched: {not_patched}")
+        sys.exit(4)  # gunicorn WORKER_BOOT_ERROR
+
 
 """
-Equivalent command
-gunicorn --bind=:8000 --workers=1 --threads=5 app.main:app
+Equivalent command on 2 cores
+gunicorn --bind=:8000 --workers=1 --threads=4 app.main:app
+
+Auto sized gevent workers
+GUNICORN_WORKER_CLASS=gevent GUNICORN_WORKERS=auto \
+    gunicorn -c app/gunicorn_config.py app.main:app
 """
@@ -1,30 +1,54 @@
 import logging
-from logging.config import dictConfig
 
 from flask import Flask
 from flask_cors import CORS
 from mongodb_odm import connect, disconnect
 
 from app.base import config
-from app.base.middleware import catch_exceptions_middleware
+from app.base.compression import init_compression
+from app.base.health import health_monitor
+from app.base.jobs import job_worker
+from app.base.log import init_request_logging, setup_logging
+from app.base.middleware import catch_exceptions_middleware, init_proxy_fix
+from app.base.ratelimit import init_rate_limit
 from app.base.routers import base_api
-from app.cli import app as cli_app
+from app.base.write_buffer import write_buffer
+from app.feed.routers import feed_api
 from app.post.routers import post_api
+from app.post.scheduler import publish_scheduler
+from app.post.search import search_index
+from app.post.topics import topic_registry
+from app.post.trending import trending_engine
 from app.user.routers import user_api
 
 logger = logging.getLogger(__name__)
 
 
 def create_app() -> Flask:
-    dictConfig(config.log_config)
+    setup_logging()
     app = Flask(__name__)
 
     app.config["SECRET_KEY"] = config.SECRET_KEY
+    health_monitor.register_listener()
     connect(config.MONGO_URL)
+    health_monitor.start()
+    topic_registry.start_load()
+    if config.JOB_WORKER_ENABLED:
+        job_worker.start()
+    publish_scheduler.start()
+    trending_engine.start()
+    write_buffer.start()
+    search_index.start()
 
     app.register_blueprint(base_api)
     app.register_blueprint(post_api)
     app.register_blueprint(user_api)
+    app.register_blueprint(feed_api)
+
+    init_proxy_fix(app, config.TRUSTED_PROXY_COUNT)
+    init_request_logging(app)
+    init_rate_limit(app)
+    init_compression(app)
 
     return app
 
@@ -36,10 +60,8 @@ app.register_error_handler(500, catch_exceptions_middleware)
 CORS(app, resources={r"/api/*": {"origins": config.ALLOWED_HOSTS}})
 
 if __name__ == "__main__":
-    print("new connection")
-    # connect(config.MONGO_URL)
-
-    # app = create_app()
+    # The CLI (typer) is not needed by the workers.
+    from app.cli import app as cli_app
 
     cli_app()
     disconnect()
@@ -0,0 +1,88 @@
+import logging
+import time
+from typing import Any, Dict, List, Type
+
+from mongodb_odm import Document, ODMObjectId
+
+from app.base import config
+from app.base.jobs import Job, JobStatus, enqueue, job_handler, job_worker
+from app.feed.models import TimelineEntry
+
+from .models import Comment, Post, Reaction, Reply, TrendingScore
+from .related import refresh_referencing_posts
+
+logger = logging.getLogger(__name__)
+
+DELETE_POST_JOB = "delete_post"
+
+# Documents that belong to a post, deleted after the post itself.
+POST_DEPENDENTS: List[Type[Document]] = [
+    Reply,
+    Comment,
+    Reaction,
+    TimelineEntry,
+    TrendingScore,
+]
+
+
+def delete_batch(model: Type[Document], post_id: Any, batch_size: int) -> int:
+    ids = [
+        obj["_id"]
+        for obj in model.find_raw(
+            {"post_id": post_id}, projection={"_id": 1}, limit=batch_size
+        )
+    ]
+    if not ids:
+        return 0
+    return model.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+@job_handler(DELETE_POST_JOB)
+def delete_post_dependents(payload: Dict[str, Any]) -> None:
+    """
+    Delete a post then its documents in bounded batches with a pause between
+    them, so that a large post does not monopolize the `post_id` indexes.
+
+    The job is enqueued before the request deletes the post, it deletes the post
+    too if the request crashed meanwhile. Only what remains is deleted, so a
+    crashed job is resumed by running it again.
+    After `CASCADE_DELETE_MAX_BATCHES` the job re-enqueues itself, which keeps a
+    single run shorter than the job lock.
+    """
+    post_id = ODMObjectId(payload["post_id"])
+    Post.delete_many({"_id": post_id})
+    # The other posts must not link to it.
+    refresh_referencing_posts(post_id, remove=True)
+    batches = 0
+    for model in POST_DEPENDENTS:
+        while delete_batch(model, post_id, config.CASCADE_DELETE_BATCH_SIZE):
+            batches += 1
+            if batches >= config.CASCADE_DELETE_MAX_BATCHES:
+                enqueue(DELETE_POST_JOB, payload)
+                return
+            time.sleep(config.CASCADE_DELETE_BATCH_DELAY)
+    logger.info(f"Dependents of post:{post_id} deleted")
+
+
+def enqueue_post_deletion(post_id: Any) -> Job:
+    job = enqueue(DELETE_POST_JOB, {"post_id": str(post_id)})
+    job_worker.notify()
+    return job
+
+
+def get_pending_deletions() -> List[Dict[str, Any]]:
+    """Unfinished deletions with the number of documents left."""
+    results = []
+    for job in Job.find(
+        {
+            "name": DELETE_POST_JOB,
+            "status": {"$in": [JobStatus.PENDING, JobStatus.RUNNING, JobStatus.FAILED]},
+        }
+    ):
+        post_id = ODMObjectId(job.payload["post_id"])
+        remaining = {
+            model.__name__: model.count_documents({"post_id": post_id})
+            for model in POST_DEPENDENTS
+        }
+        results.append({"job": job, "post_id": post_id, "remaining": remaining})
+    return results
@@ -3,6 +3,7 @@ from typing import List, Optional
 
 from mongodb_odm import (
     ASCENDING,
+    DESCENDING,
     BaseModel,
     Document,
     Field,
@@ -12,14 +13,17 @@ from mongodb_odm import (
 )
 from pymongo import TEXT
 
-from app.user.models import User
+from app.base.db import ReadPolicyMixin, WriteConcernMixin
+from app.user.models import User, UserSnapshot
 
 
-class Topic(Document):
+class Topic(ReadPolicyMixin, Document):
     user_id: Optional[ODMObjectId] = None
     name: str = Field(max_length=127)
     slug: str = Field(...)
     description: Optional[str] = Field(default=None)
+    # Posts of the topic, the weight of the autocomplete.
+    total_post: int = Field(default=0)
 
     class ODMConfig(Document.ODMConfig):
         indexes = [
@@ -28,8 +32,18 @@ class Topic(Document):
         ]
 
 
-class Post(Document):
+class RelatedPost(BaseModel):
+    """Snapshot of a related post, see app.post.related"""
+
+    id: ODMObjectId = Field(...)
+    slug: str = Field(...)
+    title: str = Field(...)
+    score: float = Field(...)
+
+
+class Post(ReadPolicyMixin, WriteConcernMixin, Document):
     author_id: ODMObjectId = Field(...)
+    author_snapshot: Optional[UserSnapshot] = None
 
     title: str = Field(max_length=255)
     slug: str = Field(max_length=300)
@@ -39,10 +53,22 @@ class Post(Document):
     total_comment: int = Field(default=0)
     total_reaction: int = Field(default=0)
 
+    # Derived from the description on write, see app.post.processing
+    description_html: Optional[str] = None
+    excerpt: Optional[str] = None
+    word_count: int = Field(default=0)
+    reading_time: int = Field(default=0)
+
     publish_at: Optional[datetime] = None
+    # Flipped by the publish scheduler when publish_at passes.
+    is_published: bool = False
 
     topic_ids: List[ODMObjectId] = []
 
+    # Precomputed from the shared topics, None until computed (or topics changed).
+    related_posts: List[RelatedPost] = []
+    related_posts_at: Optional[datetime] = None
+
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
 
@@ -51,26 +77,52 @@ class Post(Document):
     class ODMConfig(Document.ODMConfig):
         indexes = [
             IndexModel([("slug", ASCENDING)], unique=True),
-            IndexModel([("author", ASCENDING)]),
-            IndexModel([("topics", ASCENDING)]),
+            IndexModel([("is_published", ASCENDING), ("_id", DESCENDING)]),
+            # Sort by publish_at or total_reaction (and the scheduler range query).
+            IndexModel(
+                [
+                    ("is_published", ASCENDING),
+                    ("publish_at", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+            IndexModel(
+                [
+                    ("is_published", ASCENDING),
+                    ("total_reaction", DESCENDING),
+                    ("_id", DESCENDING),
+                ]
+            ),
+            IndexModel([("author_id", ASCENDING)]),
+            IndexModel([("topic_ids", ASCENDING)]),
             IndexModel([("title", TEXT), ("short_description", TEXT)]),
+            # The posts written since the last refresh of the search index.
+            IndexModel([("updated_at", ASCENDING)]),
+            # The related posts to update when a post is deleted.
+            IndexModel([("related_posts.id", ASCENDING)]),
         ]
 
 
 class EmbeddedReply(BaseModel):
+    """Legacy reply embedded in the comment, see `Reply`."""
+
     id: ODMObjectId = Field(default_factory=ODMObjectId)
     user_id: ODMObjectId = Field(...)
+    user_snapshot: Optional[UserSnapshot] = None
     description: str = Field(...)
 
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
 
 
-class Comment(Document):
+class Comment(ReadPolicyMixin, WriteConcernMixin, Document):
     user_id: ODMObjectId = Field(...)
+    user_snapshot: Optional[UserSnapshot] = None
     post_id: ODMObjectId = Field(...)
 
-    replies: List[EmbeddedReply] = []
+    # Legacy embedded replies, moved to `Reply` by the `migrate-replies` command.
+    replies: Optional[List[EmbeddedReply]] = None
+    total_reply: int = Field(default=0)
     description: str = Field(...)
 
     created_at: datetime = Field(default_factory=datetime.now)
@@ -83,10 +135,32 @@ class Comment(Document):
         collection_name = "comment"
         indexes = [
             IndexModel([("post_id", ASCENDING)]),
+            IndexModel([("user_id", ASCENDING)]),
         ]
 
 
-class Reaction(Document):
+class Reply(ReadPolicyMixin, WriteConcernMixin, Document):
+    comment_id: ODMObjectId = Field(...)
+    post_id: ODMObjectId = Field(...)
+    user_id: ODMObjectId = Field(...)
+    user_snapshot: Optional[UserSnapshot] = None
+    description: str = Field(...)
+
+    created_at: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.now)
+
+    user: Optional[User] = Relationship(local_field="user_id")
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "reply"
+        indexes = [
+            IndexModel([("comment_id", ASCENDING), ("_id", ASCENDING)]),
+            IndexModel([("post_id", ASCENDING)]),
+            IndexModel([("user_id", ASCENDING)]),
+        ]
+
+
+class Reaction(WriteConcernMixin, Document):
     post_id: ODMObjectId = Field(...)
     user_ids: List[ODMObjectId] = []
 
@@ -97,3 +171,37 @@ class Reaction(Document):
         indexes = [
             IndexModel([("post_id", ASCENDING)]),
         ]
+
+
+class TrendingScore(Document):
+    """
+    Time-decayed engagement of a post.
+    `rank` is `log2(score)` moved to a fixed epoch, so the posts scored at
+    different times are comparable without decaying every document.
+    """
+
+    post_id: ODMObjectId = Field(...)
+    score: float = Field(default=0)
+    scored_at: datetime = Field(default_factory=datetime.now)
+    rank: float = Field(default=0)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "trending_score"
+        indexes = [
+            IndexModel([("post_id", ASCENDING)], unique=True),
+            IndexModel([("rank", DESCENDING)]),
+        ]
+
+
+class TrendingRanking(Document):
+    """Top-K trending posts, computed periodically from the scores."""
+
+    name: str = Field(...)
+    post_ids: List[ODMObjectId] = []
+    computed_at: datetime = Field(default_factory=datetime.now)
+
+    class ODMConfig(Document.ODMConfig):
+        collection_name = "trending_ranking"
+        indexes = [
+            IndexModel([("name", ASCENDING)], unique=True),
+        ]
@@ -0,0 +1,94 @@
+import html
+import logging
+import math
+import re
+from typing import Any, Dict, Optional
+
+from mongodb_odm import UpdateOne
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 300
+
+paragraph_split_regex = re.compile(r"\n\s*\n")
+whitespace_regex = re.compile(r"\s+")
+
+
+def render_description(description: str) -> str:
+    """
+    Render the plain text description to HTML.
+    Every paragraph is escaped, so the result is safe to embed as is.
+    """
+    paragraphs = []
+    for paragraph in paragraph_split_regex.split(description.strip()):
+        if not paragraph.strip():
+            continue
+        lines = [html.escape(line.strip()) for line in paragraph.strip().splitlines()]
+        paragraphs.append(f"<p>{'<br>'.join(lines)}</p>")
+    return "\n".join(paragraphs)
+
+
+def get_excerpt(text: str, length: int = EXCERPT_LENGTH) -> str:
+    if len(text) <= length:
+        return text
+    excerpt = text[:length].rsplit(" ", 1)[0]
+    return f"{excerpt}..."
+
+
+def get_derived_fields(description: Optional[str]) -> Dict[str, Any]:
+    """
+    Fields that are derived from the description.
+    Compute them once on write so that the readers don't have to.
+    """
+    if not description:
+        return {
+            "description_html": None,
+            "excerpt": None,
+            "word_count": 0,
+            "reading_time": 0,
+        }
+    plain_text = whitespace_regex.sub(" ", description).strip()
+    word_count = len(plain_text.split())
+    return {
+        "description_html": render_description(description),
+        "excerpt": get_excerpt(plain_text),
+        "word_count": word_count,
+        "reading_time": math.ceil(word_count / WORDS_PER_MINUTE),
+    }
+
+
+def backfill_derived_fields(batch_size: int = 500, reprocess: bool = False) -> int:
+    """
+    Process the existing posts in batches of `batch_size`.
+    Only the posts without derived fields are processed unless `reprocess` is True.
+    """
+    filter: Dict[str, Any] = {} if reprocess else {"word_count": {"$exists": False}}
+    total = 0
+    last_id = None
+    while True:
+        batch_filter = {**filter}
+        if last_id:
+            batch_filter["_id"] = {"$gt": last_id}
+        write_posts = []
+        for post in Post.find_raw(
+            batch_filter,
+            projection={"description": 1},
+            sort=[("_id", 1)],
+            limit=batch_size,
+        ):
+            last_id = post["_id"]
+            write_posts.append(
+                UpdateOne(
+                    {"_id": post["_id"]},
+                    {"$set": get_derived_fields(post.get("description"))},
+                )
+            )
+        if not write_posts:
+            break
+        Post.bulk_write(requests=write_posts, ordered=False)
+        total += len(write_posts)
+        logger.info(f"{total} post processed")
+    return total
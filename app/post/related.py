@@ -0,0 +1,332 @@
+import heapq
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from mongodb_odm import ASCENDING, UpdateOne
+
+from app.base import config
+from app.base.db import RELAXED, write_concern
+from app.base.jobs import Job, JobStatus, enqueue, job_handler
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+RELATED_POSTS_JOB = "related_posts"
+RELATED_POSTS_PROJECTION = {
+    "topic_ids": 1,
+    "slug": 1,
+    "title": 1,
+    "related_posts_at": 1,
+}
+WRITE_BATCH_SIZE = 1000
+
+# (score, post number) best first, newer posts first on equal scores.
+Scored = List[Tuple[float, int]]
+
+
+class RelatedScores(NamedTuple):
+    # Target -> its related posts.
+    by_target: Dict[int, Scored]
+    # Other post -> the best targets, they may enter its related posts.
+    by_post: Dict[int, Scored]
+
+
+def get_topic_weights(post_topics: List[List[Any]]) -> Dict[Any, float]:
+    """A topic shared by fewer posts says more (inverse document frequency)."""
+    counts: Dict[Any, int] = {}
+    for topics in post_topics:
+        for topic in set(topics):
+            counts[topic] = counts.get(topic, 0) + 1
+    return {
+        topic: math.log(1 + len(post_topics) / count) for topic, count in counts.items()
+    }
+
+
+def get_squared_weights(weights: Dict[Any, float], similarity: str) -> Dict[Any, float]:
+    """
+    The product of the vectors of two posts is the sum of these values over
+    the shared topics: the weighted intersection for `jaccard` (vectors of
+    sqrt(weight)), the dot product for `cosine` (vectors of weight).
+    """
+    if similarity == "jaccard":
+        return weights
+    if similarity == "cosine":
+        return {topic: weight**2 for topic, weight in weights.items()}
+    raise ValueError(f"Unknown similarity '{similarity}'")
+
+
+def get_score(common: Any, size: Any, other_size: Any, similarity: str) -> Any:
+    """Work on floats and on NumPy arrays."""
+    if similarity == "jaccard":
+        return common / (size + other_size - common)
+    return common / (size * other_size) ** 0.5
+
+
+def compute_related(
+    post_topics: List[List[Any]],
+    targets: List[int],
+    k: int,
+    similarity: str,
+    batch_size: int,
+) -> RelatedScores:
+    """The top-K related posts of the targets, by the topics of all the posts."""
+    squared = get_squared_weights(get_topic_weights(post_topics), similarity)
+    try:
+        # Imported by the job only, not at worker startup.
+        from scipy import sparse  # noqa: F401
+    except ImportError:  # pragma: no cover
+        return _compute_python(post_topics, targets, k, similarity, squared)
+    return _compute_sparse(post_topics, targets, k, similarity, squared, batch_size)
+
+
+def _compute_python(
+    post_topics: List[List[Any]],
+    targets: List[int],
+    k: int,
+    similarity: str,
+    squared: Dict[Any, float],
+) -> RelatedScores:
+    posts_by_topic: Dict[Any, List[int]] = {}
+    for i, topics in enumerate(post_topics):
+        for topic in set(topics):
+            posts_by_topic.setdefault(topic, []).append(i)
+    sizes = [sum(squared[topic] for topic in set(topics)) for topics in post_topics]
+
+    target_set = set(targets)
+    by_target: Dict[int, Scored] = {}
+    by_post: Dict[int, Scored] = {}
+    for i in targets:
+        common: Dict[int, float] = {}
+        for topic in set(post_topics[i]):
+            for j in posts_by_topic[topic]:
+                if j != i:
+                    common[j] = common.get(j, 0) + squared[topic]
+        scores = [
+            (get_score(value, sizes[i], sizes[j], similarity), j)
+            for j, value in common.items()
+        ]
+        by_target[i] = heapq.nlargest(k, scores)
+        for score, j in scores:
+            if j not in target_set:
+                by_post.setdefault(j, []).append((score, i))
+    return RelatedScores(
+        by_target=by_target,
+        by_post={j: heapq.nlargest(k, scores) for j, scores in by_post.items()},
+    )
+
+
+def _top_k(groups: Any, others: Any, scores: Any, k: int) -> Dict[int, Scored]:
+    """The k best (score, other) of every group, of the same length arrays."""
+    import numpy as np
+
+    if not len(groups):
+        return {}
+    order = np.lexsort((-others, -scores, groups))
+    groups, others, scores = groups[order], others[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ranks = np.arange(len(groups)) - np.repeat(
+        starts, np.diff(np.r_[starts, len(groups)])
+    )
+    keep = ranks < k
+
+    results: Dict[int, Scored] = {}
+    for group, score, other in zip(
+        groups[keep].tolist(), scores[keep].tolist(), others[keep].tolist()
+    ):
+        results.setdefault(group, []).append((score, other))
+    return results
+
+
+def _compute_sparse(
+    post_topics: List[List[Any]],
+    targets: List[int],
+    k: int,
+    similarity: str,
+    squared: Dict[Any, float],
+    batch_size: int,
+) -> RelatedScores:
+    """
+    Sparse post x topic matrix X, the shared weights of a batch of targets
+    and every post are the sparse product X[batch] @ X.T.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    topic_numbers = {topic: i for i, topic in enumerate(squared)}
+    rows, columns, values = [], [], []
+    for i, topics in enumerate(post_topics):
+        for topic in set(topics):
+            rows.append(i)
+            columns.append(topic_numbers[topic])
+            values.append(squared[topic] ** 0.5)
+    matrix = sparse.csr_matrix(
+        (values, (rows, columns)), shape=(len(post_topics), len(topic_numbers))
+    )
+    transposed = matrix.T.tocsc()
+    sizes = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel()
+    is_target = np.zeros(len(post_topics), dtype=bool)
+    is_target[targets] = True
+
+    by_target: Dict[int, Scored] = {i: [] for i in targets}
+    by_post: Dict[int, Scored] = {}
+    for start in range(0, len(targets), batch_size):
+        batch = np.asarray(targets[start : start + batch_size])
+        common = (matrix[batch] @ transposed).tocoo()
+        posts, others = batch[common.row], common.col
+        keep = posts != others
+        posts, others, common_values = posts[keep], others[keep], common.data[keep]
+        scores = get_score(common_values, sizes[posts], sizes[others], similarity)
+
+        by_target.update(_top_k(posts, others, scores, k))
+        reverse = ~is_target[others]
+        for j, items in _top_k(
+            others[reverse], posts[reverse], scores[reverse], k
+        ).items():
+            by_post.setdefault(j, []).extend(items)
+    return RelatedScores(
+        by_target=by_target,
+        by_post={j: heapq.nlargest(k, scores) for j, scores in by_post.items()},
+    )
+
+
+def update_related_posts(full: bool = False) -> int:
+    """
+    Compute the related posts of the published posts that have none yet (or
+    changed their topics), every post with `full`. The other posts get the new
+    ones if they score better than their current related posts, the weights of
+    the topics drift with time, `full` recomputes all of them.
+    """
+    posts = list(
+        Post.find_raw(
+            {"is_published": True},
+            projection=RELATED_POSTS_PROJECTION,
+            sort=[("_id", ASCENDING)],
+        )
+    )
+    targets = [
+        i
+        for i, post in enumerate(posts)
+        if full or post.get("related_posts_at") is None
+    ]
+    if not targets:
+        return 0
+    k = config.RELATED_POSTS_COUNT
+    scores = compute_related(
+        [post.get("topic_ids", []) for post in posts],
+        targets,
+        k=k,
+        similarity=config.RELATED_POSTS_SIMILARITY,
+        batch_size=config.RELATED_POSTS_BATCH_SIZE,
+    )
+
+    def get_snapshot(score: float, j: int) -> Dict[str, Any]:
+        post = posts[j]
+        return {
+            "id": post["_id"],
+            "slug": post["slug"],
+            "title": post["title"],
+            "score": score,
+        }
+
+    now = datetime.now()
+    requests = [
+        UpdateOne(
+            # Skip the post if its topics changed meanwhile, the next run does it.
+            {"_id": posts[i]["_id"], "topic_ids": posts[i].get("topic_ids", [])},
+            {
+                "$set": {
+                    "related_posts": [
+                        get_snapshot(*item) for item in scores.by_target[i]
+                    ],
+                    "related_posts_at": now,
+                }
+            },
+        )
+        for i in targets
+    ]
+
+    target_ids = {posts[i]["_id"] for i in targets}
+    post_numbers = {posts[j]["_id"]: j for j in scores.by_post}
+    ids = list(post_numbers)
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        for post in Post.find_raw(
+            {"_id": {"$in": ids[start : start + WRITE_BATCH_SIZE]}},
+            projection={"related_posts": 1},
+        ):
+            current = post.get("related_posts", [])
+            related = heapq.nlargest(
+                k,
+                [item for item in current if item["id"] not in target_ids]
+                + [
+                    get_snapshot(*item)
+                    for item in scores.by_post[post_numbers[post["_id"]]]
+                ],
+                key=lambda item: (item["score"], item["id"]),
+            )
+            if related != current:
+                requests.append(
+                    UpdateOne(
+                        {"_id": post["_id"]},
+                        {"$set": {"related_posts": related, "related_posts_at": now}},
+                    )
+                )
+
+    with write_concern(RELAXED):
+        for start in range(0, len(requests), WRITE_BATCH_SIZE):
+            Post.bulk_write(
+                requests=requests[start : start + WRITE_BATCH_SIZE], ordered=False
+            )
+    logger.info(f"Related posts of {len(targets)} post computed")
+    return len(targets)
+
+
+@job_handler(RELATED_POSTS_JOB)
+def related_posts_job(payload: Dict[str, Any]) -> None:
+    update_related_posts()
+
+
+def enqueue_related_posts(published_at: Optional[datetime] = None) -> None:
+    """
+    Compute the related posts a little after the publication, so that the
+    posts published meanwhile share the job. A pending job in this window
+    already does it.
+    """
+    published_at = max(published_at or datetime.now(), datetime.now())
+    run_at = published_at + timedelta(seconds=config.RELATED_POSTS_DELAY)
+    if not Job.exists(
+        {
+            "name": RELATED_POSTS_JOB,
+            "status": JobStatus.PENDING,
+            "run_at": {"$gte": published_at, "$lte": run_at},
+        }
+    ):
+        enqueue(RELATED_POSTS_JOB, {}, run_at=run_at)
+
+
+def refresh_referencing_posts(post_id: Any, remove: bool = False) -> int:
+    """
+    The posts listing `post_id` compute their related posts again after it was
+    renamed, unpublished (`remove`) or deleted (`remove`). A removed post is
+    pulled at once, the new `related_posts_at` changes the ETag of the posts.
+    """
+    update: Dict[str, Any] = {"$set": {"related_posts_at": None}}
+    if remove:
+        update["$pull"] = {"related_posts": {"id": post_id}}
+    total = Post.update_many({"related_posts.id": post_id}, update).modified_count
+    if total:
+        enqueue_related_posts()
+    return total
+
+
+def refresh_after_update(post: Post, title: str, was_published: bool) -> None:
+    """
+    The related posts of a post with new topics, and the snapshots of a
+    renamed or unpublished post in the related posts of the other posts.
+    """
+    if post.related_posts_at is None and post.publish_at:
+        enqueue_related_posts(post.publish_at)
+    if was_published and (post.title != title or not post.is_published):
+        refresh_referencing_posts(post.id, remove=not post.is_published)
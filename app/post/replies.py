@@ -0,0 +1,133 @@
+import logging
+from typing import Any, Dict, List
+
+from mongodb_odm import ASCENDING, UpdateOne
+
+from app.user.profiles import profile_cache
+
+from .models import Comment, Reply
+from .schemas.comments import ReplyOut
+
+logger = logging.getLogger(__name__)
+
+
+def get_reply_results(replies: List[Reply]) -> List[Dict[str, Any]]:
+    # Only the replies written before the user snapshot need the user lookup.
+    users = profile_cache.get_many(
+        reply.user_id for reply in replies if not reply.user_snapshot
+    )
+
+    results = []
+    for reply in replies:
+        reply_dict = reply.model_dump()
+        reply_dict["user"] = reply_dict["user_snapshot"] or users.get(reply.user_id)
+        results.append(ReplyOut(**reply_dict).model_dump())
+    return results
+
+
+def get_reply_previews(
+    comments: List[Dict[str, Any]], size: int
+) -> Dict[Any, List[Dict[str, Any]]]:
+    """
+    The first `size` replies of every raw comment, one query for the page.
+    The $lookup reads at most `size` replies of a comment on the
+    (comment_id, _id) index. Comments must be loaded with `total_reply`.
+    """
+    comment_ids = [comment["_id"] for comment in comments if comment.get("total_reply")]
+    if not comment_ids:
+        return {}
+    return {
+        comment["_id"]: get_reply_results(
+            [Reply(**reply) for reply in comment["replies"]]
+        )
+        for comment in Comment.aggregate(
+            [
+                {"$match": {"_id": {"$in": comment_ids}}},
+                {"$project": {"_id": 1}},
+                {
+                    "$lookup": {
+                        "from": Reply._get_collection_name(),
+                        "localField": "_id",
+                        "foreignField": "comment_id",
+                        "pipeline": [{"$sort": {"_id": ASCENDING}}, {"$limit": size}],
+                        "as": "replies",
+                    }
+                },
+            ],
+            get_raw=True,
+        )
+    }
+
+
+def count_replies(comment_ids: List[Any]) -> Dict[Any, int]:
+    return {
+        group["_id"]: group["count"]
+        for group in Reply.aggregate(
+            [
+                {"$match": {"comment_id": {"$in": comment_ids}}},
+                {"$group": {"_id": "$comment_id", "count": {"$sum": 1}}},
+            ],
+            get_raw=True,
+        )
+    }
+
+
+def migrate_embedded_replies(batch_size: int = 500) -> int:
+    """
+    Move the replies embedded in the comments to the `reply` collection.
+    Replies keep their id, so running it again after a crash is safe.
+    """
+    total = 0
+    last_id = None
+    while True:
+        filter: Dict[str, Any] = {"replies": {"$exists": True, "$ne": None}}
+        if last_id:
+            filter["_id"] = {"$gt": last_id}
+        comments = list(
+            Comment.find_raw(
+                filter,
+                projection={"post_id": 1, "replies": 1},
+                sort=[("_id", 1)],
+                limit=batch_size,
+            )
+        )
+        if not comments:
+            return total
+        last_id = comments[-1]["_id"]
+
+        write_replies = []
+        for comment in comments:
+            for reply in comment["replies"]:
+                reply_data = {key: value for key, value in reply.items() if key != "id"}
+                write_replies.append(
+                    UpdateOne(
+                        {"_id": reply["id"]},
+                        {
+                            "$setOnInsert": {
+                                **reply_data,
+                                "comment_id": comment["_id"],
+                                "post_id": comment["post_id"],
+                            }
+                        },
+                        upsert=True,
+                    )
+                )
+        if write_replies:
+            Reply.bulk_write(requests=write_replies, ordered=False)
+
+        counts = count_replies([comment["_id"] for comment in comments])
+        Comment.bulk_write(
+            requests=[
+                UpdateOne(
+                    {"_id": comment["_id"]},
+                    {
+                        "$set": {"total_reply": counts.get(comment["_id"], 0)},
+                        "$unset": {"replies": ""},
+                    },
+                )
+                for comment in comments
+            ],
+            ordered=False,
+        )
+        total += len(write_replies)
+        logger.info(f"{total} reply migrated")
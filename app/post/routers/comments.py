@@ -1,25 +1,44 @@
 import logging
-from typing import Any, Optional
+from datetime import datetime
+from typing import Any, Dict
 
-from bson import ObjectId
 from flask import Blueprint, Response, g, request
 from mongodb_odm import ObjectIdStr, ODMObjectId
 
+from app.base import config
+from app.base.db import RELAXED, read_policy, write_concern
 from app.base.utils import parse_json
-from app.base.utils.query import get_object_or_404
-from app.base.utils.response import ExType, custom_response, http_exception
+from app.base.utils.fields import (
+    FieldSources,
+    dump_fields,
+    get_projection,
+    get_requested_fields,
+)
+from app.base.utils.pagination import get_page_data, paginate
+from app.base.utils.query import get_object_or_404, get_raw_or_404
+from app.base.utils.response import (
+    ExType,
+    custom_response,
+    http_exception,
+    make_etag,
+    not_modified_response,
+)
 from app.user.auth import Auth
-from app.user.models import User
+from app.user.models import User, UserSnapshot
+from app.user.profiles import profile_cache
 
-from ..models import Comment, EmbeddedReply, Post
+from ..models import Comment, Post, Reply
+from ..replies import get_reply_previews, get_reply_results
 from ..schemas.comments import CommentIn, CommentOut, ReplyIn, ReplyOut
+from ..trending import trending_engine
 
 logger = logging.getLogger(__name__)
 router = Blueprint("comments", __name__, url_prefix="/api/v1")
 
 
 def update_total_comment(post_id: Any, val: int) -> None:
-    Post.update_one({"_id": ODMObjectId(post_id)}, {"$inc": {"total_comment": val}})
+    with write_concern(RELAXED):
+        Post.update_one({"_id": ODMObjectId(post_id)}, {"$inc": {"total_comment": val}})
 
 
 @router.post("/posts/<string:slug>/comments")
@@ -29,52 +48,91 @@ def create_comments(slug: str) -> Response:
     comment_data = parse_json(CommentIn)
 
     post = get_object_or_404(Post, filter={"slug": slug})
-    comment = Comment(
-        user_id=user.id,
-        post_id=post.id,
-        description=comment_data.description,
-    ).create()
+    with write_concern(RELAXED):
+        comment = Comment(
+            user_id=user.id,
+            user_snapshot=UserSnapshot.from_user(user),
+            post_id=post.id,
+            description=comment_data.description,
+        ).create()
     # increase total comment for post
     update_total_comment(post.id, 1)
+    trending_engine.record(post.id, config.TRENDING_COMMENT_WEIGHT)
 
     comment.user = user
 
     return custom_response(CommentOut(**comment.model_dump()).model_dump(), 201)
 
 
+# Output fields that are not stored under the same name.
+COMMENT_FIELD_SOURCES: FieldSources = {
+    "id": ["_id"],
+    "user": ["user_snapshot", "user_id"],
+    "replies": ["total_reply"],
+}
+
+
 @router.get("/posts/<string:slug>/comments")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
 @Auth.auth_optional
 def get_comments(slug: str) -> Response:
-    after: Optional[str] = request.args.get("after", None)
-    limit = int(request.args.get("limit", 20))
-
-    post = get_object_or_404(Post, filter={"slug": slug})
-    filter = {"post_id": post.id}
-    if after:
-        filter["_id"] = {"$lt": ObjectId(after)}
-
-    comment_qs = Comment.find(filter, sort=(("_id", -1),), limit=limit)
-    # Load related user only
-    comments = Comment.load_related(comment_qs, fields=["user"])
-
-    user_ids = list(
-        {replies.user_id for comment in comments for replies in comment.replies}
+    # Every comment of the page loads its reply previews.
+    limit = min(int(request.args.get("limit", 20)), 100)
+
+    fields = get_requested_fields(CommentOut)
+
+    post = get_raw_or_404(Post, filter={"slug": slug}, projection={"_id": 1})
+    filter = {"post_id": post["_id"]}
+    sort = [("_id", -1)]
+
+    # Any new, deleted or updated comment (or reply) on the page changes the ETag.
+    etag_page = paginate(Comment, filter, sort, limit, projection={"updated_at": 1})
+    etag = make_etag(
+        post["_id"],
+        sorted(fields) if fields else None,
+        etag_page.before,
+        etag_page.after,
+        *((comment["_id"], comment.get("updated_at")) for comment in etag_page.items),
+    )
+    not_modified = not_modified_response(etag)
+    if not_modified:
+        return not_modified
+
+    projection = get_projection(fields, COMMENT_FIELD_SOURCES) if fields else None
+    page = paginate(Comment, filter, sort, limit, projection=projection)
+    comments = page.items
+    with_user = fields is None or "user" in fields
+    with_replies = fields is None or "replies" in fields
+    # Only the documents written before the user snapshot need the user lookup.
+    users = (
+        profile_cache.get_many(
+            comment["user_id"]
+            for comment in comments
+            if not comment.get("user_snapshot")
+        )
+        if with_user
+        else {}
+    )
+    previews = (
+        get_reply_previews(comments, config.COMMENT_REPLY_PREVIEW_SIZE)
+        if with_replies
+        else {}
     )
-    users_dict = {user.id: user for user in User.find({"_id": {"$in": user_ids}})}
 
     results = []
-    next_cursor = None
     for comment in comments:
-        next_cursor = comment.id
-        comment_dict = comment.model_dump()
-        for reply in comment_dict["replies"]:
-            # Assign child replies
-            reply["user"] = users_dict.get(reply["user_id"])
-        results.append(CommentOut(**comment_dict).model_dump())
+        comment_dict = {**comment, "id": comment["_id"]}
+        if with_user:
+            comment_dict["user"] = comment.get("user_snapshot") or users.get(
+                comment["user_id"]
+            )
+        if with_replies:
+            comment_dict["replies"] = previews.get(comment["_id"], [])
+        results.append(dump_fields(CommentOut, comment_dict, fields))
 
-    next_cursor = next_cursor if len(results) == limit else None
-
-    return custom_response({"after": ObjectIdStr(next_cursor), "results": results}, 200)
+    # The approximate total is not part of the ETag.
+    data = get_page_data(page, results, Comment, filter)
+    return custom_response(data, 200, etag=None if "total" in data else etag)
 
 
 @router.put("/posts/<string:slug>/comments/<string:comment_id>")
@@ -122,12 +180,43 @@ def delete_comments(slug: str, comment_id: ObjectIdStr) -> Response:
         )
 
     comment.delete()
+    Reply.delete_many({"comment_id": comment.id})
     # decrease total comment for post
     update_total_comment(post.id, -1)
+    trending_engine.record(post.id, -config.TRENDING_COMMENT_WEIGHT)
 
     return custom_response({"message": "Deleted"}, 200)
 
 
+def update_total_reply(comment_id: Any, val: int) -> None:
+    # updated_at changes the ETag of the comment page.
+    with write_concern(RELAXED):
+        Comment.update_one(
+            {"_id": comment_id},
+            {"$inc": {"total_reply": val}, "$set": {"updated_at": datetime.now()}},
+        )
+
+
+@router.get("/posts/<string:slug>/comments/<string:comment_id>/replies")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
+def get_replies(slug: str, comment_id: ObjectIdStr) -> Response:
+    limit = int(request.args.get("limit", 20))
+
+    post = get_raw_or_404(Post, filter={"slug": slug}, projection={"_id": 1})
+    comment = get_raw_or_404(
+        Comment,
+        filter={"_id": ODMObjectId(comment_id), "post_id": post["_id"]},
+        projection={"_id": 1},
+    )
+    # Oldest first, like the replies returned with the comments.
+    filter: Dict[str, Any] = {"comment_id": comment["_id"]}
+
+    page = paginate(Reply, filter, [("_id", 1)], limit)
+    results = get_reply_results([Reply(**reply) for reply in page.items])
+
+    return custom_response(get_page_data(page, results, Reply, filter), 200)
+
+
 @router.post(
     "/posts/<string:slug>/comments/<string:comment_id>/replies",
 )
@@ -144,20 +233,19 @@ def create_replies(slug: str, comment_id: ObjectIdStr) -> Response:
             "post_id": post.id,
         },
     )
-    if len(comment.replies) >= 100:
-        raise http_exception(
-            status=400,
-            code=ExType.VALIDATION_ERROR,
-            detail="Comment should have less then 100 comment.",
-        )
 
-    reply_dict = EmbeddedReply(
-        id=ODMObjectId(), user_id=user.id, description=reply_data.description
-    ).model_dump()
-    comment.update(raw={"$push": {"replies": reply_dict}})
+    with write_concern(RELAXED):
+        reply = Reply(
+            comment_id=comment.id,
+            post_id=post.id,
+            user_id=user.id,
+            user_snapshot=UserSnapshot.from_user(user),
+            description=reply_data.description,
+        ).create()
+    update_total_reply(comment.id, 1)
 
-    reply_dict["user"] = user.model_dump()
-    reply_out = ReplyOut(**reply_dict)
+    reply.user = user
+    reply_out = ReplyOut(**reply.model_dump())
 
     return custom_response(reply_out.model_dump(), 201)
 
@@ -173,24 +261,30 @@ def update_replies(
     reply_data = parse_json(ReplyIn)
 
     post = get_object_or_404(Post, filter={"slug": slug})
-    r_id = ODMObjectId(reply_id)
-    update_comment = Comment.update_one(
+    c_id = ODMObjectId(comment_id)
+    update_reply = Reply.update_one(
         {
-            "_id": ODMObjectId(comment_id),
+            "_id": ODMObjectId(reply_id),
+            "comment_id": c_id,
             "post_id": post.id,
-            "replies.id": r_id,
-            "replies.user_id": user.id,
+            "user_id": user.id,
+        },
+        {
+            "$set": {
+                "description": reply_data.description,
+                "updated_at": datetime.now(),
+            }
         },
-        {"$set": {"replies.$[reply].description": reply_data.description}},
-        array_filters=[{"reply.id": r_id}],
     )
 
-    if update_comment.modified_count != 1:
+    if update_reply.modified_count != 1:
         raise http_exception(
             status=403,
             code=ExType.PERMISSION_ERROR,
             detail="You don't have permission to update this replies",
         )
+    # The reply may be shown on the comment page.
+    Comment.update_one({"_id": c_id}, {"$set": {"updated_at": datetime.now()}})
 
     return custom_response({"message": "Updated"}, 200)
 
@@ -205,32 +299,21 @@ def delete_replies(
     user: User = g.user
 
     post = get_object_or_404(Post, filter={"slug": slug})
-    r_id = ODMObjectId(reply_id)
-    update_comment = Comment.update_one(
+    c_id = ODMObjectId(comment_id)
+    delete_reply = Reply.delete_one(
         {
-            "_id": ODMObjectId(comment_id),
+            "_id": ODMObjectId(reply_id),
+            "comment_id": c_id,
             "post_id": post.id,
-            "replies": {
-                "$elemMatch": {
-                    "id": r_id,
-                    "user_id": user.id,
-                }
-            },
-        },
-        {
-            "$pull": {
-                "replies": {
-                    "id": r_id,
-                    "user_id": user.id,
-                },
-            }
-        },
+            "user_id": user.id,
+        }
     )
-    if update_comment.modified_count != 1:
+    if delete_reply.deleted_count != 1:
         raise http_exception(
             status=403,
             code=ExType.PERMISSION_ERROR,
             detail="You don't have permission to delete this replies",
         )
+    update_total_reply(c_id, -1)
 
     return custom_response({"message": "Deleted"}, 200)
@@ -1,21 +1,61 @@
 import logging
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 from bson import ObjectId
-from flask import Blueprint, Response, g, request
-from mongodb_odm import ObjectIdStr, ODMObjectId
+from flask import Blueprint, Response, g, json, request
+from mongodb_odm import ObjectIdStr
 from slugify import slugify
 
+from app.base import config
+from app.base.db import (
+    DURABLE,
+    RELAXED,
+    read_own_writes,
+    read_policy,
+    write_concern,
+)
+from app.base.singleflight import SingleFlight
 from app.base.utils import parse_json, update_partially
-from app.base.utils.query import get_object_or_404
-from app.base.utils.response import ExType, custom_response, http_exception
+from app.base.utils.fields import (
+    FieldSources,
+    dump_fields,
+    get_projection,
+    get_requested_fields,
+)
+from app.base.utils.pagination import (
+    Sort,
+    decode_cursor,
+    encode_cursor,
+    get_page_data,
+    paginate,
+)
+from app.base.utils.query import get_object_or_404, get_raw_or_404
+from app.base.utils.response import (
+    ExType,
+    custom_response,
+    http_exception,
+    make_etag,
+    not_modified_response,
+    raw_response,
+)
 from app.base.utils.string import rand_slug_str
+from app.feed.fanout import enqueue_fanout
 from app.user.auth import Auth
-from app.user.models import User
-
-from ..models import Comment, Post, Reaction, Topic
+from app.user.models import User, UserSnapshot
+from app.user.profiles import profile_cache
+
+from ..deletion import enqueue_post_deletion
+from ..models import Post, Topic
+from ..processing import get_derived_fields
+from ..related import (
+    enqueue_related_posts,
+    refresh_after_update,
+    refresh_referencing_posts,
+)
+from ..scheduler import publish_scheduler
 from ..schemas.posts import (
+    PostBatchGetIn,
     PostCreate,
     PostDetailsOut,
     PostListOut,
@@ -24,6 +64,9 @@ from ..schemas.posts import (
     TopicIn,
     TopicOut,
 )
+from ..search import search_index
+from ..topics import topic_registry
+from ..trending import trending_engine
 
 logger = logging.getLogger(__name__)
 router = Blueprint("posts", __name__, url_prefix="/api/v1")
@@ -35,20 +78,20 @@ def get_or_create_topic(
     user_id = user.id if user else None
     try:
         topic = Topic.get({"name": topic_name})
+        topic_registry.add(topic)
         return topic, False
     except Exception:
         pass
     slug = slugify(topic_name)
     for i in range(3, 20):
         try:
-            return (
-                Topic(
-                    name=topic_name,
-                    slug=f"{slug}-{rand_slug_str(i)}",
-                    user_id=user_id,
-                ).create(),
-                True,
-            )
+            topic = Topic(
+                name=topic_name,
+                slug=f"{slug}-{rand_slug_str(i)}",
+                user_id=user_id,
+            ).create()
+            topic_registry.add(topic)
+            return topic, True
         except Exception:
             pass
     raise Exception("Unable to create the Topic")
@@ -65,31 +108,48 @@ def create_topics() -> Response:
     return custom_response(TopicOut(**topic.model_dump()).model_dump(), 201)
 
 
+@router.get("/topics/suggest")
+def suggest_topics() -> Response:
+    prefix = request.args.get("prefix", "")
+    limit = min(int(request.args.get("limit", 10)), 50)
+
+    results = [
+        TopicOut(name=entry.name, slug=entry.slug).model_dump()
+        for entry in topic_registry.suggest(prefix, limit)
+    ]
+    response = custom_response({"results": results}, 200)
+    # Every keystroke is a request, let the client keep them a little.
+    response.cache_control.max_age = config.TOPIC_SUGGEST_CACHE_MAX_AGE
+    return response
+
+
 @router.get("/topics")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
 @Auth.auth_optional
 def get_topics() -> Response:
-    after: Optional[str] = request.args.get("after", None)
     limit = int(request.args.get("limit", 20))
     q = request.args.get("q")
 
     filter: Dict[str, Any] = {}
     if q:
         filter["$text"] = {"$search": q}
-    if after:
-        filter["_id"] = {"$lt": ObjectId(after)}
 
-    sort = [("_id", -1)]
+    fields = get_requested_fields(TopicOut)
+    projection = get_projection(fields, {}) if fields else None
 
-    results = []
-    next_cursor = None
-    topic_qs = Topic.find(filter=filter, sort=sort, limit=limit)
-    for topic in topic_qs:
-        next_cursor = topic.id
-        results.append(TopicOut(**topic.model_dump()).model_dump())
+    page = paginate(Topic, filter, [("_id", -1)], limit, projection=projection)
+    results = [dump_fields(TopicOut, topic, fields) for topic in page.items]
+
+    return custom_response(get_page_data(page, results, Topic, filter), 200)
 
-    next_cursor = next_cursor if len(results) == limit else None
 
-    return custom_response({"after": ObjectIdStr(next_cursor), "results": results}, 200)
+def update_total_post(topic_ids: Iterable[Any], val: int) -> None:
+    topic_ids = list(topic_ids)
+    if not topic_ids:
+        return
+    with write_concern(RELAXED):
+        Topic.update_many({"_id": {"$in": topic_ids}}, {"$inc": {"total_post": val}})
+    topic_registry.add_weight(topic_ids, val)
 
 
 def get_short_description(description: Optional[str]) -> str:
@@ -107,6 +167,19 @@ def get_or_create_post_topics(topics_name: List[str], user: User) -> List[Topic]
     return topics
 
 
+def is_published_now(publish_at: Optional[datetime]) -> bool:
+    return publish_at is not None and publish_at <= datetime.now()
+
+
+def schedule_publication(post: Post, fanout: bool = True) -> None:
+    if not post.publish_at:
+        return
+    if fanout:
+        enqueue_fanout(post.id)
+    if not post.is_published:
+        publish_scheduler.schedule(post.id, post.publish_at)
+
+
 @router.post("/posts")
 @Auth.auth_required
 def create_posts() -> Response:
@@ -130,16 +203,20 @@ def create_posts() -> Response:
     if post_data.publish_now:
         post_data.publish_at = datetime.now()
 
-    post = Post(
-        author_id=user.id,
-        slug=str(ObjectId()),
-        title=post_data.title,
-        short_description=short_description,
-        description=post_data.description,
-        cover_image=post_data.cover_image,
-        publish_at=post_data.publish_at,
-        topic_ids=[topic.id for topic in topics],
-    ).create()
+    with write_concern(DURABLE):
+        post = Post(
+            author_id=user.id,
+            author_snapshot=UserSnapshot.from_user(user),
+            slug=str(ObjectId()),
+            title=post_data.title,
+            short_description=short_description,
+            description=post_data.description,
+            cover_image=post_data.cover_image,
+            publish_at=post_data.publish_at,
+            is_published=is_published_now(post_data.publish_at),
+            topic_ids=[topic.id for topic in topics],
+            **get_derived_fields(post_data.description),
+        ).create()
 
     is_slug_saved = False
     slug = slugify(post.title)
@@ -160,92 +237,364 @@ def create_posts() -> Response:
             code=ExType.VALIDATION_ERROR,
             field="title",
         )
+    schedule_publication(post)
+    if post.publish_at:
+        enqueue_related_posts(post.publish_at)
+    update_total_post(post.topic_ids, 1)
+    search_index.add_post(post)
     post.topics = topics
     return custom_response(PostOut(**post.model_dump()).model_dump(), 201)
 
 
+# Output fields that are not stored under the same name.
+POST_FIELD_SOURCES: FieldSources = {
+    "author": ["author_snapshot", "author_id"],
+    "topics": ["topic_ids"],
+}
+
+
+def get_post_list_projection(fields: Optional[FrozenSet[str]]) -> Dict[str, Any]:
+    if fields is None:
+        return {"description": 0, "description_html": 0}
+    return get_projection(fields, POST_FIELD_SOURCES)
+
+
+def get_post_list_results(
+    posts: List[Dict[str, Any]], fields: Optional[FrozenSet[str]] = None
+) -> List[Dict[str, Any]]:
+    """Build the `PostListOut` of raw posts, loaded with `get_post_list_projection`."""
+    with_author = fields is None or "author" in fields
+    # Only the posts written before the author snapshot need the user lookup.
+    authors = (
+        profile_cache.get_many(
+            post["author_id"] for post in posts if not post.get("author_snapshot")
+        )
+        if with_author
+        else {}
+    )
+
+    results = []
+    for post in posts:
+        post_dict = {**post}
+        if with_author:
+            post_dict["author"] = post.get("author_snapshot") or authors.get(
+                post["author_id"]
+            )
+        results.append(dump_fields(PostListOut, post_dict, fields))
+    return results
+
+
+# The `sort` query parameter, newest first by default.
+POST_SORTS: Dict[str, Sort] = {
+    "latest": [("_id", -1)],
+    "publish_at": [("publish_at", -1), ("_id", -1)],
+    "total_reaction": [("total_reaction", -1), ("_id", -1)],
+}
+
+
+def get_post_sort() -> Sort:
+    name = request.args.get("sort", "latest")
+    if name not in POST_SORTS:
+        raise http_exception(
+            status=400,
+            code=ExType.VALIDATION_ERROR,
+            detail=f"Sort by one of: {', '.join(POST_SORTS)}.",
+            field="sort",
+        )
+    return POST_SORTS[name]
+
+
 @router.get("/posts")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
 @Auth.auth_optional
 def get_posts() -> Response:
     user = g.user
 
-    after: Optional[str] = request.args.get("after", None)
     limit = int(request.args.get("limit", 20))
     q = request.args.get("q")
     topics = request.args.getlist("topics")
     username = request.args.get("username")
+    sort = get_post_sort()
 
-    filter: Dict[str, Any] = {
-        "publish_at": {"$ne": None, "$lt": datetime.now()},
-    }
+    # is_published is flipped by the scheduler, the filter does not depend on time.
+    filter: Dict[str, Any] = {"is_published": True}
+    is_own_posts = False
     if username:
         if user and user.username == username:
+            # The author must see the posts they just wrote or updated.
+            read_own_writes()
             filter["author_id"] = user.id
-            filter.pop("publish_at")
+            filter.pop("is_published")
+            is_own_posts = True
         else:
-            user = User.get({"username": username})
-            filter["author_id"] = user.id
+            author = profile_cache.get_by_username(username)
+            if author is None:
+                raise http_exception(
+                    status=404,
+                    code=ExType.OBJECT_NOT_FOUND,
+                    detail="User not found.",
+                )
+            filter["author_id"] = author["_id"]
     if topics:
-        topic_ids = [
-            ODMObjectId(obj["_id"])
-            for obj in Topic.find_raw({"slug": {"$in": topics}}, projection={"slug": 1})
-        ]
+        topic_ids = [topic.id for topic in topic_registry.get_by_slugs(topics)]
         filter["topic_ids"] = {"$in": topic_ids}
     if q:
         filter["$text"] = {"$search": q}
-    if after:
-        filter["_id"] = {"$lt": ObjectId(after)}
 
-    sort = [("_id", -1)]
+    fields = get_requested_fields(PostListOut)
+    page = paginate(
+        Post, filter, sort, limit, projection=get_post_list_projection(fields)
+    )
+    results = get_post_list_results(page.items, fields)
+
+    response = custom_response(get_page_data(page, results, Post, filter), 200)
+    if not is_own_posts:
+        # The published feed does not change before the next scheduled publish.
+        response.cache_control.max_age = publish_scheduler.get_cache_max_age()
+        if user is None:
+            response.cache_control.public = True
+        else:
+            response.cache_control.private = True
+    return response
+
+
+@router.get("/posts/trending")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
+def get_trending_posts() -> Response:
+    limit = min(int(request.args.get("limit", 20)), trending_engine.top_k)
 
-    post_qs = Post.find(
-        filter=filter,
-        sort=sort,
-        limit=limit,
-        projection={"description": 0},
+    fields = get_requested_fields(PostListOut)
+
+    post_ids = trending_engine.get_ranking()[:limit]
+    posts_by_id = {
+        post["_id"]: post
+        for post in Post.find_raw(
+            {"_id": {"$in": post_ids}, "is_published": True},
+            projection=get_post_list_projection(fields),
+        )
+    }
+    posts = [posts_by_id[post_id] for post_id in post_ids if post_id in posts_by_id]
+    response = custom_response({"results": get_post_list_results(posts, fields)}, 200)
+    # The ranking does not change before the next flush.
+    response.cache_control.max_age = int(trending_engine.flush_interval)
+    response.cache_control.public = True
+    return response
+
+
+SEARCH_SORT: Sort = [("score", -1), ("_id", -1)]
+# Pages of hits read to skip the unpublished and deleted posts.
+SEARCH_MAX_SCANS = 3
+
+
+@router.get("/search")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
+def search_posts() -> Response:
+    q = request.args.get("q", "")
+    limit = min(int(request.args.get("limit", 20)), 100)
+    token = request.args.get("after")
+    if not search_index.ready:
+        raise http_exception(
+            status=503,
+            code=ExType.SERVICE_UNAVAILABLE,
+            detail="The search index is loading. Try later.",
+        )
+
+    fields = get_requested_fields(PostListOut)
+    after = None
+    if token:
+        cursor = decode_cursor(token, SEARCH_SORT, "after")
+        after = (cursor["score"], cursor["_id"])
+
+    posts: List[Dict[str, Any]] = []
+    has_more = False
+    for _ in range(SEARCH_MAX_SCANS):
+        hits = search_index.search(q, limit * 2, after)
+        posts_by_id = {
+            post["_id"]: post
+            for post in Post.find_raw(
+                {"_id": {"$in": [hit.id for hit in hits]}, "is_published": True},
+                projection=get_post_list_projection(fields),
+            )
+        }
+        for hit in hits:
+            if len(posts) == limit:
+                has_more = True
+                break
+            after = (hit.score, hit.id)
+            if hit.id in posts_by_id:
+                posts.append(posts_by_id[hit.id])
+        if has_more or len(hits) < limit * 2:
+            break
+    else:
+        # The next page continues after the last scanned hit.
+        has_more = True
+
+    return custom_response(
+        {
+            "after": encode_cursor({"score": after[0], "_id": after[1]}, SEARCH_SORT)
+            if has_more and after
+            else None,
+            "results": get_post_list_results(posts, fields),
+        },
+        200,
     )
-    results = []
-    next_cursor = None
-    for post in Post.load_related(post_qs):
-        next_cursor = post.id
-        results.append(PostListOut(**post.model_dump()).model_dump())
 
-    next_cursor = next_cursor if len(results) == limit else None
 
-    return custom_response({"after": ObjectIdStr(next_cursor), "results": results}, 200)
+# Fields that are enough to check the permission and build the ETag.
+POST_ETAG_PROJECTION = {
+    "is_published": 1,
+    "author_id": 1,
+    "author_snapshot": 1,
+    "publish_at": 1,
+    "updated_at": 1,
+    "total_comment": 1,
+    "total_reaction": 1,
+    "related_posts_at": 1,
+    "topic_ids": 1,
+}
+
+
+def get_post_etag(
+    post_data: Dict[str, Any],
+    author: Any,
+    fields: Optional[FrozenSet[str]] = None,
+) -> str:
+    return make_etag(
+        post_data["_id"],
+        post_data.get("updated_at"),
+        post_data.get("total_comment"),
+        post_data.get("total_reaction"),
+        post_data.get("related_posts_at"),
+        post_data.get("topic_ids"),
+        author,
+        # Every field set is a different representation.
+        sorted(fields) if fields else None,
+    )
+
+
+def is_post_visible(post_data: Dict[str, Any], user: Optional[User]) -> bool:
+    """Scheduled posts are only visible to their author."""
+    return bool(post_data.get("is_published")) or (
+        user is not None and user.id == post_data["author_id"]
+    )
+
+
+post_details_flight = SingleFlight(
+    "post_details",
+    ttl=config.POST_DETAILS_CACHE_TTL,
+    max_size=config.POST_DETAILS_CACHE_SIZE,
+)
+
+
+def get_post_author(
+    post_data: Dict[str, Any], fields: Optional[FrozenSet[str]]
+) -> Optional[Dict[str, Any]]:
+    if fields is not None and "author" not in fields:
+        return None
+    author = post_data.get("author_snapshot")
+    if author is None:
+        profile = profile_cache.get(post_data["author_id"])
+        if profile is None:
+            raise http_exception(
+                status=404,
+                code=ExType.OBJECT_NOT_FOUND,
+                detail="Object not found.",
+            )
+        author = UserSnapshot(**profile).model_dump()
+    return dict(author)
+
+
+def load_post_details(
+    post_id: Any, fields: Optional[FrozenSet[str]], author: Optional[Dict[str, Any]]
+) -> Optional[str]:
+    """The serialized post, shared by all the users allowed to see it."""
+    projection = get_projection(fields, POST_FIELD_SOURCES) if fields else None
+    posts = list(Post.find_raw({"_id": post_id}, projection=projection).limit(1))
+    if not posts:
+        return None
+    post_data = posts[0]
+    post_dict = {**post_data, "author": author}
+    if fields is None or "topics" in fields:
+        post_dict["topics"] = topic_registry.get_topics_out(
+            post_data.get("topic_ids", [])
+        )
+    return json.dumps(dump_fields(PostDetailsOut, post_dict, fields))
+
+
+def invalidate_post_details(slug: str) -> None:
+    post_details_flight.invalidate(lambda key: key[0] == slug)
 
 
 @router.get("/posts/<string:slug>")
 @Auth.auth_optional
 def get_post_details(slug: str) -> Response:
     user = g.user
-    filter: Dict[str, Any] = {
-        "slug": slug,
-        # "publish_at": {"$ne": None, "$lt": datetime.now()},
-    }
-
-    try:
-        post = Post.get(filter=filter)
-        if post.publish_at is None or post.publish_at > datetime.now():
-            if user is None or user.id != post.author_id:
-                raise http_exception(
-                    status=403,
-                    code=ExType.PERMISSION_ERROR,
-                    detail="You don't have permission to get this object.",
-                )
-        post.author = User.get({"_id": post.author_id})
-    except Exception as e:
+    fields = get_requested_fields(PostDetailsOut)
+
+    # Load the light fields first so that a 304 never loads the description.
+    post_data = get_raw_or_404(
+        Post,
+        {"slug": slug},
+        projection=POST_ETAG_PROJECTION,
+        detail="Object not found.",
+    )
+    if not is_post_visible(post_data, user):
         raise http_exception(
             status=404,
             code=ExType.OBJECT_NOT_FOUND,
             detail="Object not found.",
-        ) from e
-    post.topics = [
-        TopicOut(**topic.model_dump())
-        for topic in Topic.find({"_id": {"$in": post.topic_ids}})
+        )
+    author = get_post_author(post_data, fields)
+    etag = get_post_etag(post_data, author, fields)
+    not_modified = not_modified_response(etag)
+    if not_modified:
+        return not_modified
+
+    # A viral post is loaded once per worker, version and micro-cache window.
+    body: Optional[str] = post_details_flight.do(
+        (slug, fields, etag),
+        lambda: load_post_details(post_data["_id"], fields, author),
+    )
+    if body is None:
+        raise http_exception(
+            status=404,
+            code=ExType.OBJECT_NOT_FOUND,
+            detail="Object not found.",
+        )
+    return raw_response(body, 200, etag=etag)
+
+
+@router.post("/posts:batchGet")
+@read_policy(config.PUBLIC_READ_PREFERENCE, config.PUBLIC_READ_CONCERN)
+@Auth.auth_optional
+def batch_get_posts() -> Response:
+    data = parse_json(PostBatchGetIn)
+    user = g.user
+
+    posts = [
+        post_data
+        for post_data in Post.find_raw({"slug": {"$in": list(set(data.slugs))}})
+        if is_post_visible(post_data, user)
     ]
+    authors = profile_cache.get_many(
+        post_data["author_id"]
+        for post_data in posts
+        if post_data.get("author_snapshot") is None
+    )
+
+    posts_by_slug = {}
+    for post_data in posts:
+        author = post_data.get("author_snapshot") or authors.get(post_data["author_id"])
+        if author is None:
+            continue
+        post = Post(**post_data)
+        post.topics = topic_registry.get_topics_out(post.topic_ids)
+        posts_by_slug[post.slug] = PostDetailsOut(
+            **{**post.model_dump(), "author": author}
+        ).model_dump()
 
-    return custom_response(PostDetailsOut(**post.model_dump()).model_dump(), 200)
+    results = {slug: posts_by_slug.get(slug) for slug in data.slugs}
+    return custom_response({"results": results}, 200)
 
 
 @router.patch("/posts/<string:slug>")
@@ -274,16 +623,32 @@ def update_posts(slug: ObjectIdStr) -> Response:
     if post_data.publish_now:
         post_data.publish_at = datetime.now()
 
+    title, was_published = post.title, post.is_published
     post = update_partially(post, post_data)
+    post.is_published = is_published_now(post.publish_at)
 
     post.short_description = post_data.short_description
     if not post.short_description and post_data.description:
         post.short_description = get_short_description(post_data.description)
+    if post_data.description is not None:
+        for field, value in get_derived_fields(post_data.description).items():
+            setattr(post, field, value)
 
+    old_topic_ids = set(post.topic_ids)
     if post_data.topics:
         topics = get_or_create_post_topics(post_data.topics, user)
         post.topic_ids = [topic.id for topic in topics]
+        post.related_posts_at = None
+    # The ETag of the post and the search index refresh depend on it.
+    post.updated_at = datetime.now()
     post.update()
+    update_total_post(set(post.topic_ids) - old_topic_ids, 1)
+    update_total_post(old_topic_ids - set(post.topic_ids), -1)
+    invalidate_post_details(post.slug)
+    search_index.add_post(post)
+    refresh_after_update(post, title, was_published)
+    # Deliver to the new topic followers and move the publish time.
+    schedule_publication(post, bool(post_data.publish_at or post_data.topics))
 
     return custom_response({"message": "Post Updated"}, 200)
 
@@ -300,7 +665,12 @@ def delete_post(slug: str) -> Response:
             code=ExType.PERMISSION_ERROR,
             detail="You don't have access to delete this post.",
         )
-    Comment.delete_many({"post_id": post.id})
-    Reaction.delete_many({"post_id": post.id})
+    # Enqueued first, the job finishes the deletion if this request crashes.
+    enqueue_post_deletion(post.id)
+    # The post disappears now, its comments, reactions... are deleted in background.
     post.delete()
+    refresh_referencing_posts(post.id, remove=True)
+    invalidate_post_details(post.slug)
+    update_total_post(post.topic_ids, -1)
+    search_index.remove(post.id)
     return custom_response({"message": "Deleted"}, 200)
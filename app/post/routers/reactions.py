@@ -4,19 +4,25 @@ from typing import Any
 from flask import Blueprint, Response, g
 from mongodb_odm import ODMObjectId
 
+from app.base import config
+from app.base.db import RELAXED, write_concern
 from app.base.utils.query import get_object_or_404
 from app.base.utils.response import custom_response
 from app.user.auth import Auth
 from app.user.models import User
 
 from ..models import Post, Reaction
+from ..trending import trending_engine
 
 logger = logging.getLogger(__name__)
 router = Blueprint("reactions", __name__, url_prefix="/api/v1")
 
 
 def update_total_reaction(post_id: Any, val: int) -> None:
-    Post.update_one({"_id": ODMObjectId(post_id)}, {"$inc": {"total_reaction": val}})
+    with write_concern(RELAXED):
+        Post.update_one(
+            {"_id": ODMObjectId(post_id)}, {"$inc": {"total_reaction": val}}
+        )
 
 
 @router.post("/posts/<string:slug>/reactions")
@@ -38,6 +44,7 @@ def create_reactions(slug: str) -> Response:
     if update_result.modified_count or update_result.upserted_id is not None:
         # increase total comment for post
         update_total_reaction(post.id, 1)
+        trending_engine.record(post.id, config.TRENDING_REACTION_WEIGHT)
         message = "Reaction Added"
     else:
         message = "You already have an reaction in this post"
@@ -58,5 +65,6 @@ def delete_post_reactions(slug: str) -> Response:
     if update_result.modified_count:
         # decrease total comment for post
         update_total_reaction(post.id, -1)
+        trending_engine.record(post.id, -config.TRENDING_REACTION_WEIGHT)
 
     return custom_response({"message": "Reaction Deleted"}, 200)
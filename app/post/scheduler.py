@@ -0,0 +1,142 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from app.base import config
+from app.feed.models import TimelineEntry
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+
+def publish_due_posts() -> int:
+    """
+    Flip `is_published` of every post whose `publish_at` passed.
+    It is idempotent, so every worker can run it.
+    """
+    due_ids = [
+        post["_id"]
+        for post in Post.find_raw(
+            {
+                "is_published": {"$ne": True},
+                "publish_at": {"$ne": None, "$lte": datetime.now()},
+            },
+            projection={"_id": 1},
+        )
+    ]
+    if not due_ids:
+        return 0
+    Post.update_many({"_id": {"$in": due_ids}}, {"$set": {"is_published": True}})
+    TimelineEntry.update_many(
+        {"post_id": {"$in": due_ids}}, {"$set": {"is_published": True}}
+    )
+    logger.info(f"{len(due_ids)} post published")
+    return len(due_ids)
+
+
+class PublishScheduler:
+    """
+    Keep a min-heap of the upcoming publications and wake up
+    exactly when the first one is due.
+
+    Schedules made by this worker are pushed in-process; the heap is reloaded
+    from MongoDB periodically to learn about the other workers' schedules.
+    """
+
+    def __init__(self, reload_interval: float, heap_size: int) -> None:
+        self.reload_interval = reload_interval
+        self.heap_size = heap_size
+
+        self._heap: List[Tuple[datetime, Any]] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._last_reload_at: Optional[float] = None
+
+    def schedule(self, post_id: Any, publish_at: datetime) -> None:
+        with self._condition:
+            heapq.heappush(self._heap, (publish_at, post_id))
+            self._condition.notify()
+
+    def next_publish_at(self) -> Optional[datetime]:
+        with self._condition:
+            return self._heap[0][0] if self._heap else None
+
+    def get_cache_max_age(self) -> int:
+        """Seconds the published feeds stay valid, bounded by the config."""
+        max_age = config.POST_LIST_CACHE_MAX_AGE
+        next_publish_at = self.next_publish_at()
+        if next_publish_at is not None:
+            seconds = (next_publish_at - datetime.now()).total_seconds()
+            max_age = min(max_age, max(int(seconds), 0))
+        return max_age
+
+    def reload(self) -> None:
+        publish_due_posts()
+        upcoming = [
+            (post["publish_at"], post["_id"])
+            for post in Post.find_raw(
+                {"is_published": False, "publish_at": {"$gt": datetime.now()}},
+                projection={"publish_at": 1},
+                sort=[("publish_at", 1)],
+                limit=self.heap_size,
+            )
+        ]
+        heapq.heapify(upcoming)
+        with self._condition:
+            self._heap = upcoming
+        self._last_reload_at = time.monotonic()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="publish-scheduler", daemon=True
+        )
+        self._thread.start()
+
+    def _pop_due(self) -> bool:
+        now = datetime.now()
+        is_due = False
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+                is_due = True
+        return is_due
+
+    def _get_timeout(self) -> float:
+        assert self._last_reload_at is not None
+        timeout = self.reload_interval - (time.monotonic() - self._last_reload_at)
+        next_publish_at = self.next_publish_at()
+        if next_publish_at is not None:
+            seconds = (next_publish_at - datetime.now()).total_seconds()
+            timeout = min(timeout, seconds)
+        return max(timeout, 0)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if (
+                    self._last_reload_at is None
+                    or time.monotonic() - self._last_reload_at > self.reload_interval
+                ):
+                    self.reload()
+                if self._pop_due():
+                    publish_due_posts()
+                with self._condition:
+                    self._condition.wait(self._get_timeout())
+            except Exception as e:
+                logger.error(f"Publish scheduler error:{e}")
+                time.sleep(self.reload_interval)
+
+
+publish_scheduler = PublishScheduler(
+    reload_interval=config.PUBLISH_SCHEDULER_RELOAD_INTERVAL,
+    heap_size=config.PUBLISH_SCHEDULER_HEAP_SIZE,
+)
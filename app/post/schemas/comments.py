@@ -29,7 +29,9 @@ class CommentOut(BaseModel):
     user: Optional[PublicUserListOut]
 
     description: str
+    # The first replies only, `total_reply` tells if there are more.
     replies: List[ReplyOut] = []
+    total_reply: int = 0
 
     created_at: datetime
     updated_at: datetime
@@ -3,7 +3,7 @@ from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
-from app.user.schemas import PublicUserListOut
+from app.user.schemas import BATCH_GET_MAX_SIZE, PublicUserListOut
 
 
 class TopicIn(BaseModel):
@@ -49,6 +49,10 @@ class PostOut(BaseModel):
     topics: List[TopicOut] = []
 
 
+class PostBatchGetIn(BaseModel):
+    slugs: List[str] = Field(min_length=1, max_length=BATCH_GET_MAX_SIZE)
+
+
 class PostListOut(BaseModel):
     author: Optional[PublicUserListOut] = None
     title: str = Field(max_length=255)
@@ -58,9 +62,18 @@ class PostListOut(BaseModel):
     total_comment: int = Field(default=0)
     total_reaction: int = Field(default=0)
 
+    excerpt: Optional[str] = None
+    word_count: int = Field(default=0)
+    reading_time: int = Field(default=0)
+
     publish_at: Optional[datetime] = None
 
 
+class RelatedPostOut(BaseModel):
+    slug: str
+    title: str
+
+
 class PostDetailsOut(BaseModel):
     author: Optional[PublicUserListOut] = None
     slug: str = Field(max_length=300)
@@ -70,7 +83,13 @@ class PostDetailsOut(BaseModel):
     total_comment: int = Field(default=0)
     total_reaction: int = Field(default=0)
 
+    excerpt: Optional[str] = None
+    word_count: int = Field(default=0)
+    reading_time: int = Field(default=0)
+
     publish_at: Optional[datetime] = None
 
     description: Optional[str] = None
+    description_html: Optional[str] = None
     topics: List[TopicOut] = []
+    related_posts: List[RelatedPostOut] = []
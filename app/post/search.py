@@ -0,0 +1,576 @@
+import array
+import heapq
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from bson import ObjectId
+
+from app.base import config
+
+from .models import Post
+
+try:
+    import numpy as np
+
+    HAS_NUMPY = True
+except ImportError:  # pragma: no cover
+    HAS_NUMPY = False
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BM25IDX1"
+# magic, documents, terms, postings
+HEADER = struct.Struct("=8sQQQ")
+ID_SIZE = 12
+
+K1 = 1.2
+B = 0.75
+# A word of the title counts as much as three words of the body.
+FIELD_WEIGHTS = {"title": 3.0, "short_description": 1.0, "description": 1.0}
+SEARCH_PROJECTION = {"updated_at": 1, **{field: 1 for field in FIELD_WEIGHTS}}
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has have in is it its of on or that the "
+    "this to was were will with".split()
+)
+# Posts updated by another worker may be written with a slightly older time.
+REFRESH_OVERLAP = timedelta(minutes=1)
+EPOCH = datetime(1970, 1, 1)
+
+token_regex = re.compile(r"\w+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [
+        token
+        for token in token_regex.findall(text.casefold())
+        if token not in STOP_WORDS
+    ]
+
+
+def get_term_frequencies(post: Dict[str, Any]) -> Dict[str, float]:
+    frequencies: Dict[str, float] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(post.get(field)):
+            frequencies[term] = frequencies.get(term, 0) + weight
+    return frequencies
+
+
+def to_ms(value: datetime) -> float:
+    # MongoDB stores milliseconds, the value must match once read back.
+    return float((value - EPOCH) // timedelta(milliseconds=1))
+
+
+def _as_array(typecode: str, values: Any) -> Any:
+    if HAS_NUMPY:
+        return np.asarray(values, dtype=typecode)
+    return values if isinstance(values, array.array) else array.array(typecode, values)
+
+
+def _view(buffer: Any, position: int, typecode: str, count: int) -> Tuple[Any, int]:
+    """Zero copy array of the buffer, a NumPy array if it is installed."""
+    position += -position % 8
+    size = array.array(typecode).itemsize * count
+    view = memoryview(buffer)[position : position + size].cast(typecode)  # type: ignore
+    if HAS_NUMPY:
+        return np.frombuffer(view, dtype=typecode), position + size
+    return view, position + size
+
+
+def _pad(parts: List[bytes], position: int) -> int:
+    padding = -position % 8
+    parts.append(b"\0" * padding)
+    return position + padding
+
+
+class Segment:
+    """
+    Immutable postings of the indexed posts, in one buffer (the index file):
+    header, offsets (int64, terms + 1), docs (int32), frequencies (float32),
+    lengths (float32), updated_at (float64 ms), ids (12 bytes) and the terms,
+    one per line. The postings of the term `t` are `docs[offsets[t]:offsets[t + 1]]`.
+    """
+
+    def __init__(self, buffer: Any) -> None:
+        magic, n_docs, n_terms, n_postings = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a search index")
+        self.buffer = buffer
+        self.n_docs: int = n_docs
+
+        position = HEADER.size
+        self.offsets, position = _view(buffer, position, "q", n_terms + 1)
+        self.docs, position = _view(buffer, position, "i", n_postings)
+        self.frequencies, position = _view(buffer, position, "f", n_postings)
+        self.lengths, position = _view(buffer, position, "f", n_docs)
+        self.updated_at, position = _view(buffer, position, "d", n_docs)
+        self.ids = bytes(buffer[position : position + ID_SIZE * n_docs])
+        position += ID_SIZE * n_docs
+        terms = bytes(buffer[position:]).decode().split("\n") if n_terms else []
+        self.terms = {term: i for i, term in enumerate(terms)}
+
+    def get_id(self, doc: int) -> bytes:
+        return self.ids[doc * ID_SIZE : (doc + 1) * ID_SIZE]
+
+    def get_postings(self, term: str) -> Tuple[Any, Any]:
+        t = self.terms.get(term)
+        if t is None:
+            return [], []
+        start, end = int(self.offsets[t]), int(self.offsets[t + 1])
+        return self.docs[start:end], self.frequencies[start:end]
+
+    def get_term_numbers(self) -> Any:
+        """The term of every posting."""
+        if HAS_NUMPY:
+            return np.repeat(
+                np.arange(len(self.terms), dtype="i"), np.diff(self.offsets)
+            )
+        numbers = array.array("i")
+        for t in range(len(self.terms)):
+            numbers.extend([t] * (self.offsets[t + 1] - self.offsets[t]))
+        return numbers
+
+
+def build_segment(
+    terms: List[str],
+    term_numbers: Any,
+    docs: Any,
+    frequencies: Any,
+    lengths: Any,
+    updated_at: Any,
+    ids: bytes,
+) -> Segment:
+    """
+    Sort the postings (term, doc, frequency) by term and drop the unused terms.
+    The postings of a term must be in doc order, the sort is stable.
+    """
+    if HAS_NUMPY:
+        term_numbers = np.asarray(term_numbers, dtype="i")
+        docs = np.asarray(docs, dtype="i")
+        counts = np.bincount(term_numbers, minlength=len(terms))
+        used = counts > 0
+        order = np.argsort(term_numbers, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(counts[used])))
+        docs = docs[order]
+        frequencies = np.asarray(frequencies, dtype="f")[order]
+        terms = [term for term, is_used in zip(terms, used.tolist()) if is_used]
+    else:
+        counts = [0] * len(terms)
+        for t in term_numbers:
+            counts[t] += 1
+        order = sorted(range(len(docs)), key=term_numbers.__getitem__)
+        offsets = array.array("q", [0])
+        for count in counts:
+            if count:
+                offsets.append(offsets[-1] + count)
+        docs = array.array("i", [docs[i] for i in order])
+        frequencies = array.array("f", [frequencies[i] for i in order])
+        terms = [term for term, count in zip(terms, counts) if count]
+
+    parts = [HEADER.pack(MAGIC, len(lengths), len(terms), len(docs))]
+    position = HEADER.size
+    for typecode, values in (
+        ("q", offsets),
+        ("i", docs),
+        ("f", frequencies),
+        ("f", lengths),
+        ("d", updated_at),
+    ):
+        position = _pad(parts, position)
+        data = _as_array(typecode, values).tobytes()
+        parts.append(data)
+        position += len(data)
+    parts.append(ids)
+    parts.append("\n".join(terms).encode())
+    return Segment(b"".join(parts))
+
+
+class SearchHit(NamedTuple):
+    id: ObjectId
+    score: float
+
+
+class SearchIndex:
+    """
+    Per worker BM25 index of the posts (title, short description and body).
+
+    The bulk of the postings is a segment memory-mapped from `path`, a worker
+    starts without reading the posts and the pages are shared with the other
+    workers. The posts written since are indexed in a small in-memory delta, a
+    replaced or deleted post is only marked deleted until the delta is merged
+    into a new segment (and file). The posts written by the other workers are
+    loaded every `refresh_interval` seconds, their deletions are filtered out
+    when the results are read.
+    """
+
+    def __init__(self, path: str, refresh_interval: float, merge_threshold: int):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.merge_threshold = merge_threshold
+
+        self._lock = threading.Lock()
+        self._segment: Optional[Segment] = None
+        # term -> (docs, frequencies) of the posts indexed after the segment.
+        self._delta: Dict[str, Tuple[array.array[int], array.array[float]]] = {}
+        self._delta_lengths: array.array[float] = array.array("f")
+        self._delta_updated_at: array.array[float] = array.array("d")
+        self._delta_ids: List[bytes] = []
+        # id -> doc of the indexed posts, the replaced docs are in `_deleted`.
+        self._docs: Dict[bytes, int] = {}
+        self._deleted: Set[int] = set()
+        self._total_length = 0.0
+        self.last_updated_at = 0.0
+
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._segment is not None
+
+    def _install(self, segment: Segment) -> None:
+        self._segment = segment
+        self._delta = {}
+        self._delta_lengths = array.array("f")
+        self._delta_updated_at = array.array("d")
+        self._delta_ids = []
+        self._deleted = set()
+        self._docs = {segment.get_id(doc): doc for doc in range(segment.n_docs)}
+        if HAS_NUMPY:
+            self._total_length = float(segment.lengths.sum(dtype="d"))
+            self.last_updated_at = float(segment.updated_at.max(initial=0))
+        else:
+            self._total_length = float(sum(segment.lengths))
+            self.last_updated_at = float(max(segment.updated_at, default=0))
+
+    def _get_length(self, segment: Segment, doc: int) -> float:
+        if doc < segment.n_docs:
+            return float(segment.lengths[doc])
+        return self._delta_lengths[doc - segment.n_docs]
+
+    def _get_updated_at(self, segment: Segment, doc: int) -> float:
+        if doc < segment.n_docs:
+            return float(segment.updated_at[doc])
+        return self._delta_updated_at[doc - segment.n_docs]
+
+    def _get_id(self, segment: Segment, doc: int) -> bytes:
+        if doc < segment.n_docs:
+            return segment.get_id(doc)
+        return self._delta_ids[doc - segment.n_docs]
+
+    def add(
+        self, post_id: ObjectId, updated_at: datetime, frequencies: Dict[str, float]
+    ) -> bool:
+        """Index a new or updated post, False if this version is already indexed."""
+        key = post_id.binary
+        updated_at_ms = to_ms(updated_at)
+        with self._lock:
+            segment = self._segment
+            if segment is None:
+                return False
+            old_doc = self._docs.get(key)
+            if old_doc is not None:
+                if self._get_updated_at(segment, old_doc) == updated_at_ms:
+                    return False
+                self._delete(segment, old_doc)
+
+            doc = segment.n_docs + len(self._delta_ids)
+            for term, frequency in frequencies.items():
+                if term not in self._delta:
+                    self._delta[term] = (array.array("i"), array.array("f"))
+                self._delta[term][0].append(doc)
+                self._delta[term][1].append(frequency)
+            length = sum(frequencies.values())
+            self._delta_lengths.append(length)
+            self._delta_updated_at.append(updated_at_ms)
+            self._delta_ids.append(key)
+            self._docs[key] = doc
+            self._total_length += length
+            self.last_updated_at = max(self.last_updated_at, updated_at_ms)
+        return True
+
+    def add_post(self, post: Post) -> None:
+        self.add(post.id, post.updated_at, get_term_frequencies(post.model_dump()))
+
+    def remove(self, post_id: ObjectId) -> None:
+        with self._lock:
+            doc = self._docs.pop(post_id.binary, None)
+            if self._segment is not None and doc is not None:
+                self._delete(self._segment, doc)
+
+    def _delete(self, segment: Segment, doc: int) -> None:
+        self._deleted.add(doc)
+        self._total_length -= self._get_length(segment, doc)
+
+    def search(
+        self, query: str, limit: int, after: Optional[Tuple[float, ObjectId]] = None
+    ) -> List[SearchHit]:
+        """The best posts for the query, after the (score, id) of the last page."""
+        terms = set(tokenize(query))
+        with self._lock:
+            segment = self._segment
+            n_docs = len(self._docs)
+            if segment is None or not terms or not n_docs:
+                return []
+            average_length = self._total_length / n_docs
+            cursor = (after[0], after[1].binary) if after else None
+
+            postings = []
+            for term in terms:
+                parts: List[Tuple[Any, Any]] = [
+                    segment.get_postings(term),
+                    self._delta.get(term, ([], [])),
+                ]
+                df = len(parts[0][0]) + len(parts[1][0])
+                if df:
+                    idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                    postings.append((idf, parts))
+
+            if HAS_NUMPY:
+                candidates = self._score_numpy(
+                    segment, postings, average_length, limit, cursor
+                )
+            else:
+                candidates = self._score_python(segment, postings, average_length)
+
+            ranked: Iterable[Tuple[float, bytes]] = (
+                (score, self._get_id(segment, doc)) for doc, score in candidates
+            )
+            if cursor is not None:
+                ranked = (item for item in ranked if item < cursor)
+            top = heapq.nlargest(limit, ranked)
+        return [SearchHit(id=ObjectId(key), score=score) for score, key in top]
+
+    def _score_python(
+        self, segment: Segment, postings: List[Any], average_length: float
+    ) -> Iterable[Tuple[int, float]]:
+        scores: Dict[int, float] = {}
+        for idf, parts in postings:
+            for docs, frequencies in parts:
+                for doc, frequency in zip(docs, frequencies):
+                    norm = 1 - B + B * self._get_length(segment, doc) / average_length
+                    scores[doc] = scores.get(doc, 0) + idf * frequency * (K1 + 1) / (
+                        frequency + K1 * norm
+                    )
+        return ((doc, s) for doc, s in scores.items() if doc not in self._deleted)
+
+    def _score_numpy(
+        self,
+        segment: Segment,
+        postings: List[Any],
+        average_length: float,
+        limit: int,
+        cursor: Optional[Tuple[float, bytes]],
+    ) -> Iterable[Tuple[int, float]]:
+        """Score every matching doc at once, keep the candidates of the page."""
+        scores = np.zeros(segment.n_docs + len(self._delta_ids))
+        delta_lengths = np.frombuffer(self._delta_lengths, dtype="f").copy()
+        for idf, (segment_postings, delta_postings) in postings:
+            for (part_docs, part_frequencies), part_lengths, start in (
+                (segment_postings, segment.lengths, 0),
+                (delta_postings, delta_lengths, segment.n_docs),
+            ):
+                if not len(part_docs):
+                    continue
+                docs = np.asarray(part_docs, dtype="i")
+                frequencies = np.asarray(part_frequencies, dtype="d")
+                lengths = part_lengths[docs - start]
+                norm = 1 - B + B * lengths.astype("d") / average_length
+                # The docs of a term are unique, no need for np.add.at.
+                scores[docs] += idf * frequencies * (K1 + 1) / (frequencies + K1 * norm)
+
+        if self._deleted:
+            scores[np.fromiter(self._deleted, dtype="i", count=len(self._deleted))] = 0
+        docs = np.flatnonzero(scores)
+        doc_scores = scores[docs]
+        if cursor is not None:
+            keep = doc_scores <= cursor[0]
+            # The docs of the last score are ordered by id.
+            for i in np.flatnonzero(doc_scores == cursor[0]).tolist():
+                if self._get_id(segment, int(docs[i])) >= cursor[1]:
+                    keep[i] = False
+            docs, doc_scores = docs[keep], doc_scores[keep]
+        if len(docs) > limit:
+            # Every doc with the score of the last one, the ties are sorted by id.
+            threshold = np.partition(doc_scores, len(docs) - limit)[len(docs) - limit]
+            keep = doc_scores >= threshold
+            docs, doc_scores = docs[keep], doc_scores[keep]
+        return zip(docs.tolist(), doc_scores.tolist())
+
+    def load(self) -> bool:
+        """Map the index file, False if there is none."""
+        try:
+            with open(self.path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            segment = Segment(buffer)
+        except (OSError, ValueError, struct.error) as e:
+            logger.info(f"Search index not loaded from {self.path} error:{e}")
+            return False
+        with self._lock:
+            self._install(segment)
+        logger.info(f"{segment.n_docs} post loaded into the search index")
+        return True
+
+    def save(self) -> None:
+        """Replace the index file atomically, a mapped file stays readable."""
+        with self._lock:
+            segment = self._segment
+        if segment is None:
+            return
+        path = f"{self.path}.{os.getpid()}.tmp"
+        with open(path, "wb") as f:
+            f.write(segment.buffer)
+        os.replace(path, self.path)
+
+    def rebuild(self, posts: Optional[Iterable[Dict[str, Any]]] = None) -> int:
+        """Index all the posts (from the database by default) and save the file."""
+        if posts is None:
+            posts = Post.find_raw({}, projection=SEARCH_PROJECTION)
+        terms: Dict[str, int] = {}
+        term_numbers, docs = array.array("i"), array.array("i")
+        frequencies, lengths = array.array("f"), array.array("f")
+        updated_at, ids = array.array("d"), bytearray()
+        for doc, post in enumerate(posts):
+            post_frequencies = get_term_frequencies(post)
+            for term, frequency in post_frequencies.items():
+                term_numbers.append(terms.setdefault(term, len(terms)))
+                docs.append(doc)
+                frequencies.append(frequency)
+            lengths.append(sum(post_frequencies.values()))
+            updated_at.append(to_ms(post["updated_at"]))
+            ids += post["_id"].binary
+
+        segment = build_segment(
+            list(terms),
+            term_numbers,
+            docs,
+            frequencies,
+            lengths,
+            updated_at,
+            bytes(ids),
+        )
+        with self._lock:
+            self._install(segment)
+        self.save()
+        return segment.n_docs
+
+    def merge(self) -> None:
+        """Write the delta and drop the deleted docs into a new segment."""
+        with self._lock:
+            segment = self._segment
+            if segment is None:
+                return
+            n_docs = segment.n_docs + len(self._delta_ids)
+            # Old doc -> new doc, -1 if deleted.
+            numbers = array.array("i", [-1]) * n_docs
+            lengths, updated_at, ids = array.array("f"), array.array("d"), bytearray()
+            for doc in range(n_docs):
+                if doc not in self._deleted:
+                    numbers[doc] = len(lengths)
+                    lengths.append(self._get_length(segment, doc))
+                    updated_at.append(self._get_updated_at(segment, doc))
+                    ids += self._get_id(segment, doc)
+
+            terms = list(segment.terms)
+            term_indexes = dict(segment.terms)
+            delta_terms, delta_docs = array.array("i"), array.array("i")
+            delta_frequencies = array.array("f")
+            for term, (docs, frequencies) in self._delta.items():
+                t = term_indexes.setdefault(term, len(terms))
+                if t == len(terms):
+                    terms.append(term)
+                delta_terms.extend([t] * len(docs))
+                delta_docs.extend(docs)
+                delta_frequencies.extend(frequencies)
+
+            if HAS_NUMPY:
+                all_numbers = np.frombuffer(numbers, dtype="i")
+                docs = all_numbers[np.concatenate((segment.docs, delta_docs))]
+                keep = docs >= 0
+                term_numbers = np.concatenate(
+                    (segment.get_term_numbers(), delta_terms)
+                )[keep]
+                frequencies = np.concatenate((segment.frequencies, delta_frequencies))[
+                    keep
+                ]
+                docs = docs[keep]
+            else:
+                term_numbers, docs, frequencies = (
+                    array.array("i"),
+                    array.array("i"),
+                    array.array("f"),
+                )
+                for t, doc, frequency in zip(
+                    segment.get_term_numbers() + delta_terms,
+                    list(segment.docs) + list(delta_docs),
+                    list(segment.frequencies) + list(delta_frequencies),
+                ):
+                    if numbers[doc] >= 0:
+                        term_numbers.append(t)
+                        docs.append(numbers[doc])
+                        frequencies.append(frequency)
+
+            self._install(
+                build_segment(
+                    terms,
+                    term_numbers,
+                    docs,
+                    frequencies,
+                    lengths,
+                    updated_at,
+                    bytes(ids),
+                )
+            )
+        self.save()
+
+    def refresh(self) -> int:
+        """Index the posts written since the last refresh (by any worker)."""
+        since = EPOCH + timedelta(milliseconds=self.last_updated_at) - REFRESH_OVERLAP
+        total = 0
+        for post in Post.find_raw(
+            {"updated_at": {"$gte": since}}, projection=SEARCH_PROJECTION
+        ):
+            if self.add(post["_id"], post["updated_at"], get_term_frequencies(post)):
+                total += 1
+        return total
+
+    def start(self) -> None:
+        """Map the index file now, build it and refresh it in background."""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        if not self.ready:
+            self.load()
+        self._thread = threading.Thread(
+            target=self._run, name="search-index", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                if not self.ready:
+                    total = self.rebuild()
+                    logger.info(f"{total} post indexed by the search index")
+                self.refresh()
+                if len(self._delta_ids) + len(self._deleted) >= self.merge_threshold:
+                    self.merge()
+            except Exception as e:
+                logger.error(f"Search index error:{e}")
+            time.sleep(self.refresh_interval)
+
+
+search_index = SearchIndex(
+    path=config.SEARCH_INDEX_FILE,
+    refresh_interval=config.SEARCH_REFRESH_INTERVAL,
+    merge_threshold=config.SEARCH_MERGE_THRESHOLD,
+)
@@ -0,0 +1,110 @@
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Type
+
+from mongodb_odm import Document, ODMObjectId, UpdateOne
+
+from app.base.jobs import enqueue, job_handler, job_worker
+from app.user.models import User, UserSnapshot
+
+from .models import Comment, Post, Reply
+
+logger = logging.getLogger(__name__)
+
+REFRESH_SNAPSHOTS_JOB = "refresh_user_snapshots"
+WRITE_BATCH_SIZE = 1000
+
+
+def refresh_user_snapshots(user: User) -> None:
+    """
+    Fan-out the new public fields of the user to every document they wrote.
+    Run by a job, see `enqueue_snapshot_refresh`.
+    """
+    snapshot = UserSnapshot.from_user(user).model_dump()
+    # The ETag of a comment page hashes the updated_at of its comments.
+    update = {"$set": {"user_snapshot": snapshot, "updated_at": datetime.now()}}
+
+    Post.update_many({"author_id": user.id}, {"$set": {"author_snapshot": snapshot}})
+    Comment.update_many({"user_id": user.id}, update)
+    Reply.update_many({"user_id": user.id}, update)
+
+    # The reply previews are part of the page of the parent comment.
+    comment_ids = list(
+        {
+            reply["comment_id"]
+            for reply in Reply.find_raw(
+                {"user_id": user.id}, projection={"comment_id": 1}
+            )
+        }
+    )
+    for start in range(0, len(comment_ids), WRITE_BATCH_SIZE):
+        Comment.update_many(
+            {"_id": {"$in": comment_ids[start : start + WRITE_BATCH_SIZE]}},
+            {"$set": {"updated_at": update["$set"]["updated_at"]}},
+        )
+
+
+@job_handler(REFRESH_SNAPSHOTS_JOB)
+def refresh_user_snapshots_job(payload: Dict[str, Any]) -> None:
+    # The current fields of the user, a later change is not overwritten.
+    user = User.find_one({"_id": ODMObjectId(payload["user_id"])})
+    if user is not None:
+        refresh_user_snapshots(user)
+
+
+def enqueue_snapshot_refresh(user_id: Any) -> None:
+    """Call it whenever `full_name` or `image` changes."""
+    enqueue(REFRESH_SNAPSHOTS_JOB, {"user_id": str(user_id)})
+    job_worker.notify()
+
+
+def get_snapshots(user_ids: List[Any]) -> Dict[Any, Dict[str, Any]]:
+    return {
+        user["_id"]: UserSnapshot(**user).model_dump()
+        for user in User.find_raw(
+            {"_id": {"$in": list(set(user_ids))}},
+            projection={"username": 1, "full_name": 1, "image": 1},
+        )
+    }
+
+
+def _backfill(
+    model: Type[Document], field: str, user_field: str, batch_size: int
+) -> int:
+    total = 0
+    last_id = None
+    while True:
+        filter: Dict[str, Any] = {field: None}
+        if last_id:
+            filter["_id"] = {"$gt": last_id}
+        objects = list(
+            model.find_raw(
+                filter, projection={user_field: 1}, sort=[("_id", 1)], limit=batch_size
+            )
+        )
+        if not objects:
+            return total
+        last_id = objects[-1]["_id"]
+
+        snapshots = get_snapshots([obj[user_field] for obj in objects])
+        write_objects = [
+            UpdateOne(
+                {"_id": obj["_id"]},
+                {"$set": {field: snapshots[obj[user_field]]}},
+            )
+            for obj in objects
+            if obj[user_field] in snapshots
+        ]
+        if write_objects:
+            model.bulk_write(requests=write_objects, ordered=False)
+        total += len(objects)
+
+
+def backfill_snapshots(batch_size: int = 500) -> None:
+    """Embed the user snapshots into the documents that were written without them."""
+    total = _backfill(Post, "author_snapshot", "author_id", batch_size)
+    logger.info(f"{total} post processed")
+    total = _backfill(Comment, "user_snapshot", "user_id", batch_size)
+    logger.info(f"{total} comment processed")
+    total = _backfill(Reply, "user_snapshot", "user_id", batch_size)
+    logger.info(f"{total} reply processed")
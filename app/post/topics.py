@@ -0,0 +1,243 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.base import config
+
+from .models import Post, Topic
+from .schemas.posts import TopicOut
+
+logger = logging.getLogger(__name__)
+
+
+class TopicEntry(NamedTuple):
+    id: Any
+    name: str
+    slug: str
+
+
+SUGGEST_CACHE_PREFIX_LENGTH = 2
+TOPIC_PROJECTION = {"name": 1, "slug": 1, "total_post": 1}
+
+
+class TopicRegistry:
+    """
+    Per worker map of the topics (id <-> slug <-> name).
+
+    Topics are never updated or deleted, so the map only grows.
+    The background thread fetches the new topics with `_id > last_seen_id`,
+    periodically or sooner when a lookup misses (the topic may be created by
+    another worker). The missing topics of the lookup are fetched by their keys
+    meanwhile, so a new topic is never dropped from a response.
+
+    The autocomplete is a sorted array of the words of the names, a prefix is
+    a range found by binary search, ranked by the number of posts of the topic.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float,
+        miss_refresh_interval: float,
+        weights_reload_interval: float,
+    ) -> None:
+        self.refresh_interval = refresh_interval
+        self.miss_refresh_interval = miss_refresh_interval
+        self.weights_reload_interval = weights_reload_interval
+
+        self._lock = threading.Lock()
+        self.by_id: Dict[Any, TopicEntry] = {}
+        self.by_slug: Dict[str, TopicEntry] = {}
+        self.last_seen_id: Any = None
+        self.last_refresh_at: Optional[float] = None
+        self._refresh_requested = threading.Event()
+
+        # (word of the name and the rest of the name, slug), sorted.
+        self._suggest_keys: List[Tuple[str, str]] = []
+        self.weights: Dict[Any, int] = {}
+        # Results of the short prefixes (the largest ranges), refreshed when a
+        # topic matching them is added or the weights are reloaded.
+        self._suggest_cache: Dict[Tuple[str, int], List[TopicEntry]] = {}
+
+    def add(self, topic: Topic) -> None:
+        with self._lock:
+            self._add(
+                TopicEntry(id=topic.id, name=topic.name, slug=topic.slug),
+                topic.total_post,
+            )
+
+    def _add(self, entry: TopicEntry, weight: int = 0) -> None:
+        if entry.id in self.by_id:
+            return
+        self.by_id[entry.id] = entry
+        self.by_slug[entry.slug] = entry
+        self.weights[entry.id] = weight
+        for key in get_suggest_keys(entry.name):
+            bisect.insort(self._suggest_keys, (key, entry.slug))
+            for cache_key in list(self._suggest_cache):
+                if key.startswith(cache_key[0]):
+                    del self._suggest_cache[cache_key]
+
+    def _add_raw(self, topics: List[Dict[str, Any]]) -> None:
+        for topic in topics:
+            self._add(
+                TopicEntry(id=topic["_id"], name=topic["name"], slug=topic["slug"]),
+                topic.get("total_post", 0),
+            )
+
+    def refresh(self) -> int:
+        """Query without the lock, the readers only wait for the merge."""
+        last_seen_id = self.last_seen_id
+        filter = {"_id": {"$gt": last_seen_id}} if last_seen_id else {}
+        topics = list(
+            Topic.find_raw(
+                filter,
+                projection=TOPIC_PROJECTION,
+                sort=[("_id", 1)],
+            )
+        )
+        with self._lock:
+            self._add_raw(topics)
+            if topics and (
+                self.last_seen_id is None or topics[-1]["_id"] > self.last_seen_id
+            ):
+                self.last_seen_id = topics[-1]["_id"]
+            self.last_refresh_at = time.monotonic()
+        if topics:
+            logger.info(f"{len(topics)} topic loaded into the registry")
+        return len(topics)
+
+    def load(self) -> None:
+        """Initial load, a failure is not fatal, the next lookup will retry."""
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning(f"Unable to load the topics error:{e}")
+
+    def start_load(self) -> None:
+        """Load in background, the worker does not wait for the database to boot."""
+        threading.Thread(target=self._run, name="topic-registry", daemon=True).start()
+
+    def _run(self) -> None:
+        self.load()
+        weights_reload_at = time.monotonic() + self.weights_reload_interval
+        while True:
+            # Woken up early by a lookup miss.
+            self._refresh_requested.wait(self.refresh_interval)
+            self._refresh_requested.clear()
+            try:
+                self.refresh()
+                if time.monotonic() >= weights_reload_at:
+                    weights_reload_at = time.monotonic() + self.weights_reload_interval
+                    self.reload_weights()
+            except Exception as e:
+                logger.error(f"Topic registry error:{e}")
+
+    def reload_weights(self) -> None:
+        """The post counts updated by the other workers."""
+        weights = {
+            topic["_id"]: topic.get("total_post", 0)
+            for topic in Topic.find_raw({}, projection={"total_post": 1})
+        }
+        with self._lock:
+            self.weights.update(weights)
+            self._suggest_cache.clear()
+
+    def add_weight(self, ids: Iterable[Any], val: int) -> None:
+        with self._lock:
+            for id in ids:
+                if id in self.weights:
+                    self.weights[id] += val
+
+    def _request_refresh(self) -> None:
+        """Ask the background thread to refresh, at most every miss interval."""
+        if (
+            self.last_refresh_at is None
+            or time.monotonic() - self.last_refresh_at > self.miss_refresh_interval
+        ):
+            self._refresh_requested.set()
+
+    def _get_many(
+        self, keys: Iterable[Any], index: Dict[Any, TopicEntry], field: str
+    ) -> List[TopicEntry]:
+        keys = list(keys)
+        missing = list({key for key in keys if key not in index})
+        if missing:
+            # Query without the lock, like `refresh`.
+            topics = list(
+                Topic.find_raw({field: {"$in": missing}}, projection=TOPIC_PROJECTION)
+            )
+            with self._lock:
+                self._add_raw(topics)
+            self._request_refresh()
+        return [index[key] for key in keys if key in index]
+
+    def get_by_slugs(self, slugs: Iterable[str]) -> List[TopicEntry]:
+        return self._get_many(slugs, self.by_slug, "slug")
+
+    def get_by_ids(self, ids: Iterable[Any]) -> List[TopicEntry]:
+        return self._get_many(ids, self.by_id, "_id")
+
+    def get_topics_out(self, ids: Iterable[Any]) -> List[TopicOut]:
+        return [
+            TopicOut(name=entry.name, slug=entry.slug) for entry in self.get_by_ids(ids)
+        ]
+
+    def suggest(self, prefix: str, limit: int) -> List[TopicEntry]:
+        """The most used topics with a word of the name starting with `prefix`."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            cache_key = (prefix, limit)
+            if cache_key in self._suggest_cache:
+                return self._suggest_cache[cache_key]
+            start = bisect.bisect_left(self._suggest_keys, (prefix, ""))
+            end = bisect.bisect_left(self._suggest_keys, (prefix + "\uffff", ""))
+            entries = {self.by_slug[slug] for _, slug in self._suggest_keys[start:end]}
+            results = heapq.nlargest(
+                limit, entries, key=lambda entry: (self.weights[entry.id], entry.slug)
+            )
+            if len(prefix) <= SUGGEST_CACHE_PREFIX_LENGTH:
+                self._suggest_cache[cache_key] = results
+        return results
+
+
+def normalize(value: str) -> str:
+    return " ".join(value.casefold().split())
+
+
+def get_suggest_keys(name: str) -> List[str]:
+    """`Machine learning` -> `machine learning`, `learning`."""
+    words = normalize(name).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+def count_topic_posts() -> int:
+    """Recount `Topic.total_post` from the posts."""
+    counts = {
+        obj["_id"]: obj["count"]
+        for obj in Post.aggregate(
+            [
+                {"$unwind": "$topic_ids"},
+                {"$group": {"_id": "$topic_ids", "count": {"$sum": 1}}},
+            ],
+            get_raw=True,
+        )
+    }
+    total = 0
+    for topic in Topic.find_raw({}, projection={"total_post": 1}):
+        count = counts.get(topic["_id"], 0)
+        if topic.get("total_post") != count:
+            Topic.update_one({"_id": topic["_id"]}, {"$set": {"total_post": count}})
+            total += 1
+    return total
+
+
+topic_registry = TopicRegistry(
+    refresh_interval=config.TOPIC_REGISTRY_REFRESH_INTERVAL,
+    miss_refresh_interval=config.TOPIC_REGISTRY_MISS_REFRESH_INTERVAL,
+    weights_reload_interval=config.TOPIC_WEIGHTS_RELOAD_INTERVAL,
+)
@@ -0,0 +1,168 @@
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from mongodb_odm import DESCENDING, UpdateOne
+
+from app.base import config
+
+from .models import TrendingRanking, TrendingScore
+
+logger = logging.getLogger(__name__)
+
+RANKING_NAME = "posts"
+# Fixed origin of the `rank` values, it must never change.
+RANK_EPOCH = datetime(2024, 1, 1)
+
+
+class TrendingEngine:
+    """
+    Collect the engagement events of this worker and keep the trending ranking.
+
+    Events are summed in memory, already decayed, and flushed periodically with
+    one atomic pipeline update per post, so every worker contributes to the
+    same scores. The top-K is rebuilt from the `rank` index after each flush
+    and persisted, the endpoint is served from it.
+    """
+
+    def __init__(self, half_life_hours: float, flush_interval: float, top_k: int):
+        self.half_life = half_life_hours * 60 * 60
+        self.flush_interval = flush_interval
+        self.top_k = top_k
+
+        self._lock = threading.Lock()
+        # post_id -> score at `_pending_at`
+        self._pending: Dict[Any, float] = {}
+        self._pending_at = datetime.now()
+        self._ranking: Optional[List[Any]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def _get_rank_offset(self, at: datetime) -> float:
+        return (at - RANK_EPOCH).total_seconds() / self.half_life
+
+    def record(self, post_id: Any, weight: float) -> None:
+        """Add an event, a negative weight cancels a previous one."""
+        now = datetime.now()
+        with self._lock:
+            growth = 2 ** ((now - self._pending_at).total_seconds() / self.half_life)
+            self._pending[post_id] = self._pending.get(post_id, 0) + weight * growth
+
+    def _get_update(self, post_id: Any, score: float, now: datetime) -> UpdateOne:
+        half_life_ms = self.half_life * 1000
+        elapsed_ms = {
+            "$max": [{"$subtract": [now, {"$ifNull": ["$scored_at", now]}]}, 0]
+        }
+        decayed = {
+            "$multiply": [
+                {"$ifNull": ["$score", 0]},
+                {"$pow": [0.5, {"$divide": [elapsed_ms, half_life_ms]}]},
+            ]
+        }
+        return UpdateOne(
+            {"post_id": post_id},
+            [
+                {"$set": {"score": {"$add": [decayed, score]}, "scored_at": now}},
+                {
+                    "$set": {
+                        "rank": {
+                            "$add": [
+                                {
+                                    "$log": [
+                                        {"$max": ["$score", config.TRENDING_MIN_SCORE]},
+                                        2,
+                                    ]
+                                },
+                                self._get_rank_offset(now),
+                            ]
+                        }
+                    }
+                },
+            ],
+            upsert=True,
+        )
+
+    def flush(self) -> int:
+        """Write the pending scores, return the number of updated posts."""
+        now = datetime.now()
+        with self._lock:
+            pending, pending_at = self._pending, self._pending_at
+            self._pending, self._pending_at = {}, now
+        if not pending:
+            return 0
+
+        decay = 0.5 ** ((now - pending_at).total_seconds() / self.half_life)
+        try:
+            TrendingScore.bulk_write(
+                requests=[
+                    self._get_update(post_id, score * decay, now)
+                    for post_id, score in pending.items()
+                ],
+                ordered=False,
+            )
+        except Exception:
+            # Keep the events for the next flush.
+            for post_id, score in pending.items():
+                self.record(post_id, score * decay)
+            raise
+        return len(pending)
+
+    def rebuild(self) -> List[Any]:
+        """Compute the top-K from the scores and persist it."""
+        now = datetime.now()
+        # rank - offset is log2 of the current score.
+        min_rank = self._get_rank_offset(now) + math.log2(config.TRENDING_MIN_SCORE)
+        TrendingScore.delete_many({"rank": {"$lt": min_rank}})
+
+        post_ids = [
+            obj["post_id"]
+            for obj in TrendingScore.find_raw(
+                {},
+                projection={"post_id": 1},
+                sort=[("rank", DESCENDING)],
+                limit=self.top_k,
+            )
+        ]
+        TrendingRanking.update_one(
+            {"name": RANKING_NAME},
+            {"$set": {"post_ids": post_ids, "computed_at": now}},
+            upsert=True,
+        )
+        self._ranking = post_ids
+        return post_ids
+
+    def get_ranking(self) -> List[Any]:
+        if self._ranking is None:
+            # A fresh worker serves the last persisted ranking.
+            ranking = TrendingRanking.find_one({"name": RANKING_NAME})
+            self._ranking = ranking.post_ids if ranking else []
+        return self._ranking
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="trending-engine", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+                self.rebuild()
+            except Exception as e:
+                logger.error(f"Trending engine error:{e}")
+
+
+trending_engine = TrendingEngine(
+    half_life_hours=config.TRENDING_HALF_LIFE_HOURS,
+    flush_interval=config.TRENDING_FLUSH_INTERVAL,
+    top_k=config.TRENDING_TOP_K,
+)
@@ -2,10 +2,12 @@ from datetime import datetime
 from typing import Optional
 from uuid import uuid4
 
-from mongodb_odm import ASCENDING, Document, Field, IndexModel
+from mongodb_odm import ASCENDING, BaseModel, Document, Field, IndexModel
 
+from app.base.db import WriteConcernMixin
 
-class User(Document):
+
+class User(WriteConcernMixin, Document):
     username: str = Field(...)
     full_name: str = Field(...)
     image: Optional[str] = Field(default=None)
@@ -29,3 +31,18 @@ class User(Document):
     @classmethod
     def new_random_str(cls) -> str:
         return str(uuid4())
+
+
+class UserSnapshot(BaseModel):
+    """
+    Public fields of the user embedded into the documents they wrote,
+    so that the lists don't have to load the users. Same shape as PublicUserListOut.
+    """
+
+    username: str = Field(...)
+    full_name: str = Field(...)
+    image: Optional[str] = Field(default=None)
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(username=user.username, full_name=user.full_name, image=user.image)
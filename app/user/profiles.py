@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from app.base import config
+
+from .models import User
+
+PROFILE_PROJECTION = {"username": 1, "full_name": 1, "image": 1, "updated_at": 1}
+
+Profile = Dict[str, Any]
+
+
+class ProfileCache:
+    """
+    Per worker read-through LRU of the public profiles, by `_id` and `username`.
+
+    Unknown usernames are cached too (for `negative_ttl` seconds).
+    `invalidate` only reaches the current worker, the other workers see the
+    change after `ttl` seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self._lock = threading.Lock()
+        self._by_id: "OrderedDict[Any, Tuple[float, Profile]]" = OrderedDict()
+        self._by_username: Dict[str, Tuple[float, Any]] = {}
+
+    def _set(self, profile: Profile) -> None:
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._by_id[profile["_id"]] = (expires_at, profile)
+            self._by_id.move_to_end(profile["_id"])
+            self._by_username[profile["username"]] = (expires_at, profile["_id"])
+            while len(self._by_id) > self.max_size:
+                _, (_, evicted) = self._by_id.popitem(last=False)
+                self._by_username.pop(evicted["username"], None)
+
+    def _get(self, user_id: Any) -> Optional[Profile]:
+        with self._lock:
+            value = self._by_id.get(user_id)
+            if value is None or value[0] < time.monotonic():
+                return None
+            self._by_id.move_to_end(user_id)
+            return value[1]
+
+    def get_many(self, user_ids: Iterable[Any]) -> Dict[Any, Profile]:
+        """Profiles by id, the misses are fetched with one query."""
+        profiles = {}
+        misses = set()
+        for user_id in user_ids:
+            profile = self._get(user_id)
+            if profile is None:
+                misses.add(user_id)
+            else:
+                profiles[user_id] = profile
+        if misses:
+            for profile in User.find_raw(
+                {"_id": {"$in": list(misses)}}, projection=PROFILE_PROJECTION
+            ):
+                self._set(profile)
+                profiles[profile["_id"]] = profile
+        return profiles
+
+    def get(self, user_id: Any) -> Optional[Profile]:
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many_by_usernames(self, usernames: Iterable[str]) -> Dict[str, Profile]:
+        """Profiles by username, the misses are fetched with one query."""
+        profiles = {}
+        misses = set()
+        now = time.monotonic()
+        for username in usernames:
+            with self._lock:
+                value = self._by_username.get(username)
+            if value is None or value[0] < now:
+                misses.add(username)
+                continue
+            if value[1] is None:
+                # Known to be unknown.
+                continue
+            cached = self._get(value[1])
+            if cached is not None and cached["username"] == username:
+                profiles[username] = cached
+            else:
+                misses.add(username)
+
+        if misses:
+            for profile in User.find_raw(
+                {"username": {"$in": list(misses)}}, projection=PROFILE_PROJECTION
+            ):
+                self._set(profile)
+                profiles[profile["username"]] = profile
+            with self._lock:
+                for username in misses.difference(profiles):
+                    self._by_username[username] = (now + self.negative_ttl, None)
+        return profiles
+
+    def get_by_username(self, username: str) -> Optional[Profile]:
+        return self.get_many_by_usernames([username]).get(username)
+
+    def invalidate(self, user_id: Any = None, username: Optional[str] = None) -> None:
+        with self._lock:
+            if user_id is not None:
+                value = self._by_id.pop(user_id, None)
+                if value is not None:
+                    self._by_username.pop(value[1]["username"], None)
+            if username is not None:
+                self._by_username.pop(username, None)
+
+
+profile_cache = ProfileCache(
+    max_size=config.PROFILE_CACHE_SIZE,
+    ttl=config.PROFILE_CACHE_TTL,
+    negative_ttl=config.PROFILE_CACHE_NEGATIVE_TTL,
+)
@@ -4,9 +4,17 @@ from typing import Any
 
 from flask import Blueprint, Response, g
 
+from app.base.db import DURABLE, write_concern
 from app.base.utils import parse_json, update_partially
-from app.base.utils.query import get_object_or_404
-from app.base.utils.response import ExType, custom_response, http_exception
+from app.base.utils.response import (
+    ExType,
+    custom_response,
+    http_exception,
+    make_etag,
+    not_modified_response,
+)
+from app.base.write_buffer import write_buffer
+from app.post.snapshots import enqueue_snapshot_refresh
 from app.user.auth import Auth
 from app.user.schemas import (
     ChangePasswordIn,
@@ -14,11 +22,13 @@ from app.user.schemas import (
     Registration,
     TokenIn,
     UpdateAccessTokenIn,
+    UserBatchGetIn,
     UserIn,
     UserOut,
 )
 
-from .models import User
+from .models import User, UserSnapshot
+from .profiles import profile_cache
 
 user_api = Blueprint("user_api", __name__, url_prefix="/api/v1")
 logger = logging.getLogger(__name__)
@@ -37,13 +47,16 @@ def create() -> Response:
 
     try:
         hash_password = Auth.get_password_hash(res_data.password)
-        user = User(
-            username=res_data.username,
-            full_name=res_data.full_name,
-            joining_date=datetime.now(),
-            password=hash_password,
-            random_str=User.new_random_str(),
-        ).create()
+        with write_concern(DURABLE):
+            user = User(
+                username=res_data.username,
+                full_name=res_data.full_name,
+                joining_date=datetime.now(),
+                password=hash_password,
+                random_str=User.new_random_str(),
+            ).create()
+        # The username may be cached as unknown.
+        profile_cache.invalidate(username=user.username)
     except Exception as ex:
         logger.warning(f"Raise error while creating user error:{ex}")
         raise http_exception(
@@ -65,7 +78,8 @@ def token_response(username: str, password: str) -> Any:
         )
     access_token = Auth.create_access_token(user)
     refresh_token = Auth.create_refresh_token(user)
-    user.update(raw={"$set": {"last_login": datetime.now()}})
+    # Not critical, flushed in batches by the write buffer.
+    write_buffer.set(User, user.id, {"last_login": datetime.now()})
     return {
         "token_type": "Bearer",
         "access_token": access_token,
@@ -124,8 +138,13 @@ def update_user() -> Response:
     user_data = parse_json(UserIn)
 
     user = g.user
+    old_snapshot = UserSnapshot.from_user(user)
     user = update_partially(user, user_data)
     user.update()
+    profile_cache.invalidate(user.id)
+    if UserSnapshot.from_user(user) != old_snapshot:
+        # Many documents for a prolific user, not in the request.
+        enqueue_snapshot_refresh(user.id)
     return custom_response(UserOut(**user.model_dump()).model_dump(), 200)
 
 
@@ -140,5 +159,31 @@ def logout_from_all_device() -> Response:
 
 @user_api.get("/users/<string:username>")
 def ger_user_public_profile(username: str) -> Any:
-    public_user = get_object_or_404(User, filter={"username": username})
-    return custom_response(PublicUserProfile(**public_user.model_dump()).model_dump())
+    public_user = profile_cache.get_by_username(username)
+    if public_user is None:
+        raise http_exception(
+            status=404,
+            code=ExType.OBJECT_NOT_FOUND,
+            detail="Object Not Found",
+        )
+    etag = make_etag(public_user["_id"], public_user.get("updated_at"))
+    not_modified = not_modified_response(etag)
+    if not_modified:
+        return not_modified
+    return custom_response(PublicUserProfile(**public_user).model_dump(), etag=etag)
+
+
+@user_api.post("/users:batchGet")
+def batch_get_user_public_profiles() -> Response:
+    data = parse_json(UserBatchGetIn)
+
+    profiles = profile_cache.get_many_by_usernames(data.usernames)
+    results = {
+        username: (
+            PublicUserProfile(**profiles[username]).model_dump()
+            if username in profiles
+            else None
+        )
+        for username in data.usernames
+    }
+    return custom_response({"results": results}, 200)
@@ -1,7 +1,10 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, Field
 
+# Maximum number of identifiers of the batchGet endpoints.
+BATCH_GET_MAX_SIZE = 100
+
 
 class TokenData(BaseModel):
     id: str
@@ -47,6 +50,10 @@ class PublicUserListOut(BaseModel):
     image: Optional[str] = Field(default=None)
 
 
+class UserBatchGetIn(BaseModel):
+    usernames: List[str] = Field(min_length=1, max_length=BATCH_GET_MAX_SIZE)
+
+
 class PublicUserProfile(BaseModel):
     username: str = Field(...)
     full_name: str = Field(...)
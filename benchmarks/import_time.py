@@ -0,0 +1,80 @@
+"""
+Report the import time of the worker entry point (`app.main`).
+
+Run:
+    python -m benchmarks.import_time --top 30
+
+The module is imported in a fresh interpreter with `-X importtime`, the
+database does not need to be reachable.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+ENTRY_POINT = "app.main"
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+def get_import_times(
+    module: str = ENTRY_POINT, env: Optional[Dict[str, str]] = None
+) -> List[ImportTime]:
+    """Parse the `-X importtime` output of `import <module>`, in import order."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env={**os.environ, **(env or {})},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Unable to import {module}:\n{result.stderr[-2000:]}")
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times.append(ImportTime(name.strip(), int(self_us), int(cumulative_us)))
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default=ENTRY_POINT)
+    parser.add_argument("--top", type=int, default=30)
+    args = parser.parse_args()
+
+    times = get_import_times(args.module)
+    by_module = {item.module: item for item in times}
+    total = by_module[args.module]
+    print(f"{args.module}: {total.cumulative_us / 1000:.1f} ms, {len(times)} modules")
+
+    print(f"\n{'module':<50} {'self_ms':>8} {'cumulative_ms':>14}")
+    for item in sorted(times, key=lambda t: t.cumulative_us, reverse=True)[: args.top]:
+        print(
+            f"{item.module:<50} {item.self_us / 1000:>8.1f} "
+            f"{item.cumulative_us / 1000:>14.1f}"
+        )
+
+    # First level packages, what a lazy import can save.
+    packages: Dict[str, int] = {}
+    for item in times:
+        package = item.module.split(".")[0]
+        packages[package] = packages.get(package, 0) + item.self_us
+    print(f"\n{'package':<50} {'self_ms':>8}")
+    for package, self_us in sorted(packages.items(), key=lambda p: p[1], reverse=True)[
+        : args.top
+    ]:
+        print(f"{package:<50} {self_us / 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
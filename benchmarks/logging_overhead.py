@@ -0,0 +1,114 @@
+"""
+Measure the logging overhead per request of the logging modes.
+
+Run:
+    python -m benchmarks.logging_overhead --requests 2000 --sink-delay-us 200
+
+Every request of a minimal Flask app logs `--warnings` 404 like warnings. The
+log stream sleeps `--sink-delay-us` per write to emulate a slow stdout (pipe
+read by a log shipper). The overhead is the latency above the same app with
+logging disabled. The database is not used.
+"""
+
+import argparse
+import io
+import logging
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+from flask import Flask
+
+from app.base import config
+from app.base.log import init_request_logging, setup_logging
+
+# name: config values
+MODES: Dict[str, Dict[str, Any]] = {
+    "sync-text": {"LOG_QUEUE_ENABLED": False, "LOG_FORMAT": "text"},
+    "sync-json": {"LOG_QUEUE_ENABLED": False, "LOG_FORMAT": "json"},
+    "queue-json": {"LOG_QUEUE_ENABLED": True, "LOG_FORMAT": "json"},
+}
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, delay: float) -> None:
+        super().__init__()
+        self.delay = delay
+
+    def write(self, value: str) -> int:
+        time.sleep(self.delay)
+        return len(value)
+
+
+def create_app(warnings: int) -> Flask:
+    app = Flask(__name__)
+    init_request_logging(app)
+    logger = logging.getLogger("benchmark")
+
+    @app.get("/posts/<string:slug>")
+    def get_post(slug: str) -> Any:
+        for _ in range(warnings):
+            logger.warning("404 on:%s filter:%s", "Post", {"slug": slug})
+        return {"slug": slug}
+
+    return app
+
+
+def measure(app: Flask, total: int) -> List[float]:
+    client = app.test_client()
+    latencies = []
+    for i in range(total):
+        ts = time.perf_counter()
+        client.get(f"/posts/post-{i}")
+        latencies.append(time.perf_counter() - ts)
+    return latencies
+
+
+def configure(values: Dict[str, Any], sampling: bool) -> None:
+    config.LOG_SAMPLING_ENABLED = sampling
+    for name, value in values.items():
+        setattr(config, name, value)
+    formatter = "json" if config.LOG_FORMAT == "json" else "default"
+    config.log_config["handlers"]["console"]["formatter"] = formatter
+    setup_logging()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warnings", type=int, default=5)
+    parser.add_argument("--sink-delay-us", type=float, default=200)
+    args = parser.parse_args()
+
+    out = sys.stdout
+    sys.stdout = SlowStream(args.sink_delay_us / 1_000_000)
+    try:
+        configure({"LOG_QUEUE_ENABLED": False}, sampling=False)
+        logging.getLogger().setLevel(logging.CRITICAL)
+        baseline = statistics.mean(measure(create_app(args.warnings), args.requests))
+
+        rows = []
+        for name, values in MODES.items():
+            for sampling in (False, True):
+                configure(values, sampling)
+                latencies = sorted(measure(create_app(args.warnings), args.requests))
+                rows.append(
+                    (
+                        name + ("+sampling" if sampling else ""),
+                        (statistics.mean(latencies) - baseline) * 1_000_000,
+                        latencies[int(len(latencies) * 0.99) - 1] * 1000,
+                    )
+                )
+    finally:
+        sys.stdout = out
+        logging.shutdown()
+
+    print(f"baseline (logging disabled): {baseline * 1000:.3f} ms per request")
+    print(f"{'mode':<22} {'overhead_us':>12} {'p99_ms':>8}")
+    for name, overhead_us, p99_ms in rows:
+        print(f"{name:<22} {overhead_us:>12.1f} {p99_ms:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
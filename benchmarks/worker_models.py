@@ -0,0 +1,163 @@
+"""
+Compare the throughput of the gunicorn worker models.
+
+Start MongoDB, populate the database and run:
+    python -m benchmarks.worker_models --duration 20 --concurrency 64
+
+Every worker model is started with `app/gunicorn_config.py` on a free port and
+then loaded with a read-heavy and a write-heavy request mix.
+"""
+
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from tests.data import users
+
+WORKER_MODELS: Dict[str, Dict[str, str]] = {
+    "sync": {"GUNICORN_WORKER_CLASS": "sync", "GUNICORN_THREADS": "1"},
+    "gthread": {"GUNICORN_WORKER_CLASS": "gthread", "GUNICORN_THREADS": "auto"},
+    "gevent": {"GUNICORN_WORKER_CLASS": "gevent", "GUNICORN_THREADS": "1"},
+    "eventlet": {"GUNICORN_WORKER_CLASS": "eventlet", "GUNICORN_THREADS": "1"},
+}
+
+# (read ratio, name)
+MIXES: List[Tuple[float, str]] = [(0.95, "read-heavy"), (0.5, "write-heavy")]
+
+
+def get_free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def wait_for_server(base_url: str, timeout: float = 30) -> None:
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            httpx.get(f"{base_url}/", timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start at {base_url}")
+
+
+def start_server(env_update: Dict[str, str], port: int) -> "subprocess.Popen[bytes]":
+    env = {**os.environ, "GUNICORN_WORKERS": "auto", **env_update}
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "app/gunicorn_config.py",
+            f"--bind=127.0.0.1:{port}",
+            "app.main:app",
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def prepare(client: httpx.Client) -> Tuple[Dict[str, str], List[str]]:
+    response = client.post(
+        "/api/v1/token",
+        json={"username": users[0]["username"], "password": users[0]["password"]},
+    )
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    slugs = [
+        post["slug"] for post in client.get("/api/v1/posts?limit=100").json()["results"]
+    ]
+    if not slugs:
+        raise RuntimeError("Populate the database before running the benchmark")
+    return headers, slugs
+
+
+def run_mix(
+    base_url: str, read_ratio: float, duration: float, concurrency: int
+) -> Dict[str, Any]:
+    with httpx.Client(base_url=base_url) as client:
+        headers, slugs = prepare(client)
+
+    def read(client: httpx.Client) -> httpx.Response:
+        if random.random() < 0.5:
+            return client.get("/api/v1/posts")
+        return client.get(f"/api/v1/posts/{random.choice(slugs)}")
+
+    def write(client: httpx.Client) -> httpx.Response:
+        return client.post(
+            f"/api/v1/posts/{random.choice(slugs)}/comments",
+            json={"description": "benchmark comment"},
+            headers=headers,
+        )
+
+    def user_loop(_: int) -> Tuple[List[float], int]:
+        latencies: List[float] = []
+        errors = 0
+        end = time.time() + duration
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            while time.time() < end:
+                action: Callable[[httpx.Client], httpx.Response] = (
+                    read if random.random() < read_ratio else write
+                )
+                ts = time.perf_counter()
+                response = action(client)
+                latencies.append(time.perf_counter() - ts)
+                if response.status_code >= 400:
+                    errors += 1
+        return latencies, errors
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(user_loop, range(concurrency)))
+
+    latencies = sorted(lat for result in results for lat in result[0])
+    total = len(latencies)
+    return {
+        "requests": total,
+        "errors": sum(result[1] for result in results),
+        "rps": round(total / duration, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if total else None,
+        "p99_ms": round(latencies[int(total * 0.99) - 1] * 1000, 2) if total else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--models", nargs="*", default=list(WORKER_MODELS))
+    args = parser.parse_args()
+
+    print(f"{'model':<10} {'mix':<12} {'rps':>8} {'p50_ms':>8} {'p99_ms':>8} errors")
+    for model in args.models:
+        port = get_free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(WORKER_MODELS[model], port)
+        try:
+            wait_for_server(base_url)
+            for read_ratio, mix in MIXES:
+                res = run_mix(base_url, read_ratio, args.duration, args.concurrency)
+                print(
+                    f"{model:<10} {mix:<12} {res['rps']:>8} {res['p50_ms']:>8} "
+                    f"{res['p99_ms']:>8} {res['errors']}"
+                )
+        except RuntimeError as e:
+            print(f"{model:<10} skipped: {e}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
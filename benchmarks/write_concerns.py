@@ -0,0 +1,119 @@
+"""
+Compare the latency of the login and comment writes with the write policies.
+
+Start a MongoDB replica set (`scripts/replica_set.sh`), populate the database
+and run:
+    python -m benchmarks.write_concerns --requests 500 --concurrency 16
+
+Every variant is started with `app/gunicorn_config.py` on a free port:
+- "majority": every write waits for a majority, last login written directly.
+- "policies": the relaxed policy for comments and counters, last login written
+  directly.
+- "policies+buffer": the relaxed policy and the buffered last login.
+"""
+
+import argparse
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+import httpx
+
+from benchmarks.worker_models import (
+    get_free_port,
+    prepare,
+    start_server,
+    wait_for_server,
+)
+from tests.data import users
+
+VARIANTS: Dict[str, Dict[str, str]] = {
+    "majority": {
+        "WRITE_CONCERN_POLICIES_ENABLED": "True",
+        "RELAXED_WRITE_CONCERN_W": "majority",
+        "WRITE_BUFFER_FLUSH_INTERVAL": "0",
+    },
+    "policies": {
+        "WRITE_CONCERN_POLICIES_ENABLED": "True",
+        "WRITE_BUFFER_FLUSH_INTERVAL": "0",
+    },
+    "policies+buffer": {
+        "WRITE_CONCERN_POLICIES_ENABLED": "True",
+        "WRITE_BUFFER_FLUSH_INTERVAL": "1",
+    },
+}
+
+
+def measure(
+    action: Callable[[httpx.Client], httpx.Response],
+    base_url: str,
+    total: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    def run(_: int) -> float:
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            ts = time.perf_counter()
+            action(client).raise_for_status()
+            return time.perf_counter() - ts
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(run, range(total)))
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(latencies[int(total * 0.95) - 1] * 1000, 2),
+    }
+
+
+def run_variant(base_url: str, total: int, concurrency: int) -> Dict[str, Any]:
+    with httpx.Client(base_url=base_url) as client:
+        headers, slugs = prepare(client)
+
+    def login(client: httpx.Client) -> httpx.Response:
+        user = random.choice(users)
+        return client.post(
+            "/api/v1/token",
+            json={"username": user["username"], "password": user["password"]},
+        )
+
+    def create_comment(client: httpx.Client) -> httpx.Response:
+        return client.post(
+            f"/api/v1/posts/{random.choice(slugs)}/comments",
+            json={"description": "benchmark comment"},
+            headers=headers,
+        )
+
+    return {
+        "login": measure(login, base_url, total, concurrency),
+        "create_comments": measure(create_comment, base_url, total, concurrency),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--variants", nargs="*", default=list(VARIANTS))
+    args = parser.parse_args()
+
+    print(f"{'variant':<16} {'endpoint':<16} {'p50_ms':>8} {'p95_ms':>8}")
+    for variant in args.variants:
+        port = get_free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(VARIANTS[variant], port)
+        try:
+            wait_for_server(base_url)
+            results = run_variant(base_url, args.requests, args.concurrency)
+            for endpoint, res in results.items():
+                p50, p95 = res["p50_ms"], res["p95_ms"]
+                print(f"{variant:<16} {endpoint:<16} {p50:>8} {p95:>8}")
+        except (RuntimeError, httpx.HTTPError) as e:
+            print(f"{variant:<16} skipped: {e}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,5 +2,5 @@
 
 set -x
 
-ruff app scripts --fix
-ruff format app scripts
+ruff app scripts benchmarks --fix
+ruff format app scripts benchmarks
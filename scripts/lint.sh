@@ -4,5 +4,5 @@ set -e
 set -x
 
 mypy app
-ruff app scripts
-ruff format app --check
+ruff app scripts benchmarks
+ruff format app benchmarks --check
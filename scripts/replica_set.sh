@@ -0,0 +1,26 @@
+#!/usr/bin/env bash
+# Start a 3 members replica set on this host to try the read preferences.
+# Requires mongod and mongosh, data and logs are stored in $DATA_DIR.
+
+set -e
+set -x
+
+DATA_DIR=${DATA_DIR:-/tmp/flask-blog-rs}
+PORTS="27017 27018 27019"
+
+for port in $PORTS; do
+    mkdir -p "$DATA_DIR/$port"
+    mongod --replSet rs0 --port "$port" --bind_ip localhost \
+        --dbpath "$DATA_DIR/$port" --fork --logpath "$DATA_DIR/$port.log"
+done
+
+mongosh --port 27017 --quiet --eval 'rs.initiate({
+    _id: "rs0",
+    members: [
+        {_id: 0, host: "localhost:27017", priority: 2},
+        {_id: 1, host: "localhost:27018"},
+        {_id: 2, host: "localhost:27019"},
+    ],
+})'
+
+echo 'export MONGO_URL="mongodb://localhost:27017,localhost:27018,localhost:27019/blog_db?replicaSet=rs0"'
@@ -1,5 +1,6 @@
 import logging
 import os
+import time
 from functools import lru_cache
 from typing import Any, Dict, Generator
 
@@ -7,7 +8,9 @@ import pytest
 from mongodb_odm import connect, disconnect
 
 from app.base import config
+from app.base.jobs import Job, JobStatus, run_pending
 from app.main import app as flask_app
+from app.post.topics import topic_registry
 from app.user.models import User
 
 from .data import populate_dummy_data, users
@@ -18,10 +21,16 @@ logger = logging.getLogger(__name__)
 @pytest.fixture()
 def app() -> Generator:
     flask_app.config.update({"TESTING": True})
+    # The tests log in many times, test_rate_limit enables it.
+    config.RATE_LIMIT_ENABLED = False
+    # run_jobs waits for the pending jobs.
+    config.RELATED_POSTS_DELAY = 0
     connect(config.MONGO_URL)
 
     if not User.exists({"username": users[0]["username"]}):
         populate_dummy_data(total_user=10, total_post=100)
+    # The background refresh may not have seen the topics of the dummy data.
+    topic_registry.refresh()
 
     yield flask_app
     # clean_data()
@@ -64,3 +73,13 @@ def get_header(client) -> Dict[str, Any]:
 
 def get_test_file_path() -> str:
     return os.path.join(config.BASE_DIR, "tests/files")
+
+
+def run_jobs(timeout: float = 5) -> None:
+    """Run the due jobs, some of them may be claimed by the background worker."""
+    end = time.time() + timeout
+    while time.time() < end:
+        run_pending()
+        if not Job.exists({"status": {"$in": [JobStatus.PENDING, JobStatus.RUNNING]}}):
+            return
+        time.sleep(0.1)
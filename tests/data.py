@@ -14,7 +14,11 @@ from mongodb_odm.connection import db
 from slugify import slugify
 
 from app.base.utils.decorator import timing
-from app.post.models import Comment, EmbeddedReply, Post, Reaction, Topic
+from app.post.models import Comment, Post, Reaction, Reply, Topic
+from app.post.processing import get_derived_fields
+from app.post.related import update_related_posts
+from app.post.snapshots import backfill_snapshots
+from app.post.topics import count_topic_posts
 from app.user.auth import Auth
 from app.user.models import User
 
@@ -140,9 +144,11 @@ def get_post() -> Dict[str, Any]:
     return {
         "title": title,
         "publish_at": datetime.now(),
+        "is_published": True,
         "short_description": description[:200],
         "description": description,
         "cover_image": None,
+        **get_derived_fields(description),
     }
 
 
@@ -229,30 +235,36 @@ def _create_comments(total_comment: Any) -> None:
     random.shuffle(user_ids)
 
     write_comments = []
+    write_replies = []
     for i in range(total_comment):
         post_id = post_ids[i % total_post]
         total_comment = random.randint(1, random.randint(1, random.randint(1, 100)))
         for j in range(total_comment):
+            comment_id = ObjectId()
             replies = [
-                EmbeddedReply(
-                    user_id=user_ids[(i + k) % total_user], description=fake.text()
+                Reply(
+                    comment_id=comment_id,
+                    post_id=post_id,
+                    user_id=user_ids[(i + k) % total_user],
+                    description=fake.text(),
                 )
                 for k in range(random.randint(1, random.randint(1, 20)))
             ]
+            for reply in replies:
+                write_replies.append(InsertOne(Reply.to_mongo(reply)))
+            comment = Comment(
+                user_id=user_ids[(i + j) % total_user],
+                post_id=post_id,
+                description=fake.text(),
+                total_reply=len(replies),
+            )
             write_comments.append(
-                InsertOne(
-                    Comment.to_mongo(
-                        Comment(
-                            user_id=user_ids[(i + j) % total_user],
-                            post_id=post_id,
-                            description=fake.text(),
-                            replies=replies,
-                        )
-                    )
-                )
+                InsertOne({"_id": comment_id, **Comment.to_mongo(comment)})
             )
     if write_comments:
         Comment.bulk_write(requests=write_comments)
+    if write_replies:
+        Reply.bulk_write(requests=write_replies)
 
 
 @timing
@@ -278,6 +290,9 @@ def populate_dummy_data(total_user: int = 100, total_post: int = 100) -> None:
     create_posts(total_post)
     create_reactions()
     create_comments()
+    backfill_snapshots()
+    count_topic_posts()
+    update_related_posts()
     log.info("Data insertion complete")
 
 
@@ -1,3 +1,21 @@
+import gzip
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+from app.base import config, health
+from app.base.db import DURABLE, RELAXED, read_own_writes, read_policy, write_concern
+from app.base.log import DroppingQueueHandler, JsonFormatter, SamplingFilter
+from app.base.middleware import init_proxy_fix
+from app.base.ratelimit import Limit, RateLimiter, TokenBucketTable, rate_limiter
+from app.base.singleflight import SingleFlight
+from app.base.write_buffer import WriteBuffer
+from app.post.models import Post
+from app.user.models import User
+
 from .conftest import get_header, get_test_file_path
 
 
@@ -6,6 +24,60 @@ def test_home(client):
     assert response.status_code == 200
 
 
+def test_health(client):
+    response = client.get("/health/live")
+    assert response.status_code == 200
+
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json["db_reachable"] is True
+    assert response.json["last_success_ping_age"] is not None
+    assert response.json["stale"] is False
+
+
+def test_health_status_does_not_wait_on_ping(monkeypatch):
+    release = threading.Event()
+
+    class BlockedClient:
+        class admin:
+            @staticmethod
+            def command(name):
+                release.wait(5)
+
+    monkeypatch.setattr(health, "get_client", lambda: BlockedClient)
+    monitor = health.HealthMonitor(interval=60, max_ping_age=0.01, ping_timeout=1)
+    try:
+        monitor.start()
+        time.sleep(0.05)
+
+        start = time.monotonic()
+        status = monitor.status()
+        assert time.monotonic() - start < 0.1
+        assert status["db_reachable"] is None
+        assert status["stale"] is True
+        assert monitor.is_ready(status) is False
+    finally:
+        release.set()
+
+    for _ in range(100):
+        if monitor.last_ping_at is not None:
+            break
+        time.sleep(0.01)
+    assert monitor.status()["db_reachable"] is True
+
+
+def test_response_compression(client):
+    response = client.get(
+        "/api/v1/posts?limit=100", headers={"Accept-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "results" in json.loads(gzip.decompress(response.data))
+
+    response = client.get("/")
+    assert "Content-Encoding" not in response.headers
+
+
 def test_file_upload(client):
     image_path = f"{get_test_file_path()}/atom.jpg"
 
@@ -18,3 +90,195 @@ def test_file_upload(client):
         )
     assert response.status_code == 201
     assert response.json.get("image_path") is not None
+
+
+def test_read_policy(client):
+    @read_policy("secondaryPreferred", "local")
+    def view():
+        collection = Post._get_collection()
+        read_own_writes()
+        return collection, Post._get_collection()
+
+    collection, own_writes_collection = view()
+    assert collection.read_preference.mongos_mode == "secondaryPreferred"
+    assert collection.read_concern.level == "local"
+    assert own_writes_collection.read_preference.mongos_mode == "primary"
+    # Outside of the view
+    assert Post._get_collection().read_preference.mongos_mode == "primary"
+
+
+def test_write_concern(client):
+    with write_concern(DURABLE):
+        assert Post._get_collection().write_concern.document == {
+            "w": "majority",
+            "j": True,
+        }
+    with write_concern(RELAXED):
+        assert User._get_collection().write_concern.document == {"w": 1, "j": False}
+
+
+def test_write_buffer(client):
+    user = User.get({})
+    buffer = WriteBuffer(flush_interval=60, max_size=10)
+    buffer.set(User, user.id, {"full_name": "Old Name"})
+    buffer.set(User, user.id, {"full_name": "Buffered Name"})
+    assert User.get({"_id": user.id}).full_name == user.full_name
+
+    assert buffer.flush() == 1
+    assert User.get({"_id": user.id}).full_name == "Buffered Name"
+    User.update_one({"_id": user.id}, {"$set": {"full_name": user.full_name}})
+
+
+def test_single_flight(client):
+    flight = SingleFlight("test", ttl=60, max_size=10)
+    started = threading.Event()
+
+    def load():
+        started.set()
+        time.sleep(0.2)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(flight.do("key", load)))
+        for _ in range(5)
+    ]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["value"] * 5
+    assert flight.do("key", load) == "value"
+    metrics = flight.get_metrics()
+    assert metrics["loads"] == 1
+    assert metrics["coalesced"] == 4
+    assert metrics["cache_hits"] == 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.json["single_flight"]["test"]["loads"] == 1
+    assert response.json["log"]["dropped"] >= 0
+
+
+def test_rate_limit(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limiter, "limits", {"user_api.login": Limit(2, 60)})
+    monkeypatch.setattr(
+        rate_limiter, "table", TokenBucketTable(str(tmp_path / "rate-limit"), 64)
+    )
+
+    payload = {"username": "unknown-user", "password": "password"}
+    for remaining in (1, 0):
+        response = client.post("/api/v1/token", json=payload)
+        assert response.status_code == 401
+        assert response.headers["RateLimit-Limit"] == "2"
+        assert response.headers["RateLimit-Remaining"] == str(remaining)
+
+    response = client.post("/api/v1/token", json=payload)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+
+    # Other endpoints are not limited
+    response = client.get("/api/v1/posts")
+    assert "RateLimit-Limit" not in response.headers
+
+
+def test_rate_limit_behind_proxy(app, client, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(rate_limiter, "limits", {"user_api.login": Limit(1, 60)})
+    monkeypatch.setattr(
+        rate_limiter, "table", TokenBucketTable(str(tmp_path / "rate-limit"), 64)
+    )
+    monkeypatch.setattr(app, "wsgi_app", app.wsgi_app)
+    init_proxy_fix(app, 1)
+
+    payload = {"username": "unknown-user", "password": "password"}
+    headers = {"X-Forwarded-For": "203.0.113.1"}
+    response = client.post("/api/v1/token", json=payload, headers=headers)
+    assert response.status_code == 401
+    response = client.post("/api/v1/token", json=payload, headers=headers)
+    assert response.status_code == 429
+
+    # Another client behind the same proxy has its own bucket.
+    headers = {"X-Forwarded-For": "203.0.113.2"}
+    response = client.post("/api/v1/token", json=payload, headers=headers)
+    assert response.status_code == 401
+
+
+def test_rate_limit_blueprint_bucket(tmp_path):
+    limit = Limit(30, 60)
+    limiter = RateLimiter(
+        TokenBucketTable(str(tmp_path / "rate-limit"), 64),
+        {"post.comments": limit, "user_api.login": Limit(10, 60)},
+    )
+    # The routes of the blueprint share the bucket of the blueprint limit.
+    assert limiter.get_limit("post.comments.create_comments") == (
+        "post.comments",
+        limit,
+    )
+    assert limiter.get_limit("post.comments.create_replies") == (
+        "post.comments",
+        limit,
+    )
+    assert limiter.get_limit("user_api.login")[0] == "user_api.login"
+    assert limiter.get_limit("post.posts.get_posts") is None
+
+
+def test_token_bucket_table(tmp_path):
+    path = str(tmp_path / "rate-limit")
+    limit = Limit(2, 10)
+    table, other_worker_table = TokenBucketTable(path, 64), TokenBucketTable(path, 64)
+
+    assert table.consume("key", limit, now=100).allowed
+    assert other_worker_table.consume("key", limit, now=100).allowed
+    decision = table.consume("key", limit, now=100)
+    assert not decision.allowed
+    assert decision.retry_after == 5
+    # One token every 5 seconds
+    assert other_worker_table.consume("key", limit, now=105).allowed
+    assert table.consume("other-key", limit, now=105).remaining == 1
+
+
+def test_request_id(client):
+    response = client.get("/", headers={"X-Request-ID": "request-1"})
+    assert response.headers["X-Request-ID"] == "request-1"
+
+    response = client.get("/")
+    assert len(response.headers["X-Request-ID"]) == 32
+
+
+def test_log_sampling():
+    sampling = SamplingFilter(burst=2, window=60, rate=10)
+
+    def make_record(level):
+        return logging.LogRecord("app", level, __file__, 1, "404", None, None)
+
+    kept = [sampling.filter(make_record(logging.WARNING)) for _ in range(30)]
+    assert sum(kept) == 2 + 3
+    record = make_record(logging.WARNING)
+    for _ in range(9):
+        sampling.filter(record)
+    assert sampling.filter(record) and record.sampled_out == 9
+    # Errors are never sampled
+    assert all(sampling.filter(make_record(logging.ERROR)) for _ in range(30))
+
+
+def test_log_queue_handler():
+    log_queue = queue.Queue(1)
+    handler = DroppingQueueHandler(log_queue)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord(
+            "app", logging.ERROR, __file__, 1, "Failed %s", ("job",), sys.exc_info()
+        )
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
+
+    data = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert data["message"] == "Failed job"
+    assert "ValueError: boom" in data["exc_info"]
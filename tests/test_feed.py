@@ -0,0 +1,107 @@
+from faker import Faker
+
+from app.post.models import Topic
+
+from .conftest import get_header, run_jobs
+from .data import users
+
+fake = Faker()
+
+
+def get_other_user_header(client):
+    response = client.post(
+        "/api/v1/token",
+        json={"username": users[1]["username"], "password": users[1]["password"]},
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json['access_token']}"}
+
+
+def test_follow_author_timeline(client):
+    author = users[1]["username"]
+    response = client.post(f"/api/v1/users/{author}/follow")
+    assert response.status_code == 401
+
+    response = client.post(f"/api/v1/users/{author}/follow", headers=get_header(client))
+    assert response.status_code == 201
+
+    response = client.post(
+        "/api/v1/posts",
+        json={"title": fake.sentence(), "publish_now": True},
+        headers=get_other_user_header(client),
+    )
+    assert response.status_code == 201
+    slug = response.json["slug"]
+    run_jobs()
+
+    response = client.get("/api/v1/timeline", headers=get_header(client))
+    assert response.status_code == 200
+    assert slug in [post["slug"] for post in response.json["results"]]
+
+    response = client.delete(
+        f"/api/v1/users/{author}/follow", headers=get_header(client)
+    )
+    assert response.status_code == 200
+
+
+def test_timeline_pagination(client):
+    author = users[1]["username"]
+    response = client.post(f"/api/v1/users/{author}/follow", headers=get_header(client))
+    assert response.status_code == 201
+
+    slugs = []
+    for _ in range(3):
+        response = client.post(
+            "/api/v1/posts",
+            json={"title": fake.sentence(), "publish_now": True},
+            headers=get_other_user_header(client),
+        )
+        assert response.status_code == 201
+        slugs.append(response.json["slug"])
+    run_jobs()
+
+    response = client.get("/api/v1/timeline?limit=2", headers=get_header(client))
+    assert response.status_code == 200
+    first_page = [post["slug"] for post in response.json["results"]]
+    assert first_page == [slugs[2], slugs[1]]
+    assert response.json["before"] is None
+
+    response = client.get(
+        f"/api/v1/timeline?limit=2&after={response.json['after']}",
+        headers=get_header(client),
+    )
+    assert response.status_code == 200
+    assert response.json["results"][0]["slug"] == slugs[0]
+
+    response = client.get(
+        f"/api/v1/timeline?limit=2&before={response.json['before']}",
+        headers=get_header(client),
+    )
+    assert response.status_code == 200
+    assert [post["slug"] for post in response.json["results"]] == first_page
+
+    response = client.get("/api/v1/timeline?after=invalid", headers=get_header(client))
+    assert response.status_code == 400
+
+    response = client.delete(
+        f"/api/v1/users/{author}/follow", headers=get_header(client)
+    )
+    assert response.status_code == 200
+
+
+def test_follow_topic(client):
+    topic = Topic.get({})
+    response = client.post(
+        f"/api/v1/topics/{topic.slug}/follow", headers=get_header(client)
+    )
+    assert response.status_code == 201
+
+    response = client.delete(
+        f"/api/v1/topics/{topic.slug}/follow", headers=get_header(client)
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        "/api/v1/topics/unknown-topic-slug/follow", headers=get_header(client)
+    )
+    assert response.status_code == 404
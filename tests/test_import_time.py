@@ -0,0 +1,23 @@
+import os
+
+from benchmarks.import_time import ENTRY_POINT, get_import_times
+
+# Worker startup budget of `import app.main`, generous to absorb slow runners.
+IMPORT_TIME_BUDGET_MS = int(os.environ.get("IMPORT_TIME_BUDGET_MS", 1500))
+
+# Only needed by the CLI or the tests, never by a worker.
+LAZY_MODULES = ["typer", "faker", "tests", "pydantic.v1"]
+
+
+def test_worker_import_time():
+    times = get_import_times(ENTRY_POINT)
+    modules = {item.module: item for item in times}
+
+    for module in LAZY_MODULES:
+        assert module not in modules, f"{module} is imported by {ENTRY_POINT}"
+
+    total_ms = modules[ENTRY_POINT].cumulative_us / 1000
+    assert total_ms < IMPORT_TIME_BUDGET_MS, (
+        f"import {ENTRY_POINT} took {total_ms:.0f} ms, "
+        f"budget {IMPORT_TIME_BUDGET_MS} ms, see `python -m benchmarks.import_time`"
+    )
@@ -1,18 +1,26 @@
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from typing import Tuple
 
+from bson import ObjectId
 from faker import Faker
 
-from app.post.models import Comment, EmbeddedReply, Post, Reaction, Topic
+from app.post.models import Comment, Post, Reaction, Reply, Topic
+from app.post.related import compute_related, update_related_posts
+from app.post.routers.posts import invalidate_post_details
+from app.post.scheduler import publish_due_posts
+from app.post.search import SearchIndex, get_term_frequencies, search_index
+from app.post.topics import topic_registry
+from app.post.trending import trending_engine
 from app.user.models import User
 
-from .conftest import get_header, get_user
+from .conftest import get_header, get_user, run_jobs
 
 fake = Faker()
 
 
 def get_published_filter():
-    return {"publish_at": {"$ne": None, "$lte": datetime.now()}}
+    return {"is_published": True}
 
 
 def test_get_topics(client):
@@ -25,6 +33,40 @@ def test_get_topics(client):
     assert response.status_code == 200
 
 
+def test_suggest_topics(client):
+    topic = Topic.get({})
+    prefix = topic.name[:2]
+
+    response = client.get(f"/api/v1/topics/suggest?prefix={prefix}")
+    assert response.status_code == 200
+    slugs = [obj["slug"] for obj in response.json["results"]]
+    assert len(slugs) <= 10
+    for obj in response.json["results"]:
+        assert any(
+            word.startswith(prefix.casefold())
+            for word in obj["name"].casefold().split()
+        )
+
+    response = client.get(f"/api/v1/topics/suggest?prefix={topic.name}&limit=50")
+    assert topic.slug in [obj["slug"] for obj in response.json["results"]]
+
+    response = client.get("/api/v1/topics/suggest?prefix=")
+    assert response.json["results"] == []
+
+
+def test_topic_registry_miss(client):
+    # Created by another worker, unknown to the registry of this one.
+    name = fake.word() + fake.word()
+    topic = Topic(name=name, slug=f"{name}-other-worker").create()
+
+    assert [entry.id for entry in topic_registry.get_by_slugs([topic.slug])] == [
+        topic.id
+    ]
+    assert [entry.slug for entry in topic_registry.get_by_ids([topic.id])] == [
+        topic.slug
+    ]
+
+
 def test_create_topics(client):
     payload = {"name": fake.word()}
 
@@ -51,6 +93,60 @@ def test_get_posts(client):
     assert response.status_code == 200
 
 
+def test_get_posts_by_topic(client):
+    post = Post.get({**get_published_filter(), "topic_ids": {"$ne": []}})
+    topic = Topic.get({"_id": post.topic_ids[0]})
+
+    response = client.get(f"/api/v1/posts?topics={topic.slug}&limit=100")
+    assert response.status_code == 200
+    assert len(response.json["results"]) > 0
+
+    response = client.get(f"/api/v1/posts/{post.slug}")
+    assert response.status_code == 200
+    assert topic.slug in [topic["slug"] for topic in response.json["topics"]]
+
+
+def test_get_posts_pagination(client):
+    response = client.get("/api/v1/posts?sort=total_reaction&limit=2")
+    assert response.status_code == 200
+    first_page = response.json
+    assert first_page["before"] is None
+    reactions = [post["total_reaction"] for post in first_page["results"]]
+    assert reactions == sorted(reactions, reverse=True)
+
+    response = client.get(
+        f"/api/v1/posts?sort=total_reaction&limit=2&after={first_page['after']}"
+    )
+    assert response.status_code == 200
+    second_page = response.json
+    assert second_page["results"][0]["total_reaction"] <= reactions[-1]
+
+    response = client.get(
+        f"/api/v1/posts?sort=total_reaction&limit=2&before={second_page['before']}"
+    )
+    assert response.status_code == 200
+    assert response.json["results"] == first_page["results"]
+    assert response.json["before"] is None
+
+    response = client.get("/api/v1/posts?sort=title")
+    assert response.status_code == 400
+    response = client.get("/api/v1/posts?after=invalid")
+    assert response.status_code == 400
+
+
+def test_get_posts_total(client):
+    total = None
+    # The total is counted in the background, None until the first count is done.
+    for _ in range(50):
+        response = client.get("/api/v1/posts?total=true")
+        assert response.status_code == 200
+        total = response.json["total"]
+        if total is not None:
+            break
+        time.sleep(0.1)
+    assert total == Post.count_documents(get_published_filter())
+
+
 def test_get_user_posts(client) -> None:
     user = get_user()
     response = client.get(f"/api/v1/posts?username={user.username}")
@@ -86,12 +182,69 @@ def test_create_posts(client):
     assert response.status_code == 201
 
 
+def test_create_posts_derived_fields(client):
+    payload = {
+        "title": fake.sentence(),
+        "publish_now": True,
+        "description": "First <b>paragraph</b>\n\nSecond paragraph",
+    }
+    response = client.post("/api/v1/posts", json=payload, headers=get_header(client))
+    assert response.status_code == 201
+
+    response = client.get(f"/api/v1/posts/{response.json['slug']}")
+    assert response.status_code == 200
+    assert response.json["word_count"] == 4
+    assert response.json["reading_time"] == 1
+    assert response.json["description_html"] == (
+        "<p>First &lt;b&gt;paragraph&lt;/b&gt;</p>\n<p>Second paragraph</p>"
+    )
+
+
+def test_scheduled_post_publication(client):
+    payload = {
+        "title": fake.sentence(),
+        "publish_at": (datetime.now() + timedelta(days=1)).isoformat(),
+        "description": fake.text(),
+    }
+    response = client.post("/api/v1/posts", json=payload, headers=get_header(client))
+    assert response.status_code == 201
+    slug = response.json["slug"]
+
+    response = client.get(f"/api/v1/posts/{slug}")
+    assert response.status_code == 404
+
+    Post.update_one({"slug": slug}, {"$set": {"publish_at": datetime.now()}})
+    assert publish_due_posts() >= 1
+
+    response = client.get(f"/api/v1/posts/{slug}")
+    assert response.status_code == 200
+
+
 def test_get_post_details(client):
     post = Post.get(get_published_filter())
     response = client.get(f"/api/v1/posts/{post.slug}")
     assert response.status_code == 200
 
 
+def test_get_post_details_not_modified(client):
+    post = Post.get(get_published_filter())
+    response = client.get(f"/api/v1/posts/{post.slug}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/api/v1/posts/{post.slug}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    # A new reaction changes the representation
+    Post.update_one({"_id": post.id}, {"$inc": {"total_reaction": 1}})
+    # Skip the micro-cache window of the post.
+    invalidate_post_details(post.slug)
+    response = client.get(f"/api/v1/posts/{post.slug}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
 def test_update_post(client):
     user = get_user()
     post = Post.get({"author_id": user.id})
@@ -121,6 +274,12 @@ def test_delete_post(client):
     post = Post.get({"author_id": user.id})
     response = client.delete(f"/api/v1/posts/{post.slug}", headers=get_header(client))
     assert response.status_code == 200
+    assert Post.exists({"_id": post.id}) is False
+
+    # Comments and reactions are deleted by the background job
+    run_jobs()
+    assert Comment.exists({"post_id": post.id}) is False
+    assert Reaction.exists({"post_id": post.id}) is False
 
     # Try to delete others post
     post = Post.get({"author_id": {"$ne": user.id}})
@@ -135,6 +294,30 @@ def test_get_comments(client):
     assert response.status_code == 200
 
 
+def test_get_comments_not_modified(client):
+    post = Post.get_random_one(get_published_filter())
+
+    response = client.get(f"/api/v1/posts/{post.slug}/comments")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        f"/api/v1/posts/{post.slug}/comments", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    response = client.post(
+        f"/api/v1/posts/{post.slug}/comments",
+        json={"description": fake.text()},
+        headers=get_header(client),
+    )
+    assert response.status_code == 201
+    response = client.get(
+        f"/api/v1/posts/{post.slug}/comments", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+
+
 def test_create_comment_on_any_post(client):
     user = get_user()
     post = Post.get_random_one({"author_id": user.id, **get_published_filter()})
@@ -219,24 +402,36 @@ def test_create_replies(client):
     assert response.status_code == 201
 
 
-def get_my_reply(user: User) -> Tuple[Comment, EmbeddedReply]:
-    comment = Comment.get({"replies.user_id": user.id})
-    reply: EmbeddedReply
-    for reply in comment.replies:
-        if reply.user_id == user.id:
-            reply = reply
-            return comment, reply
-    raise Exception("Reply not found")
+def get_my_reply(user: User) -> Tuple[Comment, Reply]:
+    reply = Reply.get({"user_id": user.id})
+    return Comment.get({"_id": reply.comment_id}), reply
 
 
-def get_others_reply(user: User) -> Tuple[Comment, EmbeddedReply]:
-    comment = Comment.get({"replies.user_id": {"$ne": user.id}})
-    reply: EmbeddedReply
-    for reply in comment.replies:
-        if reply.user_id != user.id:
-            reply = reply
-            return comment, reply
-    raise Exception("Reply not found")
+def get_others_reply(user: User) -> Tuple[Comment, Reply]:
+    reply = Reply.get({"user_id": {"$ne": user.id}})
+    return Comment.get({"_id": reply.comment_id}), reply
+
+
+def test_get_replies(client):
+    comment = Comment.get({"total_reply": {"$gt": 1}})
+    post = Post.get({"_id": comment.post_id})
+
+    response = client.get(f"/api/v1/posts/{post.slug}/comments/{comment.id}/replies")
+    assert response.status_code == 200
+    assert len(response.json["results"]) == min(comment.total_reply, 20)
+
+    response = client.get(
+        f"/api/v1/posts/{post.slug}/comments/{comment.id}/replies?limit=1"
+    )
+    assert response.status_code == 200
+    first_id = response.json["results"][0]["id"]
+
+    response = client.get(
+        f"/api/v1/posts/{post.slug}/comments/{comment.id}/replies"
+        f"?limit=1&after={response.json['after']}"
+    )
+    assert response.status_code == 200
+    assert response.json["results"][0]["id"] != first_id
 
 
 def test_update_replies(client):
@@ -305,3 +500,197 @@ def test_reactions_auth(client):
 
     response = client.delete(f"/api/v1/posts/{post.slug}/reactions")
     assert response.status_code == 401
+
+
+def test_get_trending_posts(client):
+    post = Post.get(get_published_filter())
+    response = client.post(
+        f"/api/v1/posts/{post.slug}/comments",
+        json={"description": fake.sentence()},
+        headers=get_header(client),
+    )
+    assert response.status_code == 201
+
+    trending_engine.flush()
+    trending_engine.rebuild()
+
+    response = client.get("/api/v1/posts/trending")
+    assert response.status_code == 200
+    assert post.slug in [obj["slug"] for obj in response.json["results"]]
+
+
+def test_search_index(tmp_path):
+    path = str(tmp_path / "search-index")
+    now = datetime(2024, 1, 1)
+    flask, mongodb, cooking = (
+        {"_id": ObjectId(), "title": title, "description": description}
+        for title, description in (
+            ("Flask tutorial", "Write an API with Flask and MongoDB"),
+            ("MongoDB indexes", "Compound indexes, also used by Flask apps"),
+            ("Cooking", "Pasta"),
+        )
+    )
+    index = SearchIndex(path, refresh_interval=60, merge_threshold=100)
+    posts = [{**post, "updated_at": now} for post in (flask, mongodb)]
+    assert index.rebuild(posts) == 2
+
+    hits = index.search("flask", 10)
+    assert [hit.id for hit in hits] == [flask["_id"], mongodb["_id"]]
+    # Cursor paging
+    page = index.search("flask", 1, after=(hits[0].score, hits[0].id))
+    assert [hit.id for hit in page] == [mongodb["_id"]]
+
+    index.add(cooking["_id"], now, get_term_frequencies(cooking))
+    assert [hit.id for hit in index.search("pasta", 10)] == [cooking["_id"]]
+    updated = {**mongodb, "title": "Flask flask flask"}
+    assert index.add(updated["_id"], now + timedelta(1), get_term_frequencies(updated))
+    assert index.search("flask", 10)[0].id == mongodb["_id"]
+    index.remove(flask["_id"])
+    assert [hit.id for hit in index.search("flask", 10)] == [mongodb["_id"]]
+
+    index.merge()
+    other_worker_index = SearchIndex(path, refresh_interval=60, merge_threshold=100)
+    assert other_worker_index.load()
+    for query in ("flask", "pasta", "api"):
+        assert other_worker_index.search(query, 10) == index.search(query, 10)
+
+
+def test_search_posts(client):
+    post = Post.get(get_published_filter())
+    search_index.rebuild()
+
+    response = client.get(f"/api/v1/search?q={post.title}&limit=50")
+    assert response.status_code == 200
+    assert post.slug in [obj["slug"] for obj in response.json["results"]]
+
+    response = client.get(f"/api/v1/search?q={post.title}&limit=1")
+    assert len(response.json["results"]) == 1
+    after = response.json["after"]
+    if after:
+        response = client.get(f"/api/v1/search?q={post.title}&limit=1&after={after}")
+        assert response.status_code == 200
+
+    response = client.get("/api/v1/search?q=abc&after=invalid")
+    assert response.status_code == 400
+
+
+def test_compute_related():
+    post_topics = [["flask", "python"], ["flask", "python"], ["python"], ["go"], []]
+    for similarity in ("cosine", "jaccard"):
+        scores = compute_related(
+            post_topics, targets=[0, 3, 4], k=2, similarity=similarity, batch_size=2
+        )
+        assert [j for _, j in scores.by_target[0]] == [1, 2]
+        assert scores.by_target[3] == scores.by_target[4] == []
+        # The other posts may get the targets
+        assert [i for _, i in scores.by_post[1]] == [0]
+        assert 3 not in scores.by_post and 4 not in scores.by_post
+
+
+def test_related_posts(client):
+    topics = [fake.word() + fake.word() for _ in range(3)]
+    slugs = []
+    for post_topics in (topics, topics[:2], topics[2:]):
+        payload = {"title": fake.sentence(), "publish_now": True, "topics": post_topics}
+        response = client.post(
+            "/api/v1/posts", json=payload, headers=get_header(client)
+        )
+        assert response.status_code == 201
+        slugs.append(response.json["slug"])
+    run_jobs()
+    update_related_posts()
+
+    related = []
+    for slug in slugs:
+        invalidate_post_details(slug)
+        response = client.get(f"/api/v1/posts/{slug}")
+        assert response.status_code == 200
+        related.append([obj["slug"] for obj in response.json["related_posts"]])
+    assert related[0][:2] == [slugs[1], slugs[2]]
+    assert related[1][0] == slugs[0]
+    assert related[2][0] == slugs[0]
+
+
+def test_related_posts_refresh(client):
+    topic = fake.word() + fake.word()
+    slugs = []
+    for _ in range(2):
+        payload = {"title": fake.sentence(), "publish_now": True, "topics": [topic]}
+        response = client.post(
+            "/api/v1/posts", json=payload, headers=get_header(client)
+        )
+        assert response.status_code == 201
+        slugs.append(response.json["slug"])
+    run_jobs()
+    update_related_posts()
+
+    def get_related(etag: str = "") -> Tuple[int, str, list]:
+        invalidate_post_details(slugs[0])
+        response = client.get(
+            f"/api/v1/posts/{slugs[0]}", headers={"If-None-Match": etag}
+        )
+        related = response.json["related_posts"] if response.json else []
+        return response.status_code, response.headers["ETag"], related
+
+    _, etag, related = get_related()
+    assert related[0]["slug"] == slugs[1]
+
+    # Renamed
+    response = client.patch(
+        f"/api/v1/posts/{slugs[1]}",
+        json={"title": "Renamed"},
+        headers=get_header(client),
+    )
+    assert response.status_code == 200
+    run_jobs()
+    status_code, etag, related = get_related(etag)
+    assert status_code == 200
+    assert related[0]["title"] == "Renamed"
+
+    # Deleted
+    response = client.delete(f"/api/v1/posts/{slugs[1]}", headers=get_header(client))
+    assert response.status_code == 200
+    run_jobs()
+    status_code, _, related = get_related(etag)
+    assert status_code == 200
+    assert slugs[1] not in [obj["slug"] for obj in related]
+
+
+def test_batch_get_posts(client):
+    posts = list(Post.find(get_published_filter(), limit=3))
+    slugs = [post.slug for post in posts] + ["unknown-slug"]
+
+    response = client.post("/api/v1/posts:batchGet", json={"slugs": slugs})
+    assert response.status_code == 200
+    results = response.json["results"]
+    for post in posts:
+        assert results[post.slug]["title"] == post.title
+    assert results["unknown-slug"] is None
+
+    response = client.post("/api/v1/posts:batchGet", json={"slugs": []})
+    assert response.status_code == 422
+
+
+def test_sparse_fieldsets(client):
+    response = client.get("/api/v1/posts?fields=title,slug")
+    assert response.status_code == 200
+    for obj in response.json["results"]:
+        assert set(obj) == {"title", "slug"}
+
+    post = Post.get(get_published_filter())
+    response = client.get(f"/api/v1/posts/{post.slug}?fields=title,author")
+    assert response.status_code == 200
+    assert set(response.json) == {"title", "author"}
+
+    response = client.get(f"/api/v1/posts/{post.slug}/comments?fields=id,description")
+    assert response.status_code == 200
+    for obj in response.json["results"]:
+        assert set(obj) == {"id", "description"}
+
+    response = client.get("/api/v1/topics?fields=name")
+    assert response.status_code == 200
+    for obj in response.json["results"]:
+        assert set(obj) == {"name"}
+
+    response = client.get("/api/v1/posts?fields=title,password")
+    assert response.status_code == 400
@@ -1,8 +1,10 @@
 from datetime import datetime, timedelta
 
+from app.post.models import Comment, Post
 from app.user.auth import Auth
 from app.user.models import User
-from tests.conftest import get_header, get_user
+from app.user.profiles import profile_cache
+from tests.conftest import get_header, get_user, run_jobs
 
 from .data import users
 
@@ -92,6 +94,64 @@ def test_update_user(client):
     assert response.json["username"] == users[0]["username"]
 
 
+def test_update_user_refresh_snapshots(client):
+    user = get_user()
+    new_full_name = "Snapshot Name"
+    response = client.patch(
+        "/api/v1/update-me",
+        json={"full_name": new_full_name},
+        headers=get_header(client),
+    )
+    assert response.status_code == 200
+    run_jobs()
+
+    post = Post.get({"author_id": user.id})
+    assert post.author_snapshot.full_name == new_full_name
+
+    response = client.get(
+        f"/api/v1/posts?username={user.username}", headers=get_header(client)
+    )
+    assert response.status_code == 200
+    for post in response.json["results"]:
+        assert post["author"]["full_name"] == new_full_name
+
+
+def test_update_user_refresh_comment_etag(client):
+    user = get_user()
+    other = User.get({"_id": {"$ne": user.id}})
+    post = Post.get({"is_published": True})
+    # The newest comment of the post, on the first page, with a reply of the user.
+    comment = Comment(post_id=post.id, user_id=other.id, description="Comment")
+    comment.create()
+    response = client.post(
+        f"/api/v1/posts/{post.slug}/comments/{comment.id}/replies",
+        json={"description": "Reply"},
+        headers=get_header(client),
+    )
+    assert response.status_code == 201
+
+    response = client.get(f"/api/v1/posts/{post.slug}/comments")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+
+    new_full_name = "Reply Snapshot Name"
+    response = client.patch(
+        "/api/v1/update-me",
+        json={"full_name": new_full_name},
+        headers=get_header(client),
+    )
+    assert response.status_code == 200
+    run_jobs()
+
+    response = client.get(
+        f"/api/v1/posts/{post.slug}/comments", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    result = response.json["results"][0]
+    assert result["id"] == str(comment.id)
+    assert result["replies"][0]["user"]["full_name"] == new_full_name
+
+
 def test_logout_from_all_device(client):
     response = client.post(
         "/api/v1/token",
@@ -182,3 +242,48 @@ def test_user_public_profile(client) -> None:
 
     assert response.status_code == 200
     assert response.json.get("username") == user.username, "'username' does not match"
+
+
+def test_user_public_profile_not_modified(client) -> None:
+    user = get_user()
+    response = client.get(f"/api/v1/users/{user.username}")
+    assert response.status_code == 200
+
+    response = client.get(
+        f"/api/v1/users/{user.username}",
+        headers={"If-None-Match": response.headers["ETag"]},
+    )
+    assert response.status_code == 304
+
+
+def test_user_public_profile_cache(client) -> None:
+    user = get_user()
+    response = client.get(f"/api/v1/users/{user.username}")
+    assert response.status_code == 200
+
+    response = client.patch(
+        "/api/v1/update-me",
+        json={"full_name": "Cached Name"},
+        headers=get_header(client),
+    )
+    assert response.status_code == 200
+
+    # Invalidated by the update
+    response = client.get(f"/api/v1/users/{user.username}")
+    assert response.status_code == 200
+    assert response.json["full_name"] == "Cached Name"
+
+    response = client.get("/api/v1/users/unknown-username")
+    assert response.status_code == 404
+    assert profile_cache.get_by_username("unknown-username") is None
+
+
+def test_batch_get_user_public_profiles(client) -> None:
+    user = get_user()
+    response = client.post(
+        "/api/v1/users:batchGet",
+        json={"usernames": [user.username, "unknown-username"]},
+    )
+    assert response.status_code == 200
+    assert response.json["results"][user.username]["username"] == user.username
+    assert response.json["results"]["unknown-username"] is None